@@ -1,10 +1,25 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
-import io
 import numpy as np
 import math
-import re
+import os
+from functools import partial
+
+import logging
+
+from spc import capability, charts, ingest, metrics
+from spc.aggregate import ORDER_COL, BatchCube, BatchIndex, phase2_start, summary_stats
+from spc.bootstrap import intervals, percentile_interval, resample
+from spc.cache import SharedCache
+from spc.calculator import DE_TARGET, VISUAL_CAP, LimitCalculator, tolerance
+from spc.limits import LimitTable
+from spc.render import DISPLAY_DPI, DISPLAY_WIDTH, BaseImage, FigureCache
+from spc.rules import RULES, ooc_table
+from spc.scaleup import MIN_PI_DF, ScaleUpModels
+from spc.status import limit_status_summary
+from spc.thickness import CoilCorrelation, phase2_positions
+from spc.timeindex import TimeIndex
 
 # =========================
 # PAGE CONFIG
@@ -15,8 +30,26 @@ st.set_page_config(
     layout="wide"
 )
 
-st.markdown(
-    """
+# Đo thời gian từng bước của lần rerun này: bật panel debug bằng SPC_DEBUG=1 hoặc ?debug=1,
+# SPC_DEBUG_MEMORY=1 thêm peak memory, SPC_METRICS_LOG=1 ghi log JSON, SPC_METRICS_PORT mở /metrics
+DEBUG = os.environ.get("SPC_DEBUG") == "1" or st.query_params.get("debug") == "1"
+with metrics.Trace("dashboard", memory=DEBUG and os.environ.get("SPC_DEBUG_MEMORY") == "1") as trace:
+    @st.cache_resource
+    def metrics_endpoint(port):
+        return metrics.serve(port)
+
+    @st.cache_resource
+    def metrics_logger():
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        metrics.log.addHandler(handler)
+        metrics.log.setLevel(logging.INFO)
+        return handler
+
+    if os.environ.get("SPC_METRICS_PORT"): metrics_endpoint(int(os.environ["SPC_METRICS_PORT"]))
+
+    st.markdown(
+        """
     <style>
     .stApp {
         background: linear-gradient(270deg, #ffffff, #f0f9ff, #e0f2fe, #fef3c7, #ecfeff);
@@ -30,522 +63,397 @@ st.markdown(
     }
     </style>
     """,
-    unsafe_allow_html=True
-)
-
-if st.button("🔄 Refresh data"):
-    st.cache_data.clear()
-    st.rerun()
-
-st.markdown("""<style>[data-testid="stSidebar"] {background-color: #f6f8fa;}</style>""", unsafe_allow_html=True)
-
-# =========================
-# GOOGLE SHEET LINKS
-# =========================
-DATA_URL = "https://docs.google.com/spreadsheets/d/1lqsLKSoDTbtvAsHzJaEri8tPo5pA3vqJ__LVHp2R534/export?format=csv"
-LIMIT_URL = "https://docs.google.com/spreadsheets/d/1jbP8puBraQ5Xgs9oIpJ7PlLpjIK3sltrgbrgKUcJ-Qo/export?format=csv"
-
-# =========================
-# LOAD DATA
-# =========================
-@st.cache_data(ttl=300)
-def load_data():
-    df = pd.read_csv(DATA_URL)
-    df["Time"] = pd.to_datetime(df["Time"])
-    return df
-
-@st.cache_data(ttl=300)
-def load_limit():
-    return pd.read_csv(LIMIT_URL)
-
-df_raw = load_data()
-limit_df = load_limit()
-
-# Làm sạch tên cột
-df_raw.columns = df_raw.columns.str.replace("\r\n", " ", regex=False).str.replace("\n", " ", regex=False).str.replace("　", " ", regex=False).str.replace(r"\s+", " ", regex=True).str.strip()
-limit_df.columns = limit_df.columns.str.replace("\r\n", " ", regex=False).str.replace("\n", " ", regex=False).str.replace("　", " ", regex=False).str.replace(r"\s+", " ", regex=True).str.strip()
-
-numeric_columns = [
-    "入料檢測 ΔL 正面", "入料檢測 Δa 正面", "入料檢測 Δb 正面",
-    "正-北 ΔL", "正-南 ΔL", "正-北 Δa", "正-南 Δa", "正-北 Δb", "正-南 Δb",
-    "Avergage Thickness", "Average value ΔE 正面", "Average value ΔL 正面", 
-    "Average value Δa 正面", "Average value Δb 正面"
-]
-for col in numeric_columns:
-    if col in df_raw.columns:
-        df_raw[col] = pd.to_numeric(df_raw[col], errors='coerce')
-
-
-# =========================
-# HELPER FUNCTIONS
-# =========================
-def safe_get_limit(c_code, src, fac):
-    """Hàm dò tìm thông minh, chống lỗi khoảng trắng và thứ tự chữ."""
+        unsafe_allow_html=True
+    )
+
+    if st.button("🔄 Refresh data"):
+        # Bỏ qua max_age của snapshot ở lần chạy tới để chắc chắn kéo dữ liệu mới từ nguồn
+        st.session_state["force_sync"] = True
+        st.cache_data.clear()
+        st.rerun()
+
+    st.markdown("""<style>[data-testid="stSidebar"] {background-color: #f6f8fa;}</style>""", unsafe_allow_html=True)
+
+    # =========================
+    # GOOGLE SHEET LINKS
+    # =========================
+    DATA_URL = "https://docs.google.com/spreadsheets/d/1lqsLKSoDTbtvAsHzJaEri8tPo5pA3vqJ__LVHp2R534/export?format=csv"
+    LIMIT_URL = "https://docs.google.com/spreadsheets/d/1jbP8puBraQ5Xgs9oIpJ7PlLpjIK3sltrgbrgKUcJ-Qo/export?format=csv"
+
+    # Có thể trỏ tới file CSV cục bộ (vd. "DATA 1.csv") thay cho Google Sheet
+    DATA_SOURCE = os.environ.get("SPC_DATA_SOURCE", DATA_URL)
+    LIMIT_SOURCE = os.environ.get("SPC_LIMIT_SOURCE", LIMIT_URL)
+    # Số worker cho bảng Limit Status (thread an toàn hơn process bên trong server Streamlit)
+    STATUS_WORKERS = int(os.environ.get("SPC_STATUS_WORKERS", os.cpu_count() or 1))
+    STATUS_EXECUTOR = os.environ.get("SPC_STATUS_EXECUTOR", "thread")
+    SNAPSHOTS = ingest.SnapshotStore(os.environ.get("SPC_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".spc_snapshots")))
+
+    # =========================
+    # LOAD DATA
+    # =========================
+    def cached(name, fn, *args):
+        """Gọi hàm có cache của Streamlit; số lần miss được đếm bên trong hàm."""
+        metrics.count("cache_calls", cache=name)
+        return fn(*args)
+
+    @st.cache_data(ttl=300)
+    def load_data(_max_age=300):
+        metrics.count("cache_misses", cache="load_data")
+        return ingest.load_table(SNAPSHOTS, "data", DATA_SOURCE, ingest.normalize_data, _max_age)
+
+    @st.cache_data(ttl=300)
+    def load_limit(_max_age=300):
+        metrics.count("cache_misses", cache="load_limit")
+        return ingest.load_table(SNAPSHOTS, "limit", LIMIT_SOURCE, ingest.normalize_limits, _max_age)
+
+    @st.cache_resource(max_entries=2)
+    def load_limit_table(version, _limit_df):
+        """Bảng limit đã index sẵn: color → (source, factor) → (LCL, UCL)."""
+        metrics.count("cache_misses", cache="load_limit_table")
+        return LimitTable(_limit_df)
+
+    @st.cache_resource
+    def figure_cache():
+        """PNG đã render của các chart, dùng chung cho mọi phiên (LRU giới hạn theo dung lượng)."""
+        return FigureCache(int(os.environ.get("SPC_FIGURE_CACHE_MB", 64)) * 2**20)
+
+    @st.cache_resource
+    def view_cache():
+        """Kết quả trung gian (rows theo màu, bộ lọc năm/tháng, cube, series SPC) dùng chung cho mọi phiên.
+    Nhiều phiên cùng xin một key thì chỉ tính 1 lần; giá trị dùng chung nên chỉ đọc, không sửa."""
+        return SharedCache(int(os.environ.get("SPC_VIEW_CACHE_MB", 256)) * 2**20, name="view")
+
+    # _max_age không nằm trong key cache: lần chạy sau nút Refresh ghi đè đúng entry thường dùng
+    max_age = 0 if st.session_state.pop("force_sync", False) else 300
+    df_raw, data_version = cached("load_data", load_data, max_age)
+    limit_df, limit_version = cached("load_limit", load_limit, max_age)
+    views = view_cache()
+
+    def lineage_parent(kind):
+        # Dữ liệu mới chỉ là append (theo lineage trong meta của snapshot) → lấy bản (kind) của phiên bản cha
+        # trong cache để nối phần đuôi vào; đuôi lớn hơn phần cũ thì dựng lại từ đầu cho nhanh hơn
+        meta = SNAPSHOTS.read_meta("data") or {}
+        parent = views.get((kind, meta.get("parent"))) if meta.get("version") == data_version and meta.get("parent") else None
+        if parent is not None and parent.n_rows == meta.get("parent_rows") and len(df_raw) < 2 * parent.n_rows:
+            return parent
+        return None
+
+    def load_batch_cube():
+        """Cube tổng hợp theo batch cho toàn bộ dữ liệu, tính 1 lần cho mỗi phiên bản dữ liệu."""
+        parent = lineage_parent("batch_cube")
+        return parent.extend(df_raw.iloc[parent.n_rows:]) if parent is not None else BatchCube.from_rows(df_raw)
+
+    batch_cube = views.get_or_compute(("batch_cube", data_version), load_batch_cube)
     try:
-        c_search = str(c_code).strip().upper()
-        match_idx = -1
-        if "Color_code" in limit_df.columns:
-            for idx, val in limit_df["Color_code"].items():
-                if str(val).strip().upper() == c_search:
-                    match_idx = idx
-                    break
-        if match_idx == -1: return None, None
-        
-        row = limit_df.iloc[[match_idx]]
-        src_up = str(src).strip().upper()
-        fac1 = str(fac).strip().upper()
-        fac2 = fac1.replace("Δ", "DELTA ")
-        
-        lcl, ucl = None, None
-        for col in row.columns:
-            cup = str(col).strip().upper()
-            if src_up in cup and (fac1 in cup or fac2 in cup):
-                val = row[col].values[0]
-                try:
-                    num = float(val)
-                    if not pd.isna(num):
-                        if "LCL" in cup: lcl = num
-                        if "UCL" in cup: ucl = num
-                except: pass
-        return lcl, ucl
-    except:
-        return None, None
-
-def get_control_batch(color):
-    c_search = str(color).strip().upper()
-    mask = limit_df["Color_code"].astype(str).str.strip().str.upper() == c_search
-    row = limit_df[mask]
-    if row.empty: return None
-    value = row["Control_batch"].values[0]
-    if pd.isna(value): return None
-    if isinstance(value, str):
-        m = re.search(r"\d+", value)
-        if m: return int(m.group())
-    try: return int(float(value))
-    except: return None
-
-def get_control_batch_code(df_unfiltered, control_batch):
-    if control_batch is None or df_unfiltered.empty: return None
-    batch_order = df_unfiltered.sort_values("Time").groupby("製造批號", as_index=False).first().reset_index(drop=True)
-    if 1 <= control_batch <= len(batch_order): return batch_order.loc[control_batch - 1, "製造批號"]
-    return None
-
-def detect_out_of_control(spc_df, lcl, ucl):
-    mean = spc_df["value"].mean()
-    std = spc_df["value"].std()
-    result = spc_df.copy()
-    result["Rule_CL"] = False
-    result["Rule_3Sigma"] = False
-    if lcl is not None and ucl is not None:
-        result["Rule_CL"] = ((result["value"] < lcl) | (result["value"] > ucl))
-    if std > 0:
-        result["Rule_3Sigma"] = ((result["value"] > mean + 3 * std) | (result["value"] < mean - 3 * std))
-    result["Out_of_Control"] = (result["Rule_CL"] | result["Rule_3Sigma"])
-    return result[result["Out_of_Control"]]
-
-def calculate_batch_averages(df_filtered_color):
-    res = {}
-    for f in ["ΔL", "Δa", "Δb"]:
-        tmp = df_filtered_color.copy()
-        # LINE
-        col_n, col_s = f"正-北 {f}", f"正-南 {f}"
-        tmp[col_n] = pd.to_numeric(tmp[col_n], errors='coerce')
-        tmp[col_s] = pd.to_numeric(tmp[col_s], errors='coerce')
-        tmp["row_avg"] = tmp[[col_n, col_s]].mean(axis=1)
-        line_b = tmp.groupby("製造批號", as_index=False).agg({"Time": "min", "row_avg": "mean"}).rename(columns={"row_avg": "value"}).dropna()
-        # LAB
-        col_lab = f"入料檢測 {f} 正面"
-        tmp[col_lab] = pd.to_numeric(tmp[col_lab], errors='coerce')
-        lab_b = tmp.groupby("製造批號", as_index=False).agg({"Time": "min", col_lab: "mean"}).rename(columns={col_lab: "value"}).dropna()
-        res[f] = {"line": line_b, "lab": lab_b}
-    return res
+        limits = cached("load_limit_table", load_limit_table, limit_version, limit_df)
+    except ValueError as e:
+        st.error(f"❌ Limit sheet: {e}")
+        st.stop()
+    trace.lap("load")
+
+
+    # =========================
+    # SIDEBAR – NAVIGATION
+    # =========================
+    st.sidebar.markdown("### 📊 View Mode")
+    app_mode = st.sidebar.radio(
+        "Select View Mode",
+        ["🚀 Main Dashboard", "📋 Limit Status Summary", "🎛️ Control Limit Calculator","🔬 Lab vs Line Scale-up"],
+        label_visibility="collapsed"
+    )
 
+    st.sidebar.divider()
+    for problem in limits.problems: st.sidebar.warning(f"⚠ Limit sheet: {problem}")
+    st.sidebar.title("🎨 Filter")
 
-# =========================
-# SIDEBAR – NAVIGATION
-# =========================
-st.sidebar.markdown("### 📊 View Mode")
-app_mode = st.sidebar.radio(
-    "Select View Mode",
-    ["🚀 Main Dashboard", "📋 Limit Status Summary", "🎛️ Control Limit Calculator","🔬 Lab vs Line Scale-up"],
-    label_visibility="collapsed"
-)
-
-st.sidebar.divider()
-st.sidebar.title("🎨 Filter")
-color = st.sidebar.selectbox("Color code", sorted(df_raw["塗料編號"].dropna().unique()), key="sidebar_color")
+    def batch_index():
+        parent = lineage_parent("batch_index")
+        return parent.extend(df_raw.iloc[parent.n_rows:], data_version) if parent is not None else BatchIndex.from_rows(df_raw, data_version)
 
-df_color = df_raw[df_raw["塗料編號"] == color].copy()
-control_batch = get_control_batch(color)
-control_batch_code = get_control_batch_code(df_color, control_batch)
+    index = views.get_or_compute(("batch_index", data_version), batch_index)
+    all_colors = views.get_or_compute(("colors", data_version), lambda: sorted(df_raw["塗料編號"].dropna().unique()))
+    color = st.sidebar.selectbox("Color code", all_colors, key="sidebar_color")
 
-all_years = sorted(df_color["Time"].dt.year.dropna().astype(int).unique())
-selected_years = st.sidebar.multiselect("📅 Year (Leave empty for ALL)", options=all_years, default=[], key="sidebar_year")
+    # Rows theo (màu, Time) + offset từng tháng → lọc năm/tháng/khoảng ngày = cắt lát bằng searchsorted
+    time_index = views.get_or_compute(("time_index", data_version), lambda: TimeIndex.from_rows(df_raw, data_version))
 
-all_months = sorted(df_color["Time"].dt.month.dropna().astype(int).unique())
-selected_months = st.sidebar.multiselect("📅 Month (optional)", options=all_months, default=[], key="sidebar_month")
+    def color_rows():
+        return df_raw.iloc[time_index.select(color)], time_index.years(color), time_index.months(color)
 
-df = df_color.copy()
-if len(selected_years) > 0: df = df[df["Time"].dt.year.isin(selected_years)]
-if len(selected_months) > 0: df = df[df["Time"].dt.month.isin(selected_months)]
+    df_color, all_years, all_months = views.get_or_compute(("color", data_version, color), color_rows)
+    control_batch = limits.control_batch(color)
+    control_batch_code = index.control_batch_code(color, control_batch)
+    # Phase II = các batch có thứ tự (theo Time đầu tiên) >= control batch
+    phase2_from = phase2_start(control_batch_code, control_batch)
 
-# Tính toán chuẩn SPC dùng chung
-spc_data = calculate_batch_averages(df)
+    selected_years = st.sidebar.multiselect("📅 Year (Leave empty for ALL)", options=all_years, default=[], key="sidebar_year")
+    selected_months = st.sidebar.multiselect("📅 Month (optional)", options=all_months, default=[], key="sidebar_month")
 
+    def filtered_view():
+        df = df_raw.iloc[time_index.select(color, selected_years, selected_months)]
+        view_cube = BatchCube.from_rows(df, reference=batch_cube)
+        return df, view_cube, view_cube.series(color)
 
-# =========================================================
-# VIEW 1: MAIN DASHBOARD (BẢN FULL GỐC)
-# =========================================================
-if app_mode == "🚀 Main Dashboard":
+    # Tính toán chuẩn SPC dùng chung. Không lọc năm/tháng thì cắt thẳng từ cube toàn cục: df và cube đã có entry
+    # riêng trong cache nên chỉ cache series của màu (không tính trùng dung lượng cube vào từng màu)
+    if selected_years or selected_months:
+        df, view_cube, spc_data = views.get_or_compute(("view", data_version, color, tuple(selected_years), tuple(selected_months)), filtered_view)
+    else:
+        df, view_cube = df_color, batch_cube
+        spc_data = views.get_or_compute(("series", data_version, color), lambda: batch_cube.series(color))
+    trace.lap("filter")
 
-    # --- 1. SIDEBAR ELEMENTS ---
-    st.sidebar.divider()
-    if control_batch_code is not None:
-        st.sidebar.info(f"🔔 **Control batch**\n\nBatch #{control_batch} → **{control_batch_code}**")
-    elif control_batch is not None:
-        st.sidebar.warning(f"⚠ Control batch #{control_batch} exceeds available batches")
-    st.sidebar.divider()
 
-    # Bảng Sheet Limits ở thanh Sidebar
-    def show_limits(factor):
-        c_search = str(color).strip().upper()
-        mask = limit_df["Color_code"].astype(str).str.strip().str.upper() == c_search
-        row = limit_df[mask]
-        if row.empty: return
-        table = row.filter(like=factor).copy()
-        for c in table.columns: table[c] = table[c].map(lambda x: f"{x:.2f}" if pd.notnull(x) else "")
-        st.sidebar.markdown(f"**{factor} Control Limits (Sheet)**")
-        st.sidebar.dataframe(table, use_container_width=True, hide_index=True)
-
-    show_limits("LAB")
-    show_limits("LINE")
-
-    # --- 2. MAIN TITLES & HEADER INFO ---
-    st.title("室內隔間用途－塗料入料管控專案")
-    st.caption("Incoming Paint SPC · LAB / LINE · Phase II Monitoring")
-    st.title(f"📊 SPC Color Dashboard — {color}")
-
-    if not df.empty:
-        t_min = df["Time"].min().strftime("%Y-%m-%d")
-        t_max = df["Time"].max().strftime("%Y-%m-%d")
-        n_batch = df["製造批號"].nunique()
-        display_year = "ALL" if len(selected_years) == 0 else ", ".join(map(str, selected_years))
-        display_month = "ALL" if len(selected_months) == 0 else ", ".join(map(str, selected_months))
-    else:
-        t_min = t_max = "N/A"; n_batch = 0; display_year = "N/A"; display_month = "N/A"
+    # =========================================================
+    # VIEW 1: MAIN DASHBOARD (BẢN FULL GỐC)
+    # =========================================================
+    if app_mode == "🚀 Main Dashboard":
 
-    st.markdown(f"⏱ **{t_min} → {t_max} | n = {n_batch} batches | Year: {display_year} | Month: {display_month}**")
+        # --- 1. SIDEBAR ELEMENTS ---
+        st.sidebar.divider()
+        if control_batch_code is not None:
+            st.sidebar.info(f"🔔 **Control batch**\n\nBatch #{control_batch} → **{control_batch_code}**")
+        elif control_batch is not None:
+            st.sidebar.warning(f"⚠ Control batch #{control_batch} exceeds available batches")
+        st.sidebar.divider()
+
+        # Bảng Sheet Limits ở thanh Sidebar
+        def show_limits(factor):
+            row = limits.row(color)
+            if row.empty: return
+            table = row.filter(like=factor).copy()
+            for c in table.columns: table[c] = table[c].map(lambda x: f"{x:.2f}" if pd.notnull(x) else "")
+            st.sidebar.markdown(f"**{factor} Control Limits (Sheet)**")
+            st.sidebar.dataframe(table, width="stretch", hide_index=True)
+
+        show_limits("LAB")
+        show_limits("LINE")
+
+        # --- 2. MAIN TITLES & HEADER INFO ---
+        st.title("室內隔間用途－塗料入料管控專案")
+        st.caption("Incoming Paint SPC · LAB / LINE · Phase II Monitoring")
+        st.title(f"📊 SPC Color Dashboard — {color}")
 
-    # --- 3. COLLAPSIBLE BATCH SUMMARY ---
-    with st.expander("🔎 Batch Summary (Before SPC Aggregation)"):
         if not df.empty:
-            batch_summary = (
-                df.groupby("製造批號", as_index=False)
-                .agg(
-                    First_Time=("Time", "min"),
-                    LAB_ΔL=("入料檢測 ΔL 正面", "mean"), LAB_Δa=("入料檢測 Δa 正面", "mean"), LAB_Δb=("入料檢測 Δb 正面", "mean"),
-                    LINE_ΔL_N=("正-北 ΔL", "mean"), LINE_ΔL_S=("正-南 ΔL", "mean"),
-                    LINE_Δa_N=("正-北 Δa", "mean"), LINE_Δa_S=("正-南 Δa", "mean"),
-                    LINE_Δb_N=("正-北 Δb", "mean"), LINE_Δb_S=("正-南 Δb", "mean"),
-                    Rows_in_Batch=("製造批號", "count")
-                ).sort_values("First_Time")
-            )
-            batch_summary["LINE_ΔL"] = batch_summary[["LINE_ΔL_N", "LINE_ΔL_S"]].mean(axis=1)
-            batch_summary["LINE_Δa"] = batch_summary[["LINE_Δa_N", "LINE_Δa_S"]].mean(axis=1)
-            batch_summary["LINE_Δb"] = batch_summary[["LINE_Δb_N", "LINE_Δb_S"]].mean(axis=1)
-            display_cols = ["製造批號", "First_Time", "LAB_ΔL", "LAB_Δa", "LAB_Δb", "LINE_ΔL", "LINE_Δa", "LINE_Δb", "Rows_in_Batch"]
-            st.dataframe(batch_summary[display_cols], use_container_width=True, hide_index=True)
+            t_min = df["Time"].min().strftime("%Y-%m-%d")
+            t_max = df["Time"].max().strftime("%Y-%m-%d")
+            n_batch = df["製造批號"].nunique()
+            display_year = "ALL" if len(selected_years) == 0 else ", ".join(map(str, selected_years))
+            display_month = "ALL" if len(selected_months) == 0 else ", ".join(map(str, selected_months))
         else:
-            st.warning("No data after filtering.")
-
-    # --- 4. SUMMARY STATISTICS (Phần tiếp theo của code) ---
-    summary_line, summary_lab = [], []
-    for k in ["ΔL", "Δa", "Δb"]:
-        line_values = spc_data[k]["line"]["value"].dropna()
-        if not line_values.empty:
-            summary_line.append({"Factor": k, "Min": round(line_values.min(), 2), "Max": round(line_values.max(), 2), "Mean": round(line_values.mean(), 2), "Std Dev": round(line_values.std(), 2), "n": line_values.count()})
-        lab_values = spc_data[k]["lab"]["value"].dropna()
-        if not lab_values.empty:
-            summary_lab.append({"Factor": k, "Min": round(lab_values.min(), 2), "Max": round(lab_values.max(), 2), "Mean": round(lab_values.mean(), 2), "Std Dev": round(lab_values.std(), 2), "n": lab_values.count()})
-    st.markdown("### 📋 Summary Statistics")
-    col1, col2 = st.columns(2)
-    with col1: st.markdown("#### 🏭 LINE"); st.dataframe(pd.DataFrame(summary_line), use_container_width=True, hide_index=True)
-    with col2: st.markdown("#### 🧪 LAB"); st.dataframe(pd.DataFrame(summary_lab), use_container_width=True, hide_index=True)
-
-    # Các hàm vẽ Chart
-    def spc_combined(lab, line, title, lab_lim, line_lim, control_batch_code):
-        fig, ax = plt.subplots(figsize=(12, 4))
-        ax.plot(lab["製造批號"], lab["value"], "o-", label="LAB", color="#1f77b4")
-        ax.plot(line["製造批號"], line["value"], "o-", label="LINE", color="#2ca02c")
-        if control_batch_code is not None:
-            ax.axvline(x=control_batch_code, color="#b22222", linestyle="--", linewidth=1.5)
-            ax.text(control_batch_code, ax.get_ylim()[1] * 0.97, "Phase II", color="#b22222", fontsize=9, ha="center", va="top")
-        if lab_lim[0] is not None and lab_lim[1] is not None:
-            out_lab = (lab["value"] > lab_lim[1]) | (lab["value"] < lab_lim[0])
-            ax.scatter(lab["製造批號"][out_lab], lab["value"][out_lab], color="red", s=80, zorder=5)
-        if line_lim[0] is not None and line_lim[1] is not None:
-            out_line = (line["value"] > line_lim[1]) | (line["value"] < line_lim[0])
-            ax.scatter(line["製造批號"][out_line], line["value"][out_line], color="red", s=80, zorder=5)
-        if lab_lim[0] is not None: ax.axhline(lab_lim[0], color="#1f77b4", linestyle=":", label="LAB LCL"); ax.axhline(lab_lim[1], color="#1f77b4", linestyle=":", label="LAB UCL")
-        if line_lim[0] is not None: ax.axhline(line_lim[0], color="red", label="LINE LCL"); ax.axhline(line_lim[1], color="red", label="LINE UCL")
-        ax.set_title(title); ax.legend(bbox_to_anchor=(1.02, 1), loc="upper left"); ax.grid(True); ax.tick_params(axis="x", rotation=45); fig.subplots_adjust(right=0.78)
-        return fig
-
-    def spc_combined_phase2(lab, line, title, lab_lim, line_lim, control_batch_code):
-        if control_batch_code is None: return None
-        lab2 = lab[lab["製造批號"] >= control_batch_code]; line2 = line[line["製造批號"] >= control_batch_code]
-        if lab2.empty and line2.empty: return None
-        fig, ax = plt.subplots(figsize=(12, 4))
-        if not lab2.empty: ax.plot(lab2["製造批號"], lab2["value"], "o-", label="LAB", color="#1f77b4")
-        if not line2.empty: ax.plot(line2["製造批號"], line2["value"], "o-", label="LINE", color="#2ca02c")
-        if not lab2.empty and lab_lim[0] is not None:
-            out = (lab2["value"] < lab_lim[0]) | (lab2["value"] > lab_lim[1])
-            ax.scatter(lab2["製造批號"][out], lab2["value"][out], color="red", s=90, zorder=6)
-        if not line2.empty and line_lim[0] is not None:
-            out = (line2["value"] < line_lim[0]) | (line2["value"] > line_lim[1])
-            ax.scatter(line2["製造批號"][out], line2["value"][out], color="red", s=90, zorder=6)
-        ax.axvline(x=control_batch_code, color="#b22222", linestyle="--", linewidth=1.5, label="Phase II start")
-        if lab_lim[0] is not None: ax.axhline(lab_lim[0], color="#1f77b4", linestyle=":", label="LAB LCL"); ax.axhline(lab_lim[1], color="#1f77b4", linestyle=":", label="LAB UCL")
-        if line_lim[0] is not None: ax.axhline(line_lim[0], color="red", label="LINE LCL"); ax.axhline(line_lim[1], color="red", label="LINE UCL")
-        ax.set_title(title); ax.legend(bbox_to_anchor=(1.02, 1), loc="upper left"); ax.grid(True); ax.tick_params(axis="x", rotation=45); fig.subplots_adjust(right=0.78)
-        return fig
-
-    def download(fig, name):
-        buf = io.BytesIO(); fig.savefig(buf, format="png", dpi=200, bbox_inches="tight"); buf.seek(0)
-        st.download_button("📥 Download PNG", buf, name, "image/png", key=f"dl_{name}")
-
-    # Section: CONTROL CHART LAB-LINE
-    st.markdown("### 📊 CONTROL CHART: LAB-LINE")
-    for k in ["ΔL", "Δa", "Δb"]:
-        lab_lim = safe_get_limit(color, "LAB", k)
-        line_lim = safe_get_limit(color, "LINE", k)
-        fig = spc_combined(spc_data[k]["lab"], spc_data[k]["line"], f"COMBINED {k}", lab_lim, line_lim, control_batch_code)
-        st.pyplot(fig); download(fig, f"COMBINED_{color}_{k}.png")
-
-    # Section: PHASE 2 CHARTS
-    st.markdown("---")
-    st.subheader("📊 SPC Combined Chart (LAB + LINE) – Phase II")
-    for k in ["ΔL", "Δa", "Δb"]:
-        lab_lim = safe_get_limit(color, "LAB", k)
-        line_lim = safe_get_limit(color, "LINE", k)
-        fig = spc_combined_phase2(spc_data[k]["lab"], spc_data[k]["line"], f"{k} – LAB + LINE (Phase II)", lab_lim, line_lim, control_batch_code)
-        if fig is not None: st.pyplot(fig); download(fig, f"COMBINED_PHASE2_{color}_{k}.png")
-        else: st.info(f"{k}: Not enough Phase II data")
-
-    # Section: DISTRIBUTIONS DASHBOARD
-    st.markdown("---")
-    st.markdown("## 📈 Line Process Distribution Dashboard")
-    def normal_pdf(x, mean, std): return (1 / (std * math.sqrt(2 * math.pi))) * np.exp(-0.5 * ((x - mean) / std) ** 2)
-    cols = st.columns(3)
-    for i, k in enumerate(["ΔL", "Δa", "Δb"]):
-        with cols[i]:
-            values = spc_data[k]["line"]["value"].dropna()
-            if len(values) < 3: st.warning("Not enough data"); continue
-            mean, std = values.mean(), values.std(); lcl, ucl = safe_get_limit(color, "LINE", k)
-            fig, ax = plt.subplots(figsize=(5, 4))
-            bins = np.histogram_bin_edges(values, bins=10)
-            counts, _, patches = ax.hist(values, bins=bins, edgecolor="white", color="#4dabf7", alpha=0.85)
-            for p, l, r in zip(patches, bins[:-1], bins[1:]):
-                center = (l + r) / 2
-                if lcl is not None and ucl is not None and (center < lcl or center > ucl): p.set_facecolor("#ff6b6b")
-            if std > 0:
-                x = np.linspace(mean - 4 * std, mean + 4 * std, 500)
-                ax.plot(x, normal_pdf(x, mean, std) * len(values) * (bins[1] - bins[0]), color="black", linewidth=2)
-            if lcl is not None: ax.axvline(lcl, color="red", linestyle="--", linewidth=1.5, label="LSL")
-            if ucl is not None: ax.axvline(ucl, color="red", linestyle="--", linewidth=1.5, label="USL")
-            ax.text(0.02, 0.95, f"N = {len(values)}\nMean = {mean:.3f}\nStd = {std:.3f}", transform=ax.transAxes, va="top", fontsize=9, bbox=dict(facecolor="white", alpha=0.9))
-            ax.set_title(f"{k} (LINE)"); ax.grid(axis="y", alpha=0.3); ax.legend(fontsize=8); st.pyplot(fig)
-            buf = io.BytesIO(); fig.savefig(buf, format="png", dpi=150, bbox_inches="tight"); buf.seek(0)
-            st.download_button("⬇ Download", data=buf, file_name=f"{k}_line_dist.png", mime="image/png", key=f"dl_line_dist_{k}")
-
-    st.markdown("---")
-    st.markdown("## 🧪 LAB Process Distribution Dashboard")
-    cols = st.columns(3)
-    for i, k in enumerate(["ΔL", "Δa", "Δb"]):
-        with cols[i]:
-            values = spc_data[k]["lab"]["value"].dropna()
-            if len(values) < 3: st.warning("Not enough data"); continue
-            mean, std = values.mean(), values.std(); lcl, ucl = safe_get_limit(color, "LAB", k)
-            fig, ax = plt.subplots(figsize=(5, 4))
-            bins = np.histogram_bin_edges(values, bins=10)
-            counts, _, patches = ax.hist(values, bins=bins, edgecolor="white", color="#1f77b4", alpha=0.85)
-            for p, l, r in zip(patches, bins[:-1], bins[1:]):
-                center = (l + r) / 2
-                if lcl is not None and ucl is not None and (center < lcl or center > ucl): p.set_facecolor("#ff6b6b")
-            if std > 0:
-                x = np.linspace(mean - 4 * std, mean + 4 * std, 500)
-                ax.plot(x, normal_pdf(x, mean, std) * len(values) * (bins[1] - bins[0]), color="black", linewidth=2)
-            if lcl is not None: ax.axvline(lcl, color="red", linestyle="--", linewidth=1.5, label="LSL")
-            if ucl is not None: ax.axvline(ucl, color="red", linestyle="--", linewidth=1.5, label="USL")
-            ax.text(0.02, 0.95, f"N = {len(values)}\nMean = {mean:.3f}\nStd = {std:.3f}", transform=ax.transAxes, va="top", fontsize=9, bbox=dict(facecolor="white", alpha=0.9))
-            ax.set_title(f"{k} (LAB)"); ax.grid(axis="y", alpha=0.3); ax.legend(fontsize=8); st.pyplot(fig)
-            buf = io.BytesIO(); fig.savefig(buf, format="png", dpi=150, bbox_inches="tight"); buf.seek(0)
-            st.download_button("⬇ Download", data=buf, file_name=f"{k}_lab_dist.png", mime="image/png", key=f"dl_lab_dist_{k}")
-
-    # Section: OOC TABLE
-    st.markdown("## 🚨 Out-of-Control Batches")
-    ooc_rows = []
-    for k in ["ΔL", "Δa", "Δb"]:
-        lcl, ucl = safe_get_limit(color, "LINE", k)
-        if control_batch_code is not None:
-            line_phase2 = spc_data[k]["line"][spc_data[k]["line"]["製造批號"] >= control_batch_code]
-            ooc_line = detect_out_of_control(line_phase2, lcl, ucl)
-            for _, r in ooc_line.iterrows(): ooc_rows.append({"Factor": k, "Type": "LINE", "製造批號": r["製造批號"], "Value": round(r["value"], 2), "Rule_CL": r["Rule_CL"], "Rule_3Sigma": r["Rule_3Sigma"]})
-        lcl, ucl = safe_get_limit(color, "LAB", k)
-        if control_batch_code is not None:
-            lab_phase2 = spc_data[k]["lab"][spc_data[k]["lab"]["製造批號"] >= control_batch_code]
-            ooc_lab = detect_out_of_control(lab_phase2, lcl, ucl)
-            for _, r in ooc_lab.iterrows(): ooc_rows.append({"Factor": k, "Type": "LAB", "製造批號": r["製造批號"], "Value": round(r["value"], 2), "Rule_CL": r["Rule_CL"], "Rule_3Sigma": r["Rule_3Sigma"]})
-    if ooc_rows: st.dataframe(pd.DataFrame(ooc_rows), use_container_width=True)
-    else: st.success("✅ No out-of-control batches detected")
-
-   # Section: THICKNESS CORRELATION
-    st.markdown("---")
-    st.header("🎨 Thickness – Color Analysis (Per Coil)")
-    
-    # Lưu ý: Giữ nguyên tên cột gốc trong DataFrame của bạn (kể cả có lỗi chính tả như "Avergage Thickness")
-    coil_col, time_col, thickness_col = "Coil No.", "Time", "Avergage Thickness"
-    dE_col, dL_col, da_col, db_col = "Average value ΔE 正面", "Average value ΔL 正面", "Average value Δa 正面", "Average value Δb 正面"
-    required_cols = [coil_col, time_col, thickness_col, dE_col, dL_col, da_col, db_col]
-    missing = [c for c in required_cols if c not in df.columns]
-
-    if missing:
-        st.error(f"❌ Missing required columns: {missing}")
-    else:
-        df_plot = df.copy()
-        df_plot[time_col] = pd.to_datetime(df_plot[time_col], errors="coerce")
-        df_plot = df_plot.dropna(subset=[time_col])
-        df_plot["Year"] = df_plot[time_col].dt.year
-        df_plot["Month"] = df_plot[time_col].dt.to_period("M").astype(str)
+            t_min = t_max = "N/A"; n_batch = 0; display_year = "N/A"; display_month = "N/A"
+
+        st.markdown(f"⏱ **{t_min} → {t_max} | n = {n_batch} batches | Year: {display_year} | Month: {display_month}**")
+
+        # --- 3. COLLAPSIBLE BATCH SUMMARY ---
+        with st.expander("🔎 Batch Summary (Before SPC Aggregation)"):
+            if not df.empty:
+                batch_summary = view_cube.color(color).sort_values("First_Time")
+                batch_summary["LINE_ΔL"] = batch_summary[["LINE_ΔL_N", "LINE_ΔL_S"]].mean(axis=1)
+                batch_summary["LINE_Δa"] = batch_summary[["LINE_Δa_N", "LINE_Δa_S"]].mean(axis=1)
+                batch_summary["LINE_Δb"] = batch_summary[["LINE_Δb_N", "LINE_Δb_S"]].mean(axis=1)
+                display_cols = ["製造批號", "First_Time", "LAB_ΔL", "LAB_Δa", "LAB_Δb", "LINE_ΔL", "LINE_Δa", "LINE_Δb", "Rows_in_Batch"]
+                st.dataframe(batch_summary[display_cols], width="stretch", hide_index=True)
+            else:
+                st.warning("No data after filtering.")
 
-        st.subheader("⏱ Time Filter")
+        # --- 4. SUMMARY STATISTICS (Phần tiếp theo của code) ---
+        st.markdown("### 📋 Summary Statistics")
         col1, col2 = st.columns(2)
-        
-        with col1: 
-            filter_mode_bottom = st.radio("Filter by", ["Month", "Year"], horizontal=True, key="bottom_filter_mode")
-        
-        with col2:
-            # --- CẬP NHẬT LOGIC: KHÔNG CHỌN = HIỂN THỊ TẤT CẢ ---
-            if filter_mode_bottom == "Month":
-                all_months = sorted(df_plot["Month"].unique())
-                month_sel = st.multiselect("Select month(s) [Leave empty to show all]", all_months, default=[], key="bottom_month_sel")
-                if month_sel:  # Chỉ lọc khi có tháng được chọn
-                    df_plot = df_plot[df_plot["Month"].isin(month_sel)]
+        with col1: st.markdown("#### 🏭 LINE"); st.dataframe(summary_stats(spc_data, "line"), width="stretch", hide_index=True)
+        with col2: st.markdown("#### 🧪 LAB"); st.dataframe(summary_stats(spc_data, "lab"), width="stretch", hide_index=True)
+        trace.lap("dashboard.summary")
+
+        # Chart render 1 lần theo key (dữ liệu, màu, bộ lọc, limit, loại chart), sau đó lấy PNG từ cache
+        figures = figure_cache()
+        view_key = (data_version, color, tuple(selected_years), tuple(selected_months))
+        def show_chart(key, build, download_name=None, label="📥 Download PNG", download_key=None, download_dpi=DISPLAY_DPI):
+            png = figures.chart(view_key + key, build, max_width=DISPLAY_WIDTH)
+            if png is None: return False
+            st.image(png, width="stretch")
+            if download_name:
+                # PNG xuất file chỉ được tạo khi bấm nút (hoặc lấy lại từ cache)
+                export = partial(figures.chart, view_key + key, build, dpi=download_dpi)
+                st.download_button(label, export, download_name, "image/png", key=download_key or f"dl_{download_name}")
+            return True
+
+        # Section: CONTROL CHART LAB-LINE
+        st.markdown("### 📊 CONTROL CHART: LAB-LINE")
+        # Lịch sử dài: chart tự giảm điểm (luôn giữ điểm OOC/Nelson); slider chọn cửa sổ batch để zoom
+        orders = view_cube.color(color)[ORDER_COL]
+        window = None
+        if len(orders) > charts.LARGE_SERIES:
+            lo, hi = int(orders.min()), int(orders.max())
+            window = st.slider("🔍 Batch window (Batch_Order)", lo, hi, (lo, hi), key=f"chart_window_{color}")
+            if window == (lo, hi): window = None
+        for k in ["ΔL", "Δa", "Δb"]:
+            lab_lim = limits.get(color, "LAB", k)
+            line_lim = limits.get(color, "LINE", k)
+            show_chart(("combined", k, lab_lim, line_lim, phase2_from, window), partial(charts.combined, spc_data[k]["lab"], spc_data[k]["line"], f"COMBINED {k}", lab_lim, line_lim, phase2_from, window), f"COMBINED_{color}_{k}.png")
+        trace.lap("dashboard.control_charts")
+
+        # Section: PHASE 2 CHARTS
+        st.markdown("---")
+        st.subheader("📊 SPC Combined Chart (LAB + LINE) – Phase II")
+        chart_mode = st.radio("Chart mode", ["Shewhart", "CUSUM", "EWMA"], horizontal=True, key="phase2_chart_mode")
+        shift_params = {}
+        if chart_mode == "CUSUM":
+            c1, c2 = st.columns(2)
+            shift_params["k"] = c1.number_input("k (σ)", min_value=0.0, value=0.5, step=0.05, key="cusum_k")
+            shift_params["h"] = c2.number_input("h (σ)", min_value=0.5, value=5.0, step=0.5, key="cusum_h")
+            st.caption("Tabular CUSUM on Phase II batches, standardized by Phase I mean / std. Signal when C+ or C− exceeds h.")
+        elif chart_mode == "EWMA":
+            c1, c2 = st.columns(2)
+            shift_params["lam"] = c1.number_input("λ", min_value=0.01, max_value=1.0, value=0.2, step=0.05, key="ewma_lambda")
+            shift_params["L"] = c2.number_input("L (σ)", min_value=0.5, value=3.0, step=0.1, key="ewma_L")
+            st.caption("EWMA on Phase II batches, standardized by Phase I mean / std, with exact time-varying limits.")
+        for k in ["ΔL", "Δa", "Δb"]:
+            lab_lim = limits.get(color, "LAB", k)
+            line_lim = limits.get(color, "LINE", k)
+            if chart_mode == "Shewhart":
+                build = partial(charts.combined_phase2, spc_data[k]["lab"], spc_data[k]["line"], f"{k} – LAB + LINE (Phase II)", lab_lim, line_lim, phase2_from, window)
             else:
-                all_years = sorted(df_plot["Year"].unique())
-                year_sel = st.multiselect("Select year(s) [Leave empty to show all]", all_years, default=[], key="bottom_year_sel")
-                if year_sel:   # Chỉ lọc khi có năm được chọn
-                    df_plot = df_plot[df_plot["Year"].isin(year_sel)]
-
-        if df_plot.empty:
-            st.warning("⚠️ No data available for the selected time period.")
+                build = partial(charts.shift_phase2, spc_data[k]["lab"], spc_data[k]["line"], f"{k} – LAB + LINE {chart_mode} (Phase II)", chart_mode, shift_params, phase2_from, window)
+            suffix = "" if chart_mode == "Shewhart" else f"_{chart_mode}"
+            key = ("phase2", chart_mode, tuple(sorted(shift_params.items())), k, lab_lim, line_lim, phase2_from, window)
+            if not show_chart(key, build, f"COMBINED_PHASE2{suffix}_{color}_{k}.png"): st.info(f"{k}: Not enough Phase II data")
+        trace.lap("dashboard.phase2")
+
+        # Section: DISTRIBUTIONS DASHBOARD
+        def capability_text(cap):
+            return " · ".join(f"{k} {cap[k]:.2f}" for k in ("Cp", "Cpk", "Pp", "Ppk") if pd.notnull(cap[k])) + f" · {cap['Expected ppm']:,.0f} ppm out of spec"
+        st.markdown("---")
+        st.markdown("## 📈 Line Process Distribution Dashboard")
+        cols = st.columns(3)
+        for i, k in enumerate(["ΔL", "Δa", "Δb"]):
+            with cols[i]:
+                values = spc_data[k]["line"]["value"].dropna()
+                if len(values) < 3: st.warning("Not enough data"); continue
+                lcl, ucl = limits.get(color, "LINE", k)
+                show_chart(("dist", "LINE", k, lcl, ucl), partial(charts.distribution, values, lcl, ucl, f"{k} (LINE)", "#4dabf7"), f"{k}_line_dist.png", "⬇ Download", f"dl_line_dist_{k}", download_dpi=150)
+                if lcl is not None or ucl is not None: st.caption(capability_text(capability.series_capability(values, lcl, ucl)))
+
+        st.markdown("---")
+        st.markdown("## 🧪 LAB Process Distribution Dashboard")
+        cols = st.columns(3)
+        for i, k in enumerate(["ΔL", "Δa", "Δb"]):
+            with cols[i]:
+                values = spc_data[k]["lab"]["value"].dropna()
+                if len(values) < 3: st.warning("Not enough data"); continue
+                lcl, ucl = limits.get(color, "LAB", k)
+                show_chart(("dist", "LAB", k, lcl, ucl), partial(charts.distribution, values, lcl, ucl, f"{k} (LAB)", "#1f77b4"), f"{k}_lab_dist.png", "⬇ Download", f"dl_lab_dist_{k}", download_dpi=150)
+                if lcl is not None or ucl is not None: st.caption(capability_text(capability.series_capability(values, lcl, ucl)))
+        trace.lap("dashboard.distributions")
+
+        # Section: OOC TABLE
+        st.markdown("## 🚨 Out-of-Control Batches")
+        ooc_df = ooc_table(spc_data, limits, color, phase2_from)
+        if not ooc_df.empty:
+            st.dataframe(ooc_df, width="stretch")
+            st.caption("Nelson rules: " + " · ".join(f"{r}. {txt}" for r, txt in RULES.items()))
+        else: st.success("✅ No out-of-control batches detected")
+        trace.lap("dashboard.ooc_table")
+
+       # Section: THICKNESS CORRELATION
+        st.markdown("---")
+        st.header("🎨 Thickness – Color Analysis (Per Coil)")
+    
+        # Lưu ý: Giữ nguyên tên cột gốc trong DataFrame của bạn (kể cả có lỗi chính tả như "Avergage Thickness")
+        coil_col, time_col, thickness_col = "Coil No.", "Time", "Avergage Thickness"
+        dE_col, dL_col, da_col, db_col = "Average value ΔE 正面", "Average value ΔL 正面", "Average value Δa 正面", "Average value Δb 正面"
+        required_cols = [coil_col, time_col, thickness_col, dE_col, dL_col, da_col, db_col]
+        missing = [c for c in required_cols if c not in df.columns]
+
+        if missing:
+            st.error(f"❌ Missing required columns: {missing}")
         else:
-            st.subheader("📊 Average Thickness vs ΔE (Each Point = 1 Coil)")
-            fig, ax = plt.subplots(figsize=(10, 6))
-            ax.scatter(df_plot[thickness_col], df_plot[dE_col], alpha=0.75)
-            if len(df_plot) > 0: 
-                ax.axhline(df_plot[dE_col].mean(), linestyle="--", linewidth=2, label=f"Mean ΔE = {df_plot[dE_col].mean():.2f}")
-            ax.set_xlabel("Average Thickness")
-            ax.set_ylabel("ΔE")
-            ax.set_title("Thickness – Color Relationship per Coil")
-            ax.legend()
-            ax.grid(True, linestyle="--", alpha=0.4)
-            st.pyplot(fig)
-
-            st.subheader("📈 ΔE Distribution (Per Coil)")
-            fig2, ax2 = plt.subplots(figsize=(10, 4))
-            data_de = df_plot[dE_col].dropna()
-            if len(data_de) > 0:
-                mean_de, std_de = data_de.mean(), data_de.std()
-                ax2.hist(data_de, bins=20, density=True, alpha=0.7, edgecolor="black", label="ΔE Histogram")
-                if std_de > 0:
-                    x_de = np.linspace(mean_de - 5*std_de, mean_de + 5*std_de, 1000)
-                    ax2.plot(x_de, normal_pdf(x_de, mean_de, std_de), linewidth=3, label="Normal Distribution")
-                ax2.axvline(mean_de, linestyle="--", linewidth=2, label=f"Mean = {mean_de:.2f}")
-                ax2.set_xlabel("ΔE")
-                ax2.set_ylabel("Density")
-                ax2.set_title("ΔE Distribution")
-                ax2.legend()
-                ax2.grid(True, linestyle="--", alpha=0.4)
-                st.pyplot(fig2)
-
-            st.subheader("📊 Average Thickness Distribution")
-            data = df_plot[thickness_col].dropna()
-            if len(data) > 0:
-                mean, std = data.mean(), data.std()
-                col1, col2 = st.columns(2)
-                with col1: LSL = st.number_input("LSL", value=float(mean - 3 * std), key="bottom_lsl")
-                with col2: USL = st.number_input("USL", value=float(mean + 3 * std), key="bottom_usl")
-                
-                if LSL >= USL: 
-                    st.error("❌ LSL must be strictly smaller than USL")
+            # Các tháng có dữ liệu trong view hiện tại (đã áp bộ lọc năm/tháng ở sidebar)
+            view_periods = [(y, m) for y, m in time_index.periods(color)
+                            if (not selected_years or y in selected_years) and (not selected_months or m in selected_months)]
+            period_label = {f"{y}-{m:02d}": (y, m) for y, m in view_periods}
+
+            st.subheader("⏱ Time Filter")
+            col1, col2 = st.columns(2)
+        
+            with col1: 
+                filter_mode_bottom = st.radio("Filter by", ["Month", "Year"], horizontal=True, key="bottom_filter_mode")
+        
+            with col2:
+                # --- CẬP NHẬT LOGIC: KHÔNG CHỌN = HIỂN THỊ TẤT CẢ ---
+                if filter_mode_bottom == "Month":
+                    month_sel = st.multiselect("Select month(s) [Leave empty to show all]", list(period_label), default=[], key="bottom_month_sel")
+                    if month_sel:  # Chỉ lọc khi có tháng được chọn
+                        view_periods = [period_label[p] for p in month_sel]
                 else:
-                    fig, ax = plt.subplots(figsize=(10, 4))
-                    ax.hist(data, bins=20, density=True, alpha=0.7, edgecolor="black", label="Thickness Histogram")
-                    x = np.linspace(mean - 5 * std, mean + 5 * std, 1000)
-                    ax.plot(x, normal_pdf(x, mean, std), linewidth=3, label="Normal Distribution")
-                    ax.axvline(mean, linestyle="--", linewidth=2, color="red", label=f"Mean = {mean:.2f}")
-                    ax.axvline(LSL, linestyle="--", linewidth=2, color="green", label=f"LSL = {LSL:.2f}")
-                    ax.axvline(USL, linestyle="--", linewidth=2, color="green", label=f"USL = {USL:.2f}")
-                    ax.axvspan(LSL, USL, alpha=0.15, label="Spec Zone")
-                    ax.set_xlim(mean - 5 * std, mean + 5 * std)
-                    ax.set_xlabel("Average Thickness")
-                    ax.set_ylabel("Density")
-                    ax.grid(True, linestyle="--", alpha=0.4)
-                    ax.legend()
-                    st.pyplot(fig)
-
-            with st.expander("📋 Coil Summary Data"):
-                st.dataframe(df_plot[[coil_col, thickness_col, dE_col, dL_col, da_col, db_col, time_col]].sort_values(by=dE_col, ascending=False), use_container_width=True)
-
-            st.markdown("---")
-            st.header("🔬 PHASE II – THICKNESS CORRELATION")
-            if control_batch_code is None:
-                st.warning("⚠ Control batch not defined. Phase II cannot be determined.")
+                    year_sel = st.multiselect("Select year(s) [Leave empty to show all]", sorted({y for y, _ in view_periods}), default=[], key="bottom_year_sel")
+                    if year_sel:   # Chỉ lọc khi có năm được chọn
+                        view_periods = [(y, m) for y, m in view_periods if y in year_sel]
+            df_plot = df_raw.iloc[time_index.select(color, periods=view_periods)]
+
+            bottom_key = (filter_mode_bottom, tuple(month_sel if filter_mode_bottom == "Month" else year_sel))
+
+            if df_plot.empty:
+                st.warning("⚠️ No data available for the selected time period.")
             else:
-                df_p2 = df[(df["製造批號"] >= control_batch_code) & (df["塗料編號"] == color)].copy()
-                if df_p2.empty:
-                    st.warning("⚠ No Phase II data after filtering.")
+                st.subheader("📊 Average Thickness vs ΔE (Each Point = 1 Coil)")
+                show_chart(("thickness_scatter",) + bottom_key, partial(charts.thickness_scatter, df_plot[thickness_col], df_plot[dE_col]))
+
+                st.subheader("📈 ΔE Distribution (Per Coil)")
+                show_chart(("de_dist",) + bottom_key, partial(charts.de_distribution, df_plot[dE_col].dropna()))
+
+                st.subheader("📊 Average Thickness Distribution")
+                data = df_plot[thickness_col].dropna()
+                if len(data) > 0:
+                    mean, std = data.mean(), data.std()
+                    col1, col2 = st.columns(2)
+                    with col1: LSL = st.number_input("LSL", value=float(mean - 3 * std), key="bottom_lsl")
+                    with col2: USL = st.number_input("USL", value=float(mean + 3 * std), key="bottom_usl")
+                
+                    if LSL >= USL: 
+                        st.error("❌ LSL must be strictly smaller than USL")
+                    else:
+                        show_chart(("thickness_dist",) + bottom_key + (LSL, USL), partial(charts.thickness_distribution, data, LSL, USL))
+                        st.caption(capability_text(capability.series_capability(data, LSL, USL)) + " (per coil)")
+
+                with st.expander("📋 Coil Summary Data"):
+                    st.dataframe(df_plot[[coil_col, thickness_col, dE_col, dL_col, da_col, db_col, time_col]].sort_values(by=dE_col, ascending=False), width="stretch")
+
+                st.markdown("---")
+                st.header("🔬 PHASE II – THICKNESS CORRELATION")
+                catalog_correlation = views.get_or_compute(("thickness", data_version, limit_version),
+                    lambda: CoilCorrelation.from_rows(df_raw.iloc[phase2_positions(index, limits, all_colors)], limits))
+                if phase2_from is None:
+                    st.warning("⚠ Control batch not defined. Phase II cannot be determined.")
                 else:
-                    COLOR_FACTORS = {"ΔL": ["入料檢測 ΔL 正面", "Average value ΔL 正面"], "Δa": ["入料檢測 Δa 正面", "Average value Δa 正面"], "Δb": ["入料檢測 Δb 正面", "Average value Δb 正面"], "ΔE": ["Average value ΔE 正面"]}
-                    available_factors = {k: c for k, cols in COLOR_FACTORS.items() for c in cols if c in df_p2.columns}
-                    
-                    if not available_factors:
-                        st.warning("⚠ No color factor columns found in dataset.")
+                    p2_pos = index.batch_rows(color, phase2_from)
+                    if selected_years or selected_months: p2_pos = p2_pos[np.isin(df_raw.index[p2_pos], df.index)]
+                    if len(p2_pos) == 0:
+                        st.warning("⚠ No Phase II data after filtering.")
                     else:
-                        factor_label = st.selectbox("🎯 Select Color Factor", list(available_factors.keys()), index=0, key="bottom_color_factor")
-                        factor_col = available_factors[factor_label]
-                        coil_df = df_p2.groupby("Coil No.", as_index=False).agg({"Avergage Thickness": "mean", factor_col: "mean", "製造批號": "min"}).dropna()
-                        
-                        if coil_df.empty:
-                            st.warning("⚠ No valid coil-level data.")
+                        # Coil aggregate + fit độ dày ↔ màu của mọi màu × factor: tính 1 lần cho mỗi phiên bản dữ liệu/limit
+                        # (có lọc năm/tháng thì chỉ tính lại cho màu đang xem); đổi factor chỉ còn là tra bảng
+                        correlation = catalog_correlation if not selected_years and not selected_months else views.get_or_compute(
+                            ("thickness", data_version, limit_version, color, tuple(selected_years), tuple(selected_months)),
+                            lambda: CoilCorrelation.from_rows(df_raw.iloc[np.sort(p2_pos)], limits))
+                    
+                        if not correlation.factors:
+                            st.warning("⚠ No color factor columns found in dataset.")
                         else:
-                            lcl, ucl = safe_get_limit(color, "LINE", factor_label)
-                            ooc_mask = (coil_df[factor_col] < lcl) | (coil_df[factor_col] > ucl) if lcl is not None and ucl is not None else np.zeros(len(coil_df), dtype=bool)
-                            x, y = coil_df["Avergage Thickness"].values, coil_df[factor_col].values
-                            r2 = None
-                            
-                            if len(x) >= 2:
-                                slope, intercept = np.polyfit(x, y, 1)
-                                r2 = 1 - np.sum((y - (slope * x + intercept)) ** 2) / np.sum((y - np.mean(y)) ** 2) if np.sum((y - np.mean(y)) ** 2) != 0 else 0
-                            
-                            fig, ax = plt.subplots(figsize=(9, 6))
-                            ax.scatter(coil_df[~ooc_mask]["Avergage Thickness"], coil_df[~ooc_mask][factor_col], alpha=0.7, label="Normal Coil")
-                            if ooc_mask.any(): 
-                                ax.scatter(coil_df[ooc_mask]["Avergage Thickness"], coil_df[ooc_mask][factor_col], color="red", s=80, label="OOC Coil")
-                            if r2 is not None: 
-                                ax.plot(np.linspace(x.min(), x.max(), 100), slope * np.linspace(x.min(), x.max(), 100) + intercept, linestyle="--", linewidth=2, label=f"Regression Line (R² = {r2:.3f})")
-                            
-                            ax.set_title(f"Phase II – Per Coil Analysis\nThickness vs {factor_label}" + (f" | r = {coil_df['Avergage Thickness'].corr(coil_df[factor_col]):.3f}, R² = {r2:.3f}" if r2 is not None else ""))
-                            ax.set_xlabel("Average Thickness (per Coil)")
-                            ax.set_ylabel(factor_label)
-                            ax.legend()
-                            ax.grid(True, linestyle="--", alpha=0.4)
-                            st.pyplot(fig)
-
-                            st.markdown("### 🧠 Interpretation")
-                            # --- CORRELATION REFERENCE TABLE ---
-                            st.markdown("""
+                            factor_label = st.selectbox("🎯 Select Color Factor", list(correlation.factors.keys()), index=0, key="bottom_color_factor")
+                            coil_stats = correlation.get(color, factor_label)
+                        
+                            if coil_stats is None:
+                                st.warning("⚠ No valid coil-level data.")
+                            else:
+                                lcl, ucl = limits.get(color, "LINE", factor_label)
+                                coil_df, ooc_mask = correlation.coil_frame(color, factor_label)
+                                r2 = None if pd.isna(coil_stats["r2"]) else coil_stats["r2"]
+                                fit = (coil_stats["slope"], coil_stats["intercept"], r2) if r2 is not None else None
+                                show_chart(("coil", factor_label, lcl, ucl, phase2_from), partial(charts.coil_correlation, coil_df, correlation.factors[factor_label], factor_label, ooc_mask, fit))
+
+                                st.markdown("### 🧠 Interpretation")
+                                # --- CORRELATION REFERENCE TABLE ---
+                                st.markdown("""
                             **📊 Correlation Levels Reference:**
                             
                             | Level | Correlation Coefficient (\|R\|) | Coefficient of Determination (R²) | Interpretation |
@@ -554,550 +462,470 @@ if app_mode == "🚀 Main Dashboard":
                             | 🟠 **Moderate**| 0.55 ≤ \|R\| < 0.77 | 0.30 ≤ R² < 0.60 | Thickness partially contributes to color drift. |
                             | 🟢 **Weak/Low** | \|R\| < 0.55 | R² < 0.30 | Thickness is unlikely the main driver of color variation. |
                             """)
-                            # -----------------------------------
-
-                            if r2 is not None:
-                                if r2 >= 0.6: 
-                                    st.error("🔴 Thickness strongly explains color variation (High R²)")
-                                elif r2 >= 0.3: 
-                                    st.warning("🟠 Thickness may contribute to color drift (Moderate R²)")
+                                # -----------------------------------
+
+                                if r2 is not None:
+                                    if r2 >= 0.6: 
+                                        st.error("🔴 Thickness strongly explains color variation (High R²)")
+                                    elif r2 >= 0.3: 
+                                        st.warning("🟠 Thickness may contribute to color drift (Moderate R²)")
+                                    else: 
+                                        st.success("🟢 Thickness unlikely main driver (Low R²)")
                                 else: 
-                                    st.success("🟢 Thickness unlikely main driver (Low R²)")
-                            else: 
-                                st.info("ℹ Not enough data for regression analysis.")
-                            # --- AUTOMATED RISK ALERT (OOC CLUSTERING) ---
-                            if ooc_mask.any() and (~ooc_mask).any():
-                                thick_col = "Avergage Thickness"
-                                ooc_thick = coil_df[ooc_mask][thick_col]
-                                norm_thick = coil_df[~ooc_mask][thick_col]
-                                
-                                mean_ooc = ooc_thick.mean()
-                                q1_norm = norm_thick.quantile(0.25)
-                                q3_norm = norm_thick.quantile(0.75)
-                                
-                                if mean_ooc > q3_norm:
-                                    st.warning(f"🚨 **Automated Risk Alert:** OOC coils are noticeably clustered in the **HIGH** thickness zone (Mean OOC Thickness: {mean_ooc:.2f} > Normal Q3: {q3_norm:.2f}). Consider tightening the **Upper Specification Limit (USL)** for thickness to mitigate color drift risks.")
-                                elif mean_ooc < q1_norm:
-                                    st.warning(f"🚨 **Automated Risk Alert:** OOC coils are noticeably clustered in the **LOW** thickness zone (Mean OOC Thickness: {mean_ooc:.2f} < Normal Q1: {q1_norm:.2f}). Consider tightening the **Lower Specification Limit (LSL)** for thickness to mitigate color drift risks.")
-                            # ---------------------------------------------
-                            with st.expander("📋 Phase II – Coil Level Data"): 
-                                st.dataframe(coil_df.sort_values("製造批號"), use_container_width=True)
-# =========================================================
-# VIEW 2: LIMIT STATUS SUMMARY
-# =========================================================
-elif app_mode == "📋 Limit Status Summary":
-    st.title("📋 Limit Status Summary")
-    st.markdown("Global overview of all color codes, identifying stable processes and those requiring control limit recalculation based on SPC rules.")
-
-    st.markdown("### ⚙️ Alert Settings")
-    col_set1, col_set2 = st.columns(2)
-    with col_set1:
-        c_th = st.number_input("Consecutive OOC threshold (Rule 4):", min_value=1, max_value=10, value=2, step=1)
-    with col_set2:
-        t_th = st.number_input("Total (non-consecutive) OOC threshold:", min_value=1, max_value=20, value=5, step=1)
-
-    all_colors = sorted(df_raw["塗料編號"].dropna().unique())
-    summary_data = []
-
-    def max_consecutive_true(s):
-        if s.empty: return 0
-        return (s * (s.groupby((s != s.shift()).cumsum()).cumcount() + 1)).max()
-
-    for c in all_colors:
-        c_clean = str(c).strip()
-        mask = limit_df["Color_code"].astype(str).str.strip() == c_clean
-        row = limit_df[mask]
-        
-        status = "❌ No"
-        if not row.empty:
-            limit_cols = [col for col in row.columns if "LCL" in col or "UCL" in col]
-            if not row[limit_cols].isna().all().all():
-                status = "✅ Yes"
-
-        df_c = df_raw[df_raw["塗料編號"] == c].sort_values("Time")
-        total_batches = df_c["製造批號"].nunique()
-        can_calc_initial = "✅ Yes" if total_batches >= 3 else "❌ No"
-        
-        cb = get_control_batch(c)
-        cb_code = get_control_batch_code(df_c, cb)
-        recalc_status = "❌ Not Enough Data"
-        phase2_batches = 0
-        
-        if cb_code is not None:
-            df_p2 = df_c[df_c["製造批號"] >= cb_code]
-            phase2_batches = df_p2["製造批號"].nunique()
-            
-            if phase2_batches >= 3:
-                if status == "✅ Yes":
-                    max_consec_any_chart, max_total_any_chart = 0, 0
-                    spc_p2 = calculate_batch_averages(df_p2)
-                    
-                    for f in ["ΔL", "Δa", "Δb"]:
-                        for source in ["line", "lab"]:
-                            lcl, ucl = safe_get_limit(c, source, f)
-                            if lcl is not None and ucl is not None:
-                                vals = spc_p2[f][source]["value"]
-                                mask_val = (vals < lcl) | (vals > ucl)
-                                consec, total_ooc = max_consecutive_true(mask_val), mask_val.sum()
-                                if consec > max_consec_any_chart: max_consec_any_chart = consec
-                                if total_ooc > max_total_any_chart: max_total_any_chart = total_ooc
-                    
-                    if max_consec_any_chart >= c_th: 
-                        recalc_status = f"⚠️ Propose Recalc ({max_consec_any_chart} Consec. OOCs)"
-                    elif max_total_any_chart >= t_th: 
-                        recalc_status = f"⚠️ Propose Recalc ({max_total_any_chart} Total OOCs)"
-                    else: 
-                        recalc_status = f"✅ Stable (Max Consec: {max_consec_any_chart}, Total: {max_total_any_chart})"
-                else: 
-                    recalc_status = "❌ Missing Current Limits"
-            
-        summary_data.append({
-            "Color Code": c, 
-            "Total Batches": total_batches, 
-            "Phase II Batches": phase2_batches,
-            "Current Limits": status, 
-            "Ready for Calc (Total)": can_calc_initial, 
-            "Recommend Recalc (Phase II)": recalc_status
-        })
-
-    summary_df = pd.DataFrame(summary_data)
-    total_c = len(summary_df)
-    has_limit_c = len(summary_df[summary_df["Current Limits"] == "✅ Yes"])
-    ready_initial_c = len(summary_df[summary_df["Ready for Calc (Total)"] == "✅ Yes"])
-    needs_recalc_c = sum(1 for d in summary_data if "⚠️ Propose Recalc" in d["Recommend Recalc (Phase II)"])
-
-    col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Total Colors", total_c)
-    col2.metric("Colors Configured", has_limit_c)
-    col3.metric("Ready to Calc (Initial)", ready_initial_c)
-    col4.metric("Needs Recalculation", needs_recalc_c, delta="Process Shift Alert", delta_color="inverse")
-
-    st.markdown("---")
-    st.markdown("### 📊 Comprehensive Status Table")
-    st.dataframe(summary_df, use_container_width=True, hide_index=True)
-
+                                    st.info("ℹ Not enough data for regression analysis.")
+                                # --- AUTOMATED RISK ALERT (OOC CLUSTERING) ---
+                                mean_ooc, q1_norm, q3_norm = coil_stats["ooc_thickness"], coil_stats["normal_q1"], coil_stats["normal_q3"]
+                                if coil_stats["risk"] in ("HIGH", "LOW"):
+                                    if coil_stats["risk"] == "HIGH":
+                                        st.warning(f"🚨 **Automated Risk Alert:** OOC coils are noticeably clustered in the **HIGH** thickness zone (Mean OOC Thickness: {mean_ooc:.2f} > Normal Q3: {q3_norm:.2f}). Consider tightening the **Upper Specification Limit (USL)** for thickness to mitigate color drift risks.")
+                                    else:
+                                        st.warning(f"🚨 **Automated Risk Alert:** OOC coils are noticeably clustered in the **LOW** thickness zone (Mean OOC Thickness: {mean_ooc:.2f} < Normal Q1: {q1_norm:.2f}). Consider tightening the **Lower Specification Limit (LSL)** for thickness to mitigate color drift risks.")
+                                # ---------------------------------------------
+                                with st.expander("📋 Phase II – Coil Level Data"): 
+                                    st.dataframe(coil_df.sort_values("製造批號"), width="stretch")
+
+                with st.expander("🏷 Thickness-sensitive colors – catalog ranking (Phase II, by R²)"):
+                    ranking = catalog_correlation.ranking()
+                    st.dataframe(ranking, hide_index=True, width="stretch")
+                    st.download_button("📥 Download CSV", ranking.to_csv(index=False).encode("utf-8-sig"), "thickness_ranking.csv", "text/csv", key="dl_thickness_ranking")
     # =========================================================
+    # VIEW 2: LIMIT STATUS SUMMARY
     # =========================================================
-    # NEW SECTION: ACTION REQUIRED (MISSING LIMITS)
-    # =========================================================
-    st.markdown("---")
-    st.markdown("### 🚨 Action Required: Missing Limits")
-    st.markdown("The following colors do not have configured control limits but have enough data (≥ 3 batches). Please navigate to **🎛️ Control Limit Calculator** (View 3) to configure them.")
+    elif app_mode == "📋 Limit Status Summary":
+        st.title("📋 Limit Status Summary")
+        st.markdown("Global overview of all color codes, identifying stable processes and those requiring control limit recalculation based on SPC rules.")
+
+        st.markdown("### ⚙️ Alert Settings")
+        col_set1, col_set2 = st.columns(2)
+        with col_set1:
+            c_th = st.number_input("Consecutive OOC threshold (Rule 4):", min_value=1, max_value=10, value=2, step=1)
+        with col_set2:
+            t_th = st.number_input("Total (non-consecutive) OOC threshold:", min_value=1, max_value=20, value=5, step=1)
+
+        summary_df = limit_status_summary(batch_cube, limits, all_colors, c_th, t_th, workers=STATUS_WORKERS, executor=STATUS_EXECUTOR)
+        total_c = len(summary_df)
+        has_limit_c = len(summary_df[summary_df["Current Limits"] == "✅ Yes"])
+        ready_initial_c = len(summary_df[summary_df["Ready for Calc (Total)"] == "✅ Yes"])
+        needs_recalc_c = int(summary_df["Recommend Recalc (Phase II)"].str.contains("⚠️ Propose Recalc", regex=False).sum())
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Total Colors", total_c)
+        col2.metric("Colors Configured", has_limit_c)
+        col3.metric("Ready to Calc (Initial)", ready_initial_c)
+        col4.metric("Needs Recalculation", needs_recalc_c, delta="Process Shift Alert", delta_color="inverse")
+
+        st.markdown("---")
+        st.markdown("### 📊 Comprehensive Status Table")
+        st.dataframe(summary_df, width="stretch", hide_index=True)
+
+        # =========================================================
+        # =========================================================
+        # NEW SECTION: ACTION REQUIRED (MISSING LIMITS)
+        # =========================================================
+        st.markdown("---")
+        st.markdown("### 🚨 Action Required: Missing Limits")
+        st.markdown("The following colors do not have configured control limits but have enough data (≥ 3 batches). Please navigate to **🎛️ Control Limit Calculator** (View 3) to configure them.")
     
-    # Lọc ra những màu chưa có Limit VÀ đã đủ dữ liệu để tính
-    pending_colors = summary_df[
-        (summary_df["Current Limits"] == "❌ No") & 
-        (summary_df["Ready for Calc (Total)"] == "✅ Yes")
-    ]
+        # Lọc ra những màu chưa có Limit VÀ đã đủ dữ liệu để tính
+        pending_colors = summary_df[
+            (summary_df["Current Limits"] == "❌ No") & 
+            (summary_df["Ready for Calc (Total)"] == "✅ Yes")
+        ]
     
-    if not pending_colors.empty:
-        st.warning(f"Found **{len(pending_colors)}** color(s) waiting for limit calculation:")
+        if not pending_colors.empty:
+            st.warning(f"Found **{len(pending_colors)}** color(s) waiting for limit calculation:")
         
-        # Tạo cột tỷ lệ 1:2 để bảng chỉ chiếm 1/3 màn hình bên trái, nhìn sẽ cân đối và sang hơn
-        col_table, col_empty = st.columns([1, 2])
-        with col_table:
-            st.dataframe(
-                pending_colors[["Color Code", "Total Batches"]], 
-                hide_index=True,           # Ẩn cột index 0, 1, 2...
-                use_container_width=True   # Trải đều độ rộng lấp đầy không gian cột 1
-            )
-    else:
-        st.success("🎉 All colors with sufficient data already have their control limits configured!")
+            # Tạo cột tỷ lệ 1:2 để bảng chỉ chiếm 1/3 màn hình bên trái, nhìn sẽ cân đối và sang hơn
+            col_table, col_empty = st.columns([1, 2])
+            with col_table:
+                st.dataframe(
+                    pending_colors[["Color Code", "Total Batches"]], 
+                    hide_index=True,           # Ẩn cột index 0, 1, 2...
+                    width="stretch"   # Trải đều độ rộng lấp đầy không gian cột 1
+                )
+        else:
+            st.success("🎉 All colors with sufficient data already have their control limits configured!")
+
+        # =========================================================
+        # PROCESS CAPABILITY (ALL COLORS)
+        # =========================================================
+        st.markdown("---")
+        st.markdown("### 📐 Process Capability – All Colors")
+        st.markdown("Cp / Cpk use the within-process σ (moving range of consecutive batch means), Pp / Ppk the overall σ, against the LCL / UCL of the limit sheet (thickness: optional *Thickness LSL / USL* columns). Click a column header to sort.")
+        # Tính 1 lần cho mỗi phiên bản dữ liệu + limit (mọi màu × nguồn × yếu tố), dùng chung cho mọi phiên
+        cap_df = views.get_or_compute(("capability", data_version, limit_version), lambda: capability.catalog(batch_cube, limits, all_colors))
+        col_cs, col_cl, col_co = st.columns(3)
+        with col_cs:
+            cap_sources = st.multiselect("Source (Leave empty for ALL)", ["LINE", "LAB", "THICKNESS"], default=[], key="cap_sources")
+        with col_cl:
+            cap_levels = st.multiselect("Level (Leave empty for ALL)", ["❌ Not capable", "⚠️ Marginal", "✅ Capable"], default=[], key="cap_levels")
+        with col_co:
+            cap_spec_only = st.checkbox("Only series with spec limits", value=True, key="cap_spec_only")
+        cap_view = cap_df
+        if cap_sources: cap_view = cap_view[cap_view["Source"].isin(cap_sources)]
+        if cap_levels: cap_view = cap_view[cap_view["Level"].isin(cap_levels)]
+        if cap_spec_only: cap_view = cap_view[cap_view["LSL"].notna() | cap_view["USL"].notna()]
+
+        col1, col2, col3 = st.columns(3)
+        col1.metric("✅ Capable (Cpk ≥ 1.33)", int((cap_view["Level"] == "✅ Capable").sum()))
+        col2.metric("⚠️ Marginal (1.00–1.33)", int((cap_view["Level"] == "⚠️ Marginal").sum()))
+        col3.metric("❌ Not capable (Cpk < 1.00)", int((cap_view["Level"] == "❌ Not capable").sum()))
+        st.dataframe(cap_view, hide_index=True, width="stretch", column_config={
+            **{c: st.column_config.NumberColumn(c, format="%.3f") for c in ["Mean", "σ Within", "σ Overall", "LSL", "USL"]},
+            **{c: st.column_config.NumberColumn(c, format="%.2f") for c in ["Cp", "Cpk", "Pp", "Ppk"]},
+            "Expected ppm": st.column_config.NumberColumn("Expected ppm", format="%.0f"),
+        })
+        st.download_button("📥 Download CSV", cap_view.to_csv(index=False).encode("utf-8-sig"), "capability.csv", "text/csv", key="dl_capability")
 
-# =========================================================
-# VIEW 3: CONTROL LIMIT CALCULATOR
-# =========================================================
-elif app_mode == "🎛️ Control Limit Calculator":
+    # =========================================================
+    # VIEW 3: CONTROL LIMIT CALCULATOR
+    # =========================================================
+    elif app_mode == "🎛️ Control Limit Calculator":
     
-    st.title("🎛️ Control Limits Analysis & Derived ΔE")
+        st.title("🎛️ Control Limits Analysis & Derived ΔE")
     
-    with st.expander("⚙️ Data Source Settings", expanded=True):
-        st.markdown("**Select Data Source:**")
-        calc_source = st.radio("Data Source", ["LINE", "LAB"], horizontal=True)
+        with st.expander("⚙️ Data Source Settings", expanded=True):
+            st.markdown("**Select Data Source:**")
+            calc_source = st.radio("Data Source", ["LINE", "LAB"], horizontal=True)
+            col_bn, col_bs = st.columns(2)
+            n_boot = col_bn.number_input("🎲 Bootstrap resamples (0 = off)", min_value=0, max_value=20000, value=2000, step=500)
+            boot_seed = col_bs.number_input("🎲 Bootstrap seed", min_value=0, value=0, step=1)
         
-    # Placeholder để đẩy bảng so sánh 2 phương pháp lên đầu trang
-    result_placeholder = st.empty()
-    st.markdown("---")
+        # Placeholder để đẩy bảng so sánh 2 phương pháp lên đầu trang
+        result_placeholder = st.empty()
+        st.markdown("---")
 
-    factors = ["ΔL", "Δa", "Δb"]
-    calc_res = {}
-    
-    # Khởi tạo 2 biến để tính tổng bình phương cho 2 phương pháp
-    dE_std_sq, dE_iqr_sq = 0, 0
-
-    for f in factors:
-        st.markdown(f"### 📊 Analysis: **{f}** ({calc_source})")
+        factors = ["ΔL", "Δa", "Δb"]
+        calc_res = {}
+        calc_key = (data_version, color, tuple(selected_years), tuple(selected_months), calc_source)
+        # μ, σ, Q1/Q3 và điểm outlier đã sort của từng series tính 1 lần → đổi K/k chỉ còn vài phép nhân
+        calc = views.get_or_compute(("calculator",) + calc_key, lambda: LimitCalculator.from_series(spc_data, calc_source))
+        # Bootstrap resample 1 lần theo (dữ liệu, số lần, seed); đổi K/k chỉ tính lại trên các mảng đã resample
+        boot = views.get_or_compute(("calculator_boot",) + calc_key + (n_boot, boot_seed), lambda: resample(calc, n_boot, boot_seed)) if n_boot else None
+        sigmas, iqr_ks = {}, {}
+
+        for f in factors:
+            st.markdown(f"### 📊 Analysis: **{f}** ({calc_source})")
         
-        col_sig, col_iqr = st.columns(2)
-        with col_sig:
-            sig = st.number_input(f"🔸 Sigma (K) for {f}", value=3.0, step=0.1, key=f"sig_{f}")
-        with col_iqr:
-            iqr_k = st.number_input(f"🔸 IQR Sens. for {f}", value=1.5, step=0.1, key=f"iqr_{f}")
+            col_sig, col_iqr = st.columns(2)
+            with col_sig:
+                sig = st.number_input(f"🔸 Sigma (K) for {f}", value=3.0, step=0.1, key=f"sig_{f}")
+            with col_iqr:
+                iqr_k = st.number_input(f"🔸 IQR Sens. for {f}", value=1.5, step=0.1, key=f"iqr_{f}")
+            sigmas[f], iqr_ks[f] = sig, iqr_k
         
-        d = spc_data[f][calc_source.lower()]["value"]
+            fs = calc.stats[f]
         
-        if len(d) >= 3:
-            m, s = d.mean(), d.std()
-            q1, q3 = d.quantile(0.25), d.quantile(0.75)
-            olcl, oucl = safe_get_limit(color, calc_source, f)
-            
-            std_lcl, std_ucl = m - sig*s, m + sig*s
-            iqr_lcl, iqr_ucl = q1 - iqr_k*(q3-q1), q3 + iqr_k*(q3-q1)
-            
-            calc_res[f] = {
-                "data": d, "batch": spc_data[f][calc_source.lower()]["製造批號"], "m": m, "s": s, "median": d.median(),
-                "sig": sig, "iqr_k": iqr_k, "olcl": olcl, "oucl": oucl, "std_lcl": std_lcl, "std_ucl": std_ucl, "iqr_lcl": iqr_lcl, "iqr_ucl": iqr_ucl
-            }
+            if fs.n >= 3:
+                olcl, oucl = limits.get(color, calc_source, f)
+                std_lcl, std_ucl, iqr_lcl, iqr_ucl = fs.limits(sig, iqr_k)
             
-            # Tính max bình phương cho từng phương pháp độc lập
-            dE_std_sq += max(abs(std_lcl), abs(std_ucl))**2
-            dE_iqr_sq += max(abs(iqr_lcl), abs(iqr_ucl))**2
+                calc_res[f] = {
+                    "n": fs.n, "m": fs.mean, "s": fs.std, "median": fs.median,
+                    "sig": sig, "iqr_k": iqr_k, "olcl": olcl, "oucl": oucl, "std_lcl": std_lcl, "std_ucl": std_ucl, "iqr_lcl": iqr_lcl, "iqr_ucl": iqr_ucl
+                }
 
-            col_chart, col_table = st.columns([2.2, 1])
-            res = calc_res[f]
+                col_chart, col_table = st.columns([2.2, 1])
+                res = calc_res[f]
             
-            with col_table:
-                olcl_str = f"{res['olcl']:.3f}" if pd.notnull(res['olcl']) else "None"
-                oucl_str = f"{res['oucl']:.3f}" if pd.notnull(res['oucl']) else "None"
+                with col_table:
+                    olcl_str = f"{res['olcl']:.3f}" if pd.notnull(res['olcl']) else "None"
+                    oucl_str = f"{res['oucl']:.3f}" if pd.notnull(res['oucl']) else "None"
+                    # Khoảng tin cậy 95% (bootstrap) của Std LCL, Std UCL, IQR LCL, IQR UCL
+                    ci = [f"{lo:.3f} – {hi:.3f}" for lo, hi in (percentile_interval(v) for v in boot.stats[f].limits(sig, iqr_k))] if boot else ["-"] * 4
                 
-                df_table = pd.DataFrame([
-                    {"Method": "0. Spec (Sheet)", "Min": olcl_str, "Max": oucl_str, "Center": "-", "Note": "Current Target"},
-                    {"Method": f"1. Standard ({res['sig']}σ)", "Min": f"{res['std_lcl']:.3f}", "Max": f"{res['std_ucl']:.3f}", "Center": f"{res['m']:.3f}", "Note": "Basic Stats"},
-                    {"Method": f"2. IQR (k={res['iqr_k']})", "Min": f"{res['iqr_lcl']:.3f}", "Max": f"{res['iqr_ucl']:.3f}", "Center": f"{res['median']:.3f}", "Note": "Filtered"}
-                ])
-                st.dataframe(df_table, hide_index=True, use_container_width=True)
-                st.info(f"**Stats:** μ={res['m']:.3f} | σ={res['s']:.3f} | n={len(res['data'])}")
-
-            with col_chart:
-                fig, ax = plt.subplots(figsize=(10, 4.5))
-                ax.plot(res["batch"], res["data"], "o-", color="#808080", alpha=0.5, label="Process Data")
-                if pd.notnull(res["olcl"]):
-                    ax.axhline(res["olcl"], color="black", linestyle="-", linewidth=1.5, label="0. Spec")
-                    ax.axhline(res["oucl"], color="black", linestyle="-", linewidth=1.5)
-                ax.axhline(res["std_lcl"], color="#d62728", linestyle="--", linewidth=1.5, label=f"1. Std (±{res['sig']}σ)")
-                ax.axhline(res["std_ucl"], color="#d62728", linestyle="--", linewidth=1.5)
-                ax.axhline(res["iqr_lcl"], color="#1f77b4", linestyle=":", linewidth=2, label=f"2. IQR (k={res['iqr_k']})")
-                ax.axhline(res["iqr_ucl"], color="#1f77b4", linestyle=":", linewidth=2)
-                ax.axhline(res["m"], color="#2ca02c", linestyle="-.", alpha=0.5, label="Mean")
-                ax.legend(loc="center left", bbox_to_anchor=(1.02, 0.5), fontsize=9)
-                ax.grid(True, alpha=0.3)
-                plt.xticks(rotation=45)
-                fig.subplots_adjust(right=0.75, bottom=0.2)
-                st.pyplot(fig)
-                plt.close(fig)
-            st.markdown("---")
-        else:
-            st.warning(f"Not enough data for {f} (min 3 batches).")
+                    df_table = pd.DataFrame([
+                        {"Method": "0. Spec (Sheet)", "Min": olcl_str, "Max": oucl_str, "Center": "-", "Note": "Current Target", "Min 95% CI": "-", "Max 95% CI": "-"},
+                        {"Method": f"1. Standard ({res['sig']}σ)", "Min": f"{res['std_lcl']:.3f}", "Max": f"{res['std_ucl']:.3f}", "Center": f"{res['m']:.3f}", "Note": "Basic Stats", "Min 95% CI": ci[0], "Max 95% CI": ci[1]},
+                        {"Method": f"2. IQR (k={res['iqr_k']})", "Min": f"{res['iqr_lcl']:.3f}", "Max": f"{res['iqr_ucl']:.3f}", "Center": f"{res['median']:.3f}", "Note": "Filtered", "Min 95% CI": ci[2], "Max 95% CI": ci[3]}
+                    ])
+                    st.dataframe(df_table, hide_index=True, width="stretch")
+                    st.info(f"**Stats:** μ={res['m']:.3f} | σ={res['s']:.3f} | n={res['n']}")
 
-    # --- ĐIỀN KẾT QUẢ VÀO PLACEHOLDER Ở ĐẦU TRANG CHO CẢ 2 PHƯƠNG PHÁP ---
-    if len(calc_res) == 3:
-        # Căn bậc 2 để ra giá trị ΔE cuối cùng
-        dE_std = math.sqrt(dE_std_sq)
-        dE_iqr = math.sqrt(dE_iqr_sq)
-        
-        # Mốc đánh giá tùy theo LINE hay LAB
-        limit_threshold = 1.0 if calc_source.upper() == "LINE" else 0.5
-        
-        with result_placeholder.container():
-            st.markdown("### 🎯 Derived ΔE UCL Comparison")
-            col_res1, col_res2 = st.columns(2)
-            
-            # Hiển thị kết quả Method 1 (Standard)
-            with col_res1:
-                if dE_std <= limit_threshold: 
-                    st.success(f"**Method 1 (Standard)** ΔE UCL: **{dE_std:.3f}** (✅ ≤ {limit_threshold})")
-                else: 
-                    st.error(f"**Method 1 (Standard)** ΔE UCL: **{dE_std:.3f}** (⚠️ > {limit_threshold})")
-                    
-            # Hiển thị kết quả Method 2 (IQR)
-            with col_res2:
-                if dE_iqr <= limit_threshold: 
-                    st.success(f"**Method 2 (IQR)** ΔE UCL: **{dE_iqr:.3f}** (✅ ≤ {limit_threshold})")
-                else: 
-                    st.error(f"**Method 2 (IQR)** ΔE UCL: **{dE_iqr:.3f}** (⚠️ > {limit_threshold})")
-# --- ĐIỀN KẾT QUẢ VÀO PLACEHOLDER Ở ĐẦU TRANG CHO CẢ 2 PHƯƠNG PHÁP ---
-    if len(calc_res) == 3:
-        # Căn bậc 2 để ra giá trị ΔE cuối cùng
-        dE_std = math.sqrt(dE_std_sq)
-        dE_iqr = math.sqrt(dE_iqr_sq)
+                with col_chart:
+                    # Chart nền (data, spec, mean) render 1 lần; chỉ vẽ lại 2 cặp đường limit lên bản sao pixel.
+                    # Trục y làm tròn theo bước = biên độ data → chỉ render lại nền khi limit vượt ra ngoài
+                    spec = (olcl, oucl) if pd.notnull(olcl) and pd.notnull(oucl) else None
+                    span = [fs.sorted[0], fs.sorted[-1], std_lcl, std_ucl, iqr_lcl, iqr_ucl] + (list(spec) if spec else [])
+                    ylim = charts.snap_range(min(span), max(span), fs.sorted[-1] - fs.sorted[0])
+                    series = spc_data[f][calc_source.lower()]
+                    base = views.get_or_compute(("calculator_base",) + calc_key + (f, spec, ylim), lambda: BaseImage.from_figure(charts.limit_base(series["製造批號"], series["value"], spec, fs.mean, ylim)))
+                    st.image(base.hlines([
+                        (y, charts.STD_LINE["color"], 2, (6, 3)) for y in (std_lcl, std_ucl)
+                    ] + [
+                        (y, charts.IQR_LINE["color"], 3, (3, 3)) for y in (iqr_lcl, iqr_ucl)
+                    ]), width="stretch")
+                st.markdown("---")
+            else:
+                st.warning(f"Not enough data for {f} (min 3 batches).")
+        trace.lap("calculator.factors")
+
+        # --- ĐIỀN KẾT QUẢ VÀO PLACEHOLDER Ở ĐẦU TRANG CHO CẢ 2 PHƯƠNG PHÁP ---
+        if len(calc_res) == 3:
+            # Căn bậc 2 để ra giá trị ΔE cuối cùng
+            dE_std, dE_iqr = calc.derived_de(sigmas, iqr_ks)
+            boot_ci = intervals(calc, boot, sigmas, iqr_ks, calc_source).set_index("Quantity") if boot else None
+            def ci_text(q):
+                return f" · 95% CI {boot_ci.at[q, 'Lower']:.3f} – {boot_ci.at[q, 'Upper']:.3f}" if boot_ci is not None else ""
         
-        # Mốc đánh giá tùy theo LINE hay LAB
-        limit_threshold = 1.0 if calc_source.upper() == "LINE" else 0.5
+            # Mốc đánh giá tùy theo LINE hay LAB
+            limit_threshold = DE_TARGET[calc_source]
         
-        with result_placeholder.container():
-            st.markdown("### 🎯 Derived ΔE UCL Comparison")
-            col_res1, col_res2 = st.columns(2)
+            with result_placeholder.container():
+                st.markdown("### 🎯 Derived ΔE UCL Comparison")
+                col_res1, col_res2 = st.columns(2)
             
-            # Hiển thị kết quả Method 1 (Standard)
-            with col_res1:
-                if dE_std <= limit_threshold: 
-                    st.success(f"**Method 1 (Standard)** ΔE UCL: **{dE_std:.3f}** (✅ ≤ {limit_threshold})")
-                else: 
-                    st.error(f"**Method 1 (Standard)** ΔE UCL: **{dE_std:.3f}** (⚠️ > {limit_threshold})")
+                # Hiển thị kết quả Method 1 (Standard)
+                with col_res1:
+                    if dE_std <= limit_threshold: 
+                        st.success(f"**Method 1 (Standard)** ΔE UCL: **{dE_std:.3f}**{ci_text('ΔE UCL (Standard)')} (✅ ≤ {limit_threshold})")
+                    else: 
+                        st.error(f"**Method 1 (Standard)** ΔE UCL: **{dE_std:.3f}**{ci_text('ΔE UCL (Standard)')} (⚠️ > {limit_threshold})")
                     
-            # Hiển thị kết quả Method 2 (IQR)
-            with col_res2:
-                if dE_iqr <= limit_threshold: 
-                    st.success(f"**Method 2 (IQR)** ΔE UCL: **{dE_iqr:.3f}** (✅ ≤ {limit_threshold})")
-                else: 
-                    st.error(f"**Method 2 (IQR)** ΔE UCL: **{dE_iqr:.3f}** (⚠️ > {limit_threshold})")
-
-            # =========================================================
-           # =========================================================
-          # =========================================================
-            # NEW: AI TOLERANCE RECOMMENDATION (PRACTICAL ADAPTIVE)
-            # =========================================================
-            st.markdown("---")
-            st.markdown("### 💡 AI Tolerance Recommendation")
+                # Hiển thị kết quả Method 2 (IQR)
+                with col_res2:
+                    if dE_iqr <= limit_threshold: 
+                        st.success(f"**Method 2 (IQR)** ΔE UCL: **{dE_iqr:.3f}**{ci_text('ΔE UCL (IQR)')} (✅ ≤ {limit_threshold})")
+                    else: 
+                        st.error(f"**Method 2 (IQR)** ΔE UCL: **{dE_iqr:.3f}**{ci_text('ΔE UCL (IQR)')} (⚠️ > {limit_threshold})")
+
+                # =========================================================
+               # =========================================================
+              # =========================================================
+                # NEW: AI TOLERANCE RECOMMENDATION (PRACTICAL ADAPTIVE)
+                # =========================================================
+                st.markdown("---")
+                st.markdown("### 💡 AI Tolerance Recommendation")
             
-            # Lấy độ lệch chuẩn (s) của từng yếu tố từ data thực tế
-            s_L = calc_res["ΔL"]['s']
-            s_a = calc_res["Δa"]['s']
-            s_b = calc_res["Δb"]['s']
-            var_sum = s_L**2 + s_a**2 + s_b**2
+                # Lấy độ lệch chuẩn (s) của từng yếu tố từ data thực tế
+                var_sum = sum(calc_res[f]['s']**2 for f in factors)
             
-            if var_sum > 0:
-                # Mức trần thị giác (Visual Cap) không cho phép vượt qua
-                visual_cap = 0.600 if calc_source.upper() == "LINE" else 0.350
+                if var_sum > 0:
+                    # Biến động thực tế 3-Sigma; dung sai đề xuất bị chặn ở mức trần thị giác (Visual Cap)
+                    tol = tolerance({f: calc_res[f]['s'] for f in factors}, limit_threshold, VISUAL_CAP[calc_source])
+                    proc_dE = tol["process_de"]
                 
-                # Biến động thực tế của dây chuyền (3-Sigma)
-                proc_L = 3 * s_L
-                proc_a = 3 * s_a
-                proc_b = 3 * s_b
-                proc_dE = math.sqrt(proc_L**2 + proc_a**2 + proc_b**2)
+                    def tol_ci(f):
+                        return f"\n\n95% CI ± {boot_ci.at[f + ' Recommended ±', 'Lower']:.3f} – {boot_ci.at[f + ' Recommended ±', 'Upper']:.3f}" if boot_ci is not None else ""
                 
-                col_rl, col_ra, col_rb = st.columns(3)
+                    cols = dict(zip(factors, st.columns(3)))
                 
-                if proc_dE <= limit_threshold:
-                    # ---------------------------------------------------------
-                    # TÌNH HUỐNG 1: MÁY CHẠY RẤT ỔN ĐỊNH (CAPABLE)
-                    # ---------------------------------------------------------
-                    st.success(f"🌟 **Process Capable!** Your natural 3σ variation yields ΔE = **{proc_dE:.3f}** (≤ {limit_threshold}). The system mathematically expands your limits to give production the maximum safe tolerance.")
+                    if tol["capable"]:
+                        # ---------------------------------------------------------
+                        # TÌNH HUỐNG 1: MÁY CHẠY RẤT ỔN ĐỊNH (CAPABLE) → nới rộng dung sai an toàn
+                        # ---------------------------------------------------------
+                        st.success(f"🌟 **Process Capable!** Your natural 3σ variation yields ΔE = **{proc_dE:.3f}**{ci_text('Process ΔE (3σ)')} (≤ {limit_threshold}). The system mathematically expands your limits to give production the maximum safe tolerance.")
                     
-                    # Nới rộng dung sai an toàn
-                    M = limit_threshold / math.sqrt(var_sum)
-                    math_L, math_a, math_b = M * s_L, M * s_a, M * s_b
+                        for f in factors:
+                            if tol["capped"][f]:
+                                cols[f].info(f"**{f} Max Limit:**\n### ± {tol['limit'][f]:.3f}\n*(Capped from {tol['raw'][f]:.3f} to protect vision)*{tol_ci(f)}")
+                            else:
+                                cols[f].success(f"**{f} Max Limit:**\n### ± {tol['limit'][f]:.3f}\n*(Safe & Optimal)*{tol_ci(f)}")
                     
-                    def get_optimal(math_val, cap_val):
-                        return min(math_val, cap_val), math_val > cap_val
+                    else:
+                        # ---------------------------------------------------------
+                        # TÌNH HUỐNG 2: MÁY DAO ĐỘNG LỚN (INCAPABLE) -> THỰC TẾ HÓA
+                        # ---------------------------------------------------------
+                        st.warning(f"⚠️ **Strict Spec Unrealistic!** Your process natural 3σ yields ΔE = **{proc_dE:.3f}**{ci_text('Process ΔE (3σ)')} (> {limit_threshold}). Forcing strict specs will cause false alarms. Below are the **Practical Limits** adapting to your actual machine capability:")
                     
-                    rec_L, cap_L = get_optimal(math_L, visual_cap)
-                    rec_a, cap_a = get_optimal(math_a, visual_cap)
-                    rec_b, cap_b = get_optimal(math_b, visual_cap)
+                        # Chấp nhận dung sai bằng 3 Sigma thực tế (nhưng không được vượt mức trần thị giác)
+                        for f in factors:
+                            if tol["capped"][f]:
+                                cols[f].error(f"**{f} Practical Limit:**\n### ± {tol['limit'][f]:.3f}\n*(Hard capped from 3σ={tol['raw'][f]:.3f} to prevent hue shift)*{tol_ci(f)}")
+                            else:
+                                cols[f].warning(f"**{f} Practical Limit:**\n### ± {tol['limit'][f]:.3f}\n*(Based on actual 3σ)*{tol_ci(f)}")
                     
-                    def render_card(col, label, val, is_capped, orig_val):
-                        if is_capped:
-                            col.info(f"**{label} Max Limit:**\n### ± {val:.3f}\n*(Capped from {orig_val:.3f} to protect vision)*")
-                        else:
-                            col.success(f"**{label} Max Limit:**\n### ± {val:.3f}\n*(Safe & Optimal)*")
-
-                    render_card(col_rl, "ΔL", rec_L, cap_L, math_L)
-                    render_card(col_ra, "Δa", rec_a, cap_a, math_a)
-                    render_card(col_rb, "Δb", rec_b, cap_b, math_b)
+                        # Tính lại dE thực tế sau khi áp dụng giới hạn này
+                        st.caption(f"🎯 *Note: By applying these practical limits, your expected ΔE UCL will be ~**{tol['de']:.3f}**{ci_text('ΔE of recommended limits')}. To bring this down to {limit_threshold}, you must fundamentally reduce machine fluctuation.*")
                     
                 else:
-                    # ---------------------------------------------------------
-                    # TÌNH HUỐNG 2: MÁY DAO ĐỘNG LỚN (INCAPABLE) -> THỰC TẾ HÓA
-                    # ---------------------------------------------------------
-                    st.warning(f"⚠️ **Strict Spec Unrealistic!** Your process natural 3σ yields ΔE = **{proc_dE:.3f}** (> {limit_threshold}). Forcing strict specs will cause false alarms. Below are the **Practical Limits** adapting to your actual machine capability:")
-                    
-                    def get_practical(proc_val, cap_val):
-                        return min(proc_val, cap_val), proc_val > cap_val
-                    
-                    # Chấp nhận dung sai bằng 3 Sigma thực tế (nhưng không được vượt mức trần thị giác)
-                    rec_L, cap_L = get_practical(proc_L, visual_cap)
-                    rec_a, cap_a = get_practical(proc_a, visual_cap)
-                    rec_b, cap_b = get_practical(proc_b, visual_cap)
-                    
-                    def render_practical_card(col, label, val, is_capped, orig_val):
-                        if is_capped:
-                            col.error(f"**{label} Practical Limit:**\n### ± {val:.3f}\n*(Hard capped from 3σ={orig_val:.3f} to prevent hue shift)*")
-                        else:
-                            col.warning(f"**{label} Practical Limit:**\n### ± {val:.3f}\n*(Based on actual 3σ)*")
-
-                    render_practical_card(col_rl, "ΔL", rec_L, cap_L, proc_L)
-                    render_practical_card(col_ra, "Δa", rec_a, cap_a, proc_a)
-                    render_practical_card(col_rb, "Δb", rec_b, cap_b, proc_b)
-                    
-                    # Tính lại dE thực tế sau khi áp dụng giới hạn này
-                    prac_dE = math.sqrt(rec_L**2 + rec_a**2 + rec_b**2)
-                    st.caption(f"🎯 *Note: By applying these practical limits, your expected ΔE UCL will be ~**{prac_dE:.3f}**. To bring this down to {limit_threshold}, you must fundamentally reduce machine fluctuation.*")
-                    
-            else:
-                st.warning("Data variance is zero. Cannot generate recommendations.")
-# =========================================================
-    # MANUAL ΔE CALCULATOR (Bottom Section)
-    # =========================================================
-    st.markdown("---")
-    st.subheader("🧮 Manual ΔE Calculator")
-    st.markdown("Enter custom values for ΔL, Δa, and Δb to calculate the resulting overall color difference (ΔE).")
+                    st.warning("Data variance is zero. Cannot generate recommendations.")
+        if len(calc_res) == 3 and boot_ci is not None:
+            with st.expander("🎲 Bootstrap confidence intervals", expanded=False):
+                st.caption(f"{n_boot} resamples of the batches, ΔL / Δa / Δb kept paired (seed {boot_seed}), percentile intervals at 95 %.")
+                st.dataframe(boot_ci.reset_index(), hide_index=True, width="stretch")
+                st.download_button("📥 Download CSV", boot_ci.reset_index().to_csv(index=False).encode("utf-8-sig"), f"limit_intervals_{color}_{calc_source}.csv", "text/csv", key="dl_limit_intervals")
+        trace.lap("calculator.bootstrap")
+
+        # =========================================================
+        # K / k SWEEP: FALSE-ALARM RATE VS ΔE UCL
+        # =========================================================
+        if calc.ready():
+            with st.expander("📈 K / k sweep – false-alarm rate vs ΔE UCL", expanded=False):
+                # Cả lưới K/k tính 1 lần vector hoá (tìm nhị phân trên điểm outlier đã sort của từng batch)
+                sweep = calc.sweep(np.round(np.arange(1.0, 4.01, 0.1), 2), np.round(np.arange(0.5, 3.01, 0.1), 2))
+                threshold = DE_TARGET[calc_source]
+                png = figure_cache().chart(("calculator_sweep",) + calc_key, lambda: charts.tradeoff(sweep, threshold, f"{color} ({calc_source}) – same K / k for ΔL, Δa, Δb"), max_width=DISPLAY_WIDTH)
+                st.image(png, width="stretch")
+                st.caption("False-alarm rate = share of the batches in view flagged by at least one factor at that K (Standard) or k (IQR).")
+                st.dataframe(sweep.style.format({"K / k": "{:.1f}", "ΔE UCL": "{:.3f}", "False-alarm rate": "{:.1%}", "Flagged batches": "{:.0f}"}), hide_index=True, width="stretch")
+                st.download_button("📥 Download CSV", sweep.to_csv(index=False).encode("utf-8-sig"), f"limit_sweep_{color}_{calc_source}.csv", "text/csv", key="dl_limit_sweep")
+        trace.lap("calculator.sweep")
+
+        # =========================================================
+        # MANUAL ΔE CALCULATOR (Bottom Section)
+        # =========================================================
+        st.markdown("---")
+        st.subheader("🧮 Manual ΔE Calculator")
+        st.markdown("Enter custom values for ΔL, Δa, and Δb to calculate the resulting overall color difference (ΔE).")
     
-    # Tạo 3 cột để nhập liệu cho gọn gàng
-    col_ml, col_ma, col_mb = st.columns(3)
-    with col_ml:
-        man_L = st.number_input("Input ΔL value:", value=0.000, step=0.100, format="%.3f")
-    with col_ma:
-        man_a = st.number_input("Input Δa value:", value=0.000, step=0.100, format="%.3f")
-    with col_mb:
-        man_b = st.number_input("Input Δb value:", value=0.000, step=0.100, format="%.3f")
+        # Tạo 3 cột để nhập liệu cho gọn gàng
+        col_ml, col_ma, col_mb = st.columns(3)
+        with col_ml:
+            man_L = st.number_input("Input ΔL value:", value=0.000, step=0.100, format="%.3f")
+        with col_ma:
+            man_a = st.number_input("Input Δa value:", value=0.000, step=0.100, format="%.3f")
+        with col_mb:
+            man_b = st.number_input("Input Δb value:", value=0.000, step=0.100, format="%.3f")
         
-    # Tính toán ΔE bằng công thức hình học không gian
-    manual_dE = math.sqrt(man_L**2 + man_a**2 + man_b**2)
+        # Tính toán ΔE bằng công thức hình học không gian
+        manual_dE = math.sqrt(man_L**2 + man_a**2 + man_b**2)
     
-    # Lấy lại mốc limit_threshold đã xác định ở trên (dựa vào LINE hoặc LAB)
-    limit_threshold = 1.0 if calc_source.upper() == "LINE" else 0.5
+        # Lấy lại mốc limit_threshold đã xác định ở trên (dựa vào LINE hoặc LAB)
+        limit_threshold = DE_TARGET[calc_source]
     
-    # Hiển thị kết quả với cảnh báo trực quan
-    st.markdown("#### **Calculation Result**")
-    if manual_dE <= limit_threshold:
-        st.success(f"### 🎯 Calculated ΔE: **{manual_dE:.3f}** (✅ Meets **{calc_source}** standard ≤ {limit_threshold})")
-    else:
-        st.error(f"### 🎯 Calculated ΔE: **{manual_dE:.3f}** (⚠️ Exceeds **{calc_source}** limit > {limit_threshold})")
+        # Hiển thị kết quả với cảnh báo trực quan
+        st.markdown("#### **Calculation Result**")
+        if manual_dE <= limit_threshold:
+            st.success(f"### 🎯 Calculated ΔE: **{manual_dE:.3f}** (✅ Meets **{calc_source}** standard ≤ {limit_threshold})")
+        else:
+            st.error(f"### 🎯 Calculated ΔE: **{manual_dE:.3f}** (⚠️ Exceeds **{calc_source}** limit > {limit_threshold})")
     
-    # Hiển thị công thức minh hoạ (Tùy chọn)
-    st.latex(r"\Delta E = \sqrt{\Delta L^2 + \Delta a^2 + \Delta b^2}")
-# VIEW 5: LAB VS LINE SCALE-UP ANALYSIS
-# VIEW 5: LAB VS LINE SCALE-UP ANALYSIS
-# =========================================================
-elif app_mode == "🔬 Lab vs Line Scale-up":
-    st.title("🔬 Lab to Line Scale-up Analysis")
-    st.markdown("""
+        # Hiển thị công thức minh hoạ (Tùy chọn)
+        st.latex(r"\Delta E = \sqrt{\Delta L^2 + \Delta a^2 + \Delta b^2}")
+    # VIEW 5: LAB VS LINE SCALE-UP ANALYSIS
+    # VIEW 5: LAB VS LINE SCALE-UP ANALYSIS
+    # =========================================================
+    elif app_mode == "🔬 Lab vs Line Scale-up":
+        st.title("🔬 Lab to Line Scale-up Analysis")
+        st.markdown("""
     Analyze the historical deviation between **Laboratory (LAB)** inputs and **Production (LINE)** outcomes. 
     Use this tool to determine the necessary **Offset Compensation** for color formulation.
     """)
 
-    if df.empty:
-        st.warning("⚠️ No data available for analysis.")
-    else:
-        # --- 1. DATA PREPARATION ---
-        batch_compare = df.groupby("製造批號", as_index=False).agg({
-            "入料檢測 ΔL 正面": "mean", "入料檢測 Δa 正面": "mean", "入料檢測 Δb 正面": "mean",
-            "正-北 ΔL": "mean", "正-南 ΔL": "mean",
-            "正-北 Δa": "mean", "正-南 Δa": "mean",
-            "正-北 Δb": "mean", "正-南 Δb": "mean"
-        }).dropna()
-
-        # Average Production (LINE) results
-        batch_compare["LINE_ΔL"] = batch_compare[["正-北 ΔL", "正-南 ΔL"]].mean(axis=1)
-        batch_compare["LINE_Δa"] = batch_compare[["正-北 Δa", "正-南 Δa"]].mean(axis=1)
-        batch_compare["LINE_Δb"] = batch_compare[["正-北 Δb", "正-南 Δb"]].mean(axis=1)
-
-        batch_compare = batch_compare.rename(columns={
-            "入料檢測 ΔL 正面": "LAB_ΔL",
-            "入料檢測 Δa 正面": "LAB_Δa",
-            "入料檢測 Δb 正面": "LAB_Δb"
-        })
+        # Model LAB→LINE của mọi màu × factor: fit 1 lần cho mỗi phiên bản dữ liệu (bộ lọc năm/tháng thì fit lại cube của view)
+        catalog_models = views.get_or_compute(("scaleup", data_version), lambda: ScaleUpModels.from_cube(batch_cube))
+        models = catalog_models if not selected_years and not selected_months else views.get_or_compute(
+            ("scaleup", data_version, color, tuple(selected_years), tuple(selected_months)), lambda: ScaleUpModels.from_cube(view_cube))
 
-        factors = ["ΔL", "Δa", "Δb"]
-        tabs = st.tabs([f"Factor {f}" for f in factors])
+        if df.empty:
+            st.warning("⚠️ No data available for analysis.")
+        else:
+            factors = ["ΔL", "Δa", "Δb"]
+            tabs = st.tabs([f"Factor {f}" for f in factors])
         
-        for i, f in enumerate(factors):
-            with tabs[i]:
-                lab_col, line_col = f"LAB_{f}", f"LINE_{f}"
-                x, y = batch_compare[lab_col].values, batch_compare[line_col].values
+            for i, f in enumerate(factors):
+                with tabs[i]:
+                    model = models.get(color, f)
+                    if model is None:
+                        st.info(f"Insufficient paired data for {f}.")
+                        continue
+                    x, y = models.color_points(color, f)
+                    mean_bias, std_dev, slope, intercept, r2_score = model["bias"], model["bias_sd"], model["slope"], model["intercept"], model["r2"]
                 
-                if len(x) < 3:
-                    st.info(f"Insufficient paired data for {f}.")
-                    continue
-                    
-                # --- 2. STATISTICAL CALCULATION ---
-                diff = y - x
-                mean_bias = np.mean(diff)
-                std_dev = np.std(diff)
-                slope, intercept = np.polyfit(x, y, 1)
-                r2_score = (np.corrcoef(x, y)[0, 1])**2
-                
-                # Metrics Display
-                st.markdown(f"### 📊 Process Metrics: **{f}**")
-                m1, m2, m3 = st.columns(3)
-                m1.metric("Systematic Bias (Avg)", f"{mean_bias:+.3f}", help="Average deviation between Line and Lab")
-                m2.metric("Fluctuation (1σ)", f"±{std_dev:.3f}", help="Standard deviation of the shift")
-                m3.metric("Predictability (R²)", f"{r2_score:.3f}", help="Model reliability (closer to 1.0 is better)")
-
-                # --- 3. AI ANALYTICAL INSIGHTS ---
-                # Determine direction based on factor
-                if f == "ΔL":
-                    direction = "LIGHTER" if mean_bias > 0.05 else "DARKER" if mean_bias < -0.05 else "STABLE"
-                elif f == "Δa":
-                    direction = "REDDER" if mean_bias > 0.05 else "GREENER" if mean_bias < -0.05 else "STABLE"
-                else: # Δb
-                    direction = "YELLOWER" if mean_bias > 0.05 else "BLUER" if mean_bias < -0.05 else "STABLE"
-
-                if direction != "STABLE":
-                    st.warning(f"💡 **Insight:** Production tends to be **{direction}** than Lab samples (Offset: {mean_bias:+.3f}).")
-                else:
-                    st.success(f"✅ **Insight:** Production results are highly consistent with Lab inputs.")
+                    # Metrics Display
+                    st.markdown(f"### 📊 Process Metrics: **{f}**")
+                    m1, m2, m3 = st.columns(3)
+                    m1.metric("Systematic Bias (Avg)", f"{mean_bias:+.3f}", help="Average deviation between Line and Lab")
+                    m2.metric("Fluctuation (1σ)", f"±{std_dev:.3f}", help="Standard deviation of the shift")
+                    m3.metric("Predictability (R²)", f"{r2_score:.3f}", help="Model reliability (closer to 1.0 is better)")
+
+                    # --- 3. AI ANALYTICAL INSIGHTS ---
+                    # Determine direction based on factor
+                    if f == "ΔL":
+                        direction = "LIGHTER" if mean_bias > 0.05 else "DARKER" if mean_bias < -0.05 else "STABLE"
+                    elif f == "Δa":
+                        direction = "REDDER" if mean_bias > 0.05 else "GREENER" if mean_bias < -0.05 else "STABLE"
+                    else: # Δb
+                        direction = "YELLOWER" if mean_bias > 0.05 else "BLUER" if mean_bias < -0.05 else "STABLE"
 
-                # --- 4. VISUALIZATION & PREDICTOR ---
-                col_chart, col_pred = st.columns([2.2, 1])
+                    if direction != "STABLE":
+                        st.warning(f"💡 **Insight:** Production tends to be **{direction}** than Lab samples (Offset: {mean_bias:+.3f}).")
+                    else:
+                        st.success(f"✅ **Insight:** Production results are highly consistent with Lab inputs.")
+
+                    # --- 4. VISUALIZATION & PREDICTOR ---
+                    col_chart, col_pred = st.columns([2.2, 1])
                 
-                with col_pred:
-                    st.subheader("🔮 Outcome Predictor")
-                    user_lab = st.number_input(f"Current LAB {f}:", value=float(x[-1]), step=0.01, format="%.3f", key=f"f5_en_{f}")
+                    with col_pred:
+                        st.subheader("🔮 Outcome Predictor")
+                        user_lab = st.number_input(f"Current LAB {f}:", value=float(x[-1]), step=0.01, format="%.3f", key=f"f5_en_{f}")
                     
-                    # Prediction calculation
-                    pred_line = slope * user_lab + intercept
-                    ci_95 = 2 * std_dev
+                        # Dự đoán = tra model + 1 phép nhân; khoảng dự đoán 95% cho 1 batch mới
+                        pred_line, pi_lo, pi_hi = models.predict(color, f, user_lab)
                     
-                    st.info(f"**Predicted LINE {f}:**\n## {pred_line:.3f}")
-                    st.caption(f"Confidence Range (95%):\n**[{pred_line-ci_95:.3f} to {pred_line+ci_95:.3f}]**")
+                        st.info(f"**Predicted LINE {f}:**\n## {pred_line:.3f}")
+                        if np.isnan(pi_lo):
+                            # < MIN_PI_DF + 2 batch: t quá lớn, không hiện khoảng dự đoán
+                            st.caption(f"Prediction Interval (95%): needs at least {MIN_PI_DF + 2} paired batches")
+                        else:
+                            st.caption(f"Prediction Interval (95%):\n**[{pi_lo:.3f} to {pi_hi:.3f}]**")
                     
-                    # Offset Suggestion
-                    st.success(f"🛠 **Lab Suggestion:**\nTo reach 0.000 on LINE, formulate LAB at: **{-mean_bias:+.3f}**")
+                        # Offset Suggestion
+                        st.success(f"🛠 **Lab Suggestion:**\nTo reach 0.000 on LINE, formulate LAB at: **{-mean_bias:+.3f}**")
 
-                with col_chart:
-                    fig, ax = plt.subplots(figsize=(8, 6))
-                    ax.grid(True, linestyle="--", alpha=0.3, zorder=0)
+                    with col_chart:
+                        fig, ax = plt.subplots(figsize=(8, 6))
+                        ax.grid(True, linestyle="--", alpha=0.3, zorder=0)
                     
-                    # Scatter and Prediction Star
-                    ax.scatter(x, y, alpha=0.6, color="#3498db", edgecolors="white", s=80, label="Historical Data", zorder=3)
-                    ax.scatter(user_lab, pred_line, color="#f1c40f", edgecolors="black", s=300, marker="*", label="Prediction ⭐", zorder=5)
+                        # Scatter and Prediction Star
+                        ax.scatter(x, y, alpha=0.6, color="#3498db", edgecolors="white", s=80, label="Historical Data", zorder=3)
+                        ax.scatter(user_lab, pred_line, color="#f1c40f", edgecolors="black", s=300, marker="*", label="Prediction ⭐", zorder=5)
                     
-                    # Reference Lines
-                    mn, mx = min(x.min(), y.min(), user_lab, pred_line) - 0.1, max(x.max(), y.max(), user_lab, pred_line) + 0.1
-                    ax.plot([mn, mx], [mn, mx], color="#7f8c8d", linestyle="--", alpha=0.6, label="Ideal (LINE = LAB)", zorder=1)
-                    ax.plot(np.linspace(mn, mx, 100), slope * np.linspace(mn, mx, 100) + intercept, color="#e74c3c", linewidth=2.5, label="Actual Trend", zorder=2)
+                        # Reference Lines
+                        mn, mx = min(x.min(), y.min(), user_lab, pred_line) - 0.1, max(x.max(), y.max(), user_lab, pred_line) + 0.1
+                        ax.plot([mn, mx], [mn, mx], color="#7f8c8d", linestyle="--", alpha=0.6, label="Ideal (LINE = LAB)", zorder=1)
+                        ax.plot(np.linspace(mn, mx, 100), slope * np.linspace(mn, mx, 100) + intercept, color="#e74c3c", linewidth=2.5, label="Actual Trend", zorder=2)
                     
-                    # Professional Color Guides
+                        # Professional Color Guides
                     
-                    bbox_style = dict(boxstyle="round,pad=0.3", alpha=0.1, lw=1)
-                    if f == "ΔL":
-                        ax.annotate("☀️ Lighter", xy=(0.95, 0.95), xycoords='axes fraction', ha='right', bbox=dict(facecolor='yellow', **bbox_style))
-                        ax.annotate("🌑 Darker", xy=(0.05, 0.05), xycoords='axes fraction', ha='left', bbox=dict(facecolor='gray', **bbox_style))
-                    elif f == "Δa":
-                        ax.annotate("🔴 Redder", xy=(0.95, 0.95), xycoords='axes fraction', ha='right', bbox=dict(facecolor='red', **bbox_style))
-                        ax.annotate("🟢 Greener", xy=(0.05, 0.05), xycoords='axes fraction', ha='left', bbox=dict(facecolor='green', **bbox_style))
-                    elif f == "Δb":
-                        ax.annotate("🟡 Yellower", xy=(0.95, 0.95), xycoords='axes fraction', ha='right', bbox=dict(facecolor='orange', **bbox_style))
-                        ax.annotate("🔵 Bluer", xy=(0.05, 0.05), xycoords='axes fraction', ha='left', bbox=dict(facecolor='blue', **bbox_style))
-
-                    ax.set_title(f"Lab-to-Line Scale-up: {f}", fontweight='bold')
-                    ax.set_xlabel(f"LAB Input ({f})")
-                    ax.set_ylabel(f"LINE Actual ({f})")
-                    ax.legend(loc='lower right')
-                    ax.set_xlim(mn, mx); ax.set_ylim(mn, mx)
+                        bbox_style = dict(boxstyle="round,pad=0.3", alpha=0.1, lw=1)
+                        if f == "ΔL":
+                            ax.annotate("☀️ Lighter", xy=(0.95, 0.95), xycoords='axes fraction', ha='right', bbox=dict(facecolor='yellow', **bbox_style))
+                            ax.annotate("🌑 Darker", xy=(0.05, 0.05), xycoords='axes fraction', ha='left', bbox=dict(facecolor='gray', **bbox_style))
+                        elif f == "Δa":
+                            ax.annotate("🔴 Redder", xy=(0.95, 0.95), xycoords='axes fraction', ha='right', bbox=dict(facecolor='red', **bbox_style))
+                            ax.annotate("🟢 Greener", xy=(0.05, 0.05), xycoords='axes fraction', ha='left', bbox=dict(facecolor='green', **bbox_style))
+                        elif f == "Δb":
+                            ax.annotate("🟡 Yellower", xy=(0.95, 0.95), xycoords='axes fraction', ha='right', bbox=dict(facecolor='orange', **bbox_style))
+                            ax.annotate("🔵 Bluer", xy=(0.05, 0.05), xycoords='axes fraction', ha='left', bbox=dict(facecolor='blue', **bbox_style))
+
+                        ax.set_title(f"Lab-to-Line Scale-up: {f}", fontweight='bold')
+                        ax.set_xlabel(f"LAB Input ({f})")
+                        ax.set_ylabel(f"LINE Actual ({f})")
+                        ax.legend(loc='lower right')
+                        ax.set_xlim(mn, mx); ax.set_ylim(mn, mx)
                     
-                    st.pyplot(fig)
-                    plt.close(fig)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+                        st.pyplot(fig)
+                        plt.close(fig)
 
+        # --- 5. CATALOG-WIDE OFFSETS ---
+        with st.expander("📋 Offset suggestions – all colors", expanded=False):
+            offsets = catalog_models.offsets()
+            st.dataframe(offsets, hide_index=True, width="stretch")
+            st.download_button("📥 Download CSV", offsets.to_csv(index=False).encode("utf-8-sig"), "scaleup_offsets.csv", "text/csv", key="dl_scaleup_offsets")
 
+    trace.lap({"🚀 Main Dashboard": "dashboard.thickness", "📋 Limit Status Summary": "status",
+               "🎛️ Control Limit Calculator": "calculator", "🔬 Lab vs Line Scale-up": "scale_up"}[app_mode])
 
+# =========================================================
+# DEBUG: THỜI GIAN / CACHE / MEMORY CỦA LẦN RERUN NÀY
+# =========================================================
+if os.environ.get("SPC_METRICS_LOG") == "1":
+    metrics_logger()
+    trace.log()
+if DEBUG:
+    with st.sidebar.expander("🛠 Debug: rerun profile", expanded=True):
+        peak = f" · peak mem {trace.peak_bytes / 2**20:.1f} MB" if trace.peak_bytes is not None else ""
+        st.caption(f"Rerun {trace.total * 1000:.0f} ms{peak}")
+        st.dataframe(pd.DataFrame(trace.laps, columns=["Section", "s"]).assign(ms=lambda d: (d.pop("s") * 1000).round(1)), hide_index=True, width="stretch")
+        if trace.spans:
+            spans = pd.DataFrame(trace.spans, columns=["Span", "s"]).groupby("Span")["s"].agg(["count", "sum"]).reset_index()
+            spans["ms"] = (spans.pop("sum") * 1000).round(1)
+            st.dataframe(spans.sort_values("ms", ascending=False), hide_index=True, width="stretch")
+        calls = {dict(l)["cache"]: v for (n, l), v in trace.counters.items() if n == "cache_calls"}
+        misses = {dict(l)["cache"]: v for (n, l), v in trace.counters.items() if n == "cache_misses"}
+        cache_df = pd.DataFrame({"Cache": list(calls), "Calls": list(calls.values()), "Misses": [misses.get(c, 0) for c in calls]})
+        st.dataframe(cache_df, hide_index=True, width="stretch")
+        figures = figure_cache()
+        st.caption(f"Figure cache: {len(figures)} images, {figures.size / 2**20:.1f} MB, hit {figures.hits} / miss {figures.misses} (process)")
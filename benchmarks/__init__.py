@@ -0,0 +1 @@
+"""Benchmarks of the SPC hot paths (python -m benchmarks.bench)."""
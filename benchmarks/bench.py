@@ -0,0 +1,217 @@
+"""Benchmark the SPC hot paths on synthetic data.
+
+    python -m benchmarks.bench --out bench.json
+    python -m benchmarks.bench --cases 10k:50 100k:200 1M:1000 --repeat 3 --out bench.json
+    python -m benchmarks.bench --compare baseline.json --tolerance 1.25
+
+Each case generates an inspection sheet of N rows over C colors, writes it
+as CSV and times: full ingest (read + clean + snapshot), incremental sync
+of an appended tail, snapshot reopen, the batch cube, the batch index
+(full build and extension by the appended tail), the time index and a
+year + month filter of every color, control-batch resolution for every
+color, the Limit Status Summary, OOC detection for every color, the
+catalog-wide Nelson scan, the Lab-to-Line models and Phase II thickness
+correlations of every color, the Control Limit Calculator statistics and
+K / k sweep of every color, bootstrap intervals of the calculator results
+of every color, the capability catalog, one K change on a cached
+calculator chart and chart rendering (including one long history of every
+batch in the catalog). Results go to a JSON file; --compare exits
+non-zero when a step got slower than baseline * tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from spc import capability, charts, ingest, pipeline
+from spc.aggregate import BATCH_COL, COLOR_COL, ORDER_COL, BatchCube, BatchIndex, phase2_start
+from spc.bootstrap import fleet_intervals
+from spc.calculator import LimitCalculator
+from spc.limits import LimitTable
+from spc.render import BaseImage, FigureCache, to_bytes
+from spc.rules import cube_rule_masks, ooc_table
+from spc.scaleup import ScaleUpModels
+from spc.status import limit_status_summary
+from spc.thickness import CoilCorrelation, phase2_positions
+from spc.timeindex import TimeIndex
+
+from . import synthetic
+
+DEFAULT_CASES = ["10k:50", "100k:200", "1M:1000"]
+
+
+def _parse_case(text):
+    rows, colors = text.lower().split(":")
+    scale = {"k": 1_000, "m": 1_000_000}.get(rows[-1], 1)
+    return int(float(rows.rstrip("km")) * scale), int(colors)
+
+
+def _timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return {"min": min(times), "median": statistics.median(times), "repeat": repeat}
+
+
+def run_case(n_rows, n_colors, repeat, workdir):
+    name = f"{n_rows}r_{n_colors}c"
+    frame = synthetic.inspection_frame(n_rows, n_colors)
+    limit_df = synthetic.limit_frame(n_colors)
+    cut = int(len(frame) * 0.99)
+    source = os.path.join(workdir, f"{name}.csv")
+    limit_source = os.path.join(workdir, f"{name}_limit.csv")
+    synthetic.write(limit_source, limit_df)
+    head = frame.iloc[:cut].to_csv(index=False)
+    tail = frame.iloc[cut:].to_csv(index=False, header=False)
+    steps = {}
+
+    def full_ingest():
+        with open(source, "w", encoding="utf-8") as fh:
+            fh.write(head)
+        ingest.ingest(ingest.SnapshotStore(os.path.join(workdir, "snap")), name, source, ingest.normalize_data)
+
+    def incremental():
+        full_ingest()
+        with open(source, "a", encoding="utf-8") as fh:
+            fh.write(tail)
+        t = time.perf_counter()
+        ingest.sync(ingest.SnapshotStore(os.path.join(workdir, "snap")), name, source, ingest.normalize_data)
+        return time.perf_counter() - t
+
+    steps["ingest_full"] = _timeit(full_ingest, repeat)
+    sync_times = [incremental() for _ in range(repeat)]
+    steps["ingest_sync_tail_1pct"] = {"min": min(sync_times), "median": statistics.median(sync_times), "repeat": repeat}
+    store = ingest.SnapshotStore(os.path.join(workdir, "snap"))
+    steps["snapshot_read"] = _timeit(lambda: store.read(name), repeat)
+
+    df, _ = store.read(name)
+    limits = LimitTable(ingest.normalize_limits(pd.read_csv(limit_source)))
+    steps["limit_table"] = _timeit(lambda: LimitTable(limits.frame), repeat)
+    steps["batch_cube"] = _timeit(lambda: BatchCube.from_rows(df), repeat)
+    head_cube = BatchCube.from_rows(df.iloc[:cut])
+    steps["batch_cube_extend_1pct"] = _timeit(lambda: head_cube.extend(df.iloc[cut:]), repeat)
+    cube = BatchCube.from_rows(df)
+    colors = sorted(df[COLOR_COL].dropna().unique())
+    steps["batch_index"] = _timeit(lambda: BatchIndex.from_rows(df), repeat)
+    head = BatchIndex.from_rows(df.iloc[:cut])
+    steps["batch_index_extend_1pct"] = _timeit(lambda: head.extend(df.iloc[cut:]), repeat)
+    index = BatchIndex.from_rows(df)
+    steps["time_index"] = _timeit(lambda: TimeIndex.from_rows(df), repeat)
+    time_index = TimeIndex.from_rows(df)
+    year, month = df["Time"].iloc[len(df) // 2].year, df["Time"].iloc[len(df) // 2].month
+    steps["year_month_filter_all_colors"] = _timeit(lambda: [df.iloc[time_index.select(c, [year], [month])] for c in colors], repeat)
+
+    def control_batches():
+        return {c: phase2_start(index.control_batch_code(c, limits.control_batch(c)), limits.control_batch(c)) for c in colors}
+
+    steps["control_batch_all_colors"] = _timeit(control_batches, repeat)
+    phase2_from = control_batches()
+    steps["limit_status_summary"] = _timeit(lambda: limit_status_summary(cube, limits, colors, 2, 5), repeat)
+    steps["ooc_table_all_colors"] = _timeit(lambda: [ooc_table(cube.series(c), limits, c, phase2_from[c]) for c in colors], repeat)
+    steps["nelson_all_series"] = _timeit(lambda: cube_rule_masks(cube), repeat)
+    data = pipeline.Dataset(df, limits)
+    steps["pipeline_results_all_colors"] = _timeit(lambda: pipeline.results(data), repeat)
+    steps["scaleup_fit_all_colors"] = _timeit(lambda: ScaleUpModels.from_cube(cube).offsets(), repeat)
+    steps["thickness_correlation_all_colors"] = _timeit(
+        lambda: CoilCorrelation.from_rows(df.iloc[phase2_positions(index, limits, colors)], limits).ranking(), repeat)
+    grid = np.arange(1.0, 4.01, 0.1), np.arange(0.5, 3.01, 0.1)
+    steps["calculator_sweep_all_colors"] = _timeit(
+        lambda: [LimitCalculator.from_series(cube.series(c), "LINE").sweep(*grid) for c in colors], repeat)
+    steps["capability_catalog"] = _timeit(lambda: capability.catalog(cube, limits, colors), repeat)
+    steps["bootstrap_intervals_all_colors"] = _timeit(lambda: fleet_intervals(cube, colors, "LINE", seed=0), repeat)
+
+    # charts of the color with the most batches
+    color = max(colors, key=lambda c: len(cube.color(c)))
+    series = cube.series(color)
+    lim = limits.get(color, "LAB", "ΔL"), limits.get(color, "LINE", "ΔL")
+    build = lambda: charts.combined(series["ΔL"]["lab"], series["ΔL"]["line"], "ΔL", lim[0], lim[1], phase2_from[color])
+    steps["render_combined_chart"] = _timeit(lambda: to_bytes(build()), repeat)
+    steps["render_distribution_chart"] = _timeit(
+        lambda: to_bytes(charts.distribution(series["ΔL"]["line"]["value"], *lim[1], "ΔL (LINE)", "#4dabf7")), repeat)
+    # the whole catalog as one long history (every batch renumbered), as a multi-year chart would be
+    long = {src: part.assign(**{ORDER_COL: np.arange(1, len(part) + 1)}) for src, part in cube.series()["ΔL"].items()}
+    steps["render_long_history_chart"] = _timeit(
+        lambda: to_bytes(charts.combined(long["lab"], long["line"], "ΔL", lim[0], lim[1], len(long["lab"]) // 2)), repeat)
+    # a K change in the calculator: limits + ΔE UCL + limit lines painted on the cached base chart
+    calc = LimitCalculator.from_series(series, "LINE")
+    fs = calc.stats["ΔL"]
+    base = BaseImage.from_figure(charts.limit_base(series["ΔL"]["line"][BATCH_COL], series["ΔL"]["line"]["value"], None, fs.mean,
+                                                   charts.snap_range(*fs.limits(6, 3)[::3], fs.sorted[-1] - fs.sorted[0])))
+
+    def calculator_change():
+        lims = fs.limits(2.5, 1.5)
+        calc.derived_de(2.5, 1.5)
+        return base.hlines([(y, "#d62728", 2, (6, 3)) for y in lims])
+
+    steps["calculator_k_change"] = _timeit(calculator_change, repeat)
+    cache = FigureCache()
+    cache.chart(("bench",), build)
+    steps["render_cached_chart"] = _timeit(lambda: cache.chart(("bench",), build), repeat)
+    return {"case": name, "rows": len(df), "colors": len(colors), "batches": len(cube.frame), "steps": steps}
+
+
+def _meta():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=False).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+        "cpu_count": os.cpu_count(), "numpy": np.__version__, "pandas": pd.__version__,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Steps slower than baseline * tolerance, as (case, step, seconds, baseline seconds)."""
+    base = {(c["case"], s): v["min"] for c in baseline["cases"] for s, v in c["steps"].items()}
+    slow = []
+    for c in results["cases"]:
+        for s, v in c["steps"].items():
+            ref = base.get((c["case"], s))
+            if ref is not None and v["min"] > ref * tolerance:
+                slow.append((c["case"], s, v["min"], ref))
+    return slow
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m benchmarks.bench", description="SPC hot-path benchmarks")
+    p.add_argument("--cases", nargs="*", default=DEFAULT_CASES, help="ROWS:COLORS, e.g. 100k:200")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--out", default="bench.json")
+    p.add_argument("--compare", default=None, help="baseline JSON to check against")
+    p.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown factor vs the baseline")
+    args = p.parse_args(argv)
+
+    results = {"meta": _meta(), "cases": []}
+    with tempfile.TemporaryDirectory(prefix="spc_bench_") as workdir:
+        for case in args.cases:
+            n_rows, n_colors = _parse_case(case)
+            res = run_case(n_rows, n_colors, args.repeat, workdir)
+            results["cases"].append(res)
+            print(f"{res['case']}: {res['batches']} batches")
+            for step, v in res["steps"].items():
+                print(f"  {step:28s} {v['min'] * 1000:10.1f} ms")
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump(results, fh, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            slow = compare(results, json.load(fh), args.tolerance)
+        for case, step, sec, ref in slow:
+            print(f"REGRESSION {case} {step}: {sec * 1000:.1f} ms vs {ref * 1000:.1f} ms", file=sys.stderr)
+        return 1 if slow else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""Synthetic inspection / limit sheets in the layout of "DATA 1.csv".
+
+Rows carry the raw multi-line export headers, batches of several coils
+share one LAB reading and one inspection day, and rows of a batch are
+interleaved with other colors in time order, as in the real export.
+"""
+import numpy as np
+import pandas as pd
+
+FACTORS = ["ΔL", "Δa", "Δb"]
+COILS_PER_BATCH = 8
+
+
+def _raw(name):
+    # the Google Sheet export breaks long headers over lines
+    return name.replace(" ", "\n ", 1)
+
+
+def inspection_frame(n_rows, n_colors, seed=0):
+    rng = np.random.default_rng(seed)
+    n_batches = max(n_rows // COILS_PER_BATCH, n_colors)
+    batch_color = np.r_[np.arange(n_colors), rng.integers(0, n_colors, n_batches - n_colors)]
+    batch_day = np.sort(rng.integers(0, 730, n_batches))
+    batch_no = pd.Series(batch_color).groupby(batch_color).cumcount().to_numpy()
+    batch_shift = {f: rng.normal(0, 0.15, n_batches) for f in FACTORS}
+
+    row_batch = np.sort(rng.integers(0, n_batches, n_rows))
+    color = batch_color[row_batch]
+    colors = np.array([f"PS{i:04d}TP" for i in range(n_colors)])
+    out = {
+        "Order ID": np.char.add("PMK", (row_batch % 999999).astype(str)),
+        "用途碼": "KF3D",
+        "塗料編號": colors[color],
+        "製造批號": np.char.add(np.char.add("F", (color % 10000).astype(str)), np.char.zfill((batch_no[row_batch] % 10000).astype(str), 4)),
+        "Coil No.": np.char.add("C", np.arange(n_rows).astype(str)),
+        "Time": (pd.Timestamp("2024-01-01") + pd.to_timedelta(batch_day[row_batch], unit="D")).strftime("%Y/%-m/%-d"),
+        _raw("Avergage Thickness (µm)正面"): np.round(rng.normal(24, 1.0, n_rows), 1),
+    }
+    de = 0
+    for f in FACTORS:
+        shift = batch_shift[f][row_batch]
+        north = np.round(shift + rng.normal(0, 0.1, n_rows), 2)
+        south = np.round(shift + rng.normal(0, 0.1, n_rows), 2)
+        out[_raw(f"正-北 {f}")] = north
+        out[_raw(f"正-南 {f}")] = south
+        out[_raw(f"Average value {f} 正面")] = np.round((north + south) / 2, 3)
+        out[_raw(f"入料檢測 {f} 正面")] = np.round(batch_shift[f][row_batch] * 0.8 + 0.05, 2)
+        de = de + ((north + south) / 2) ** 2
+    out[_raw("Average value ΔE 正面")] = np.round(np.sqrt(de), 3)
+    return pd.DataFrame(out)
+
+
+def limit_frame(n_colors, seed=0):
+    rng = np.random.default_rng(seed + 1)
+    colors = [f"PS{i:04d}TP" for i in range(n_colors)]
+    lim = pd.DataFrame({"Color_code": colors, "Control_batch": [f"Batch {n}" for n in rng.integers(1, 10, n_colors)]})
+    for src, width in (("LAB", 0.3), ("LINE", 0.35)):
+        for f in FACTORS:
+            lim[f"{src} {f} LCL"] = -width
+            lim[f"{src} {f} UCL"] = width
+    # a few colors without limits, as on the real sheet
+    lim.loc[lim.index % 7 == 3, [c for c in lim.columns if "CL" in c]] = np.nan
+    return lim
+
+
+def write(path, frame):
+    frame.to_csv(path, index=False, encoding="utf-8")
@@ -0,0 +1 @@
+"""Computational core of the SPC Color Dashboard (no Streamlit imports)."""
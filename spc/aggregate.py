@@ -0,0 +1,337 @@
+"""Batch-level aggregate cube.
+
+One grouped pass over (塗料編號, 製造批號) yields, per batch, the first Time,
+the row count and the LAB / LINE means of every factor. Every view slices
+this cube instead of running its own group-by.
+
+Batches are numbered per color in order of their first Time (Batch_Order,
+1-based; ties broken by batch code), which is the order the control batch
+number on the limit sheet counts in. The Phase II cut is an integer
+comparison on that number, never a comparison of batch-code strings.
+"""
+import numpy as np
+import pandas as pd
+
+from .metrics import timed
+
+FACTORS = ["ΔL", "Δa", "Δb"]
+SOURCES = ["lab", "line"]
+COLOR_COL, BATCH_COL = "塗料編號", "製造批號"
+ORDER_COL = "Batch_Order"
+THICKNESS_COL = "Avergage Thickness"
+# Per-batch mean columns of the cube, in the order of its sums / counts.
+VALUE_COLS = [f"{src}_{f}{side}" for f in FACTORS for src, side in (("LAB", ""), ("LINE", ""), ("LINE", "_N"), ("LINE", "_S"))] + ["THICKNESS"]
+
+
+def lab_col(f):
+    return f"入料檢測 {f} 正面"
+
+
+def line_cols(f):
+    return f"正-北 {f}", f"正-南 {f}"
+
+
+def _color_slices(codes):
+    """color -> slice of its run in an array sorted by color."""
+    if not len(codes):
+        return {}
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    stops = np.r_[starts[1:], len(codes)]
+    return {codes[a]: slice(a, b) for a, b in zip(starts, stops)}
+
+
+def _numeric(df, col):
+    if col not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    return pd.to_numeric(df[col], errors="coerce")
+
+
+class BatchCube:
+    """Batch aggregates sorted by (color, Batch_Order), with O(1) per-color slices.
+
+    Columns: 塗料編號, 製造批號, Batch_Order, First_Time, Rows_in_Batch and, per factor f,
+    LAB_f (mean of the LAB reading), LINE_f (mean of the per-row N/S average,
+    i.e. the SPC LINE value) and LINE_f_N / LINE_f_S (north / south means);
+    THICKNESS is the batch mean of Avergage Thickness.
+
+    The per-batch sums and counts behind the means are kept alongside, so
+    extend() folds appended rows in by grouping only the tail.
+    """
+
+    def __init__(self, frame, sums=None, counts=None, n_rows=None):
+        self.frame = frame.reset_index(drop=True)
+        self.sums, self.counts = sums, counts  # rows × VALUE_COLS, in frame order
+        self.n_rows = n_rows  # inspection rows aggregated
+        self._slices = _color_slices(self.frame[COLOR_COL].to_numpy())
+
+    @staticmethod
+    def _group(df):
+        """Batches of rows: keys, First_Time, Rows_in_Batch and the sum / count of every value column."""
+        work = {COLOR_COL: df[COLOR_COL], BATCH_COL: df[BATCH_COL], "Time": df["Time"]}
+        for f in FACTORS:
+            n, s = (_numeric(df, c) for c in line_cols(f))
+            work[f"LAB_{f}"] = _numeric(df, lab_col(f))
+            work[f"LINE_{f}_N"], work[f"LINE_{f}_S"] = n, s
+            work[f"LINE_{f}"] = pd.concat([n, s], axis=1).mean(axis=1)
+        work["THICKNESS"] = _numeric(df, THICKNESS_COL)
+        work = pd.DataFrame(work)
+        grouped = work.groupby([COLOR_COL, BATCH_COL], sort=True, observed=True)
+        frame = grouped["Time"].min().rename("First_Time").to_frame()
+        frame["Rows_in_Batch"] = grouped.size()
+        sums = grouped[VALUE_COLS].sum().to_numpy(dtype=float)
+        counts = grouped[VALUE_COLS].count().to_numpy(dtype=float)
+        return frame.reset_index(), sums, counts
+
+    @staticmethod
+    def _build(batches, sums, counts, order, n_rows):
+        """Cube of (color, batch, First_Time, Rows_in_Batch) batches numbered by order."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means = pd.DataFrame(sums / counts, columns=VALUE_COLS, index=batches.index)
+        frame = pd.concat([batches, means], axis=1)
+        frame.insert(2, ORDER_COL, order)
+        rank = frame.sort_values([COLOR_COL, ORDER_COL], kind="stable").index.to_numpy()
+        return BatchCube(frame.iloc[rank], sums[rank], counts[rank], n_rows)
+
+    @classmethod
+    @timed("aggregate.batch_cube")
+    def from_rows(cls, df, reference=None):
+        """Aggregate inspection rows. reference (the cube of the full history)
+        supplies Batch_Order for a filtered subset, so batch numbers and the
+        Phase II cut do not depend on the year / month filter."""
+        batches, sums, counts = cls._group(df)
+        if reference is None:
+            order = batch_order(batches)
+        else:
+            ref = reference.frame.set_index([COLOR_COL, BATCH_COL])[ORDER_COL]
+            keys = pd.MultiIndex.from_frame(batches[[COLOR_COL, BATCH_COL]])
+            order = ref.reindex(keys).fillna(0).astype(np.int32).to_numpy()
+        return cls._build(batches, sums, counts, order, len(df))
+
+    @timed("aggregate.batch_cube_extend")
+    def extend(self, tail):
+        """New cube for the rows with ``tail`` appended after the aggregated rows.
+
+        Only the tail is grouped: its sums and counts are added to the
+        batches it touches (new batches are appended), only those means are
+        recomputed and the batches are renumbered, as a backdated row can
+        move a batch.
+        """
+        new, sums, counts = self._group(tail)
+        old = self.frame[[COLOR_COL, BATCH_COL, "First_Time", "Rows_in_Batch"]].copy()
+        for col in (COLOR_COL, BATCH_COL):
+            if isinstance(old[col].dtype, pd.CategoricalDtype) and isinstance(new[col].dtype, pd.CategoricalDtype):
+                cats = old[col].cat.categories.union(new[col].cat.categories)
+                old[col] = old[col].cat.set_categories(cats)
+                new[col] = new[col].cat.set_categories(cats)
+        hit = pd.MultiIndex.from_frame(old[[COLOR_COL, BATCH_COL]]).get_indexer(pd.MultiIndex.from_frame(new[[COLOR_COL, BATCH_COL]]))
+        fresh = hit < 0
+        merged = pd.concat([old, new[fresh]], ignore_index=True)
+        all_sums = np.vstack([self.sums, sums[fresh]])
+        all_counts = np.vstack([self.counts, counts[fresh]])
+        seen = hit[~fresh]
+        merged.loc[seen, "First_Time"] = np.fmin(merged["First_Time"].to_numpy()[seen], new["First_Time"].to_numpy()[~fresh])
+        merged.loc[seen, "Rows_in_Batch"] += new["Rows_in_Batch"].to_numpy()[~fresh]
+        all_sums[seen] += sums[~fresh]
+        all_counts[seen] += counts[~fresh]
+        return self._build(merged, all_sums, all_counts, batch_order(merged), self.n_rows + len(tail))
+
+    @property
+    def colors(self):
+        return list(self._slices)
+
+    def color(self, c):
+        """Batch rows of one color (empty frame if the color has no batches)."""
+        sl = self._slices.get(c)
+        if sl is None:
+            return self.frame.iloc[0:0]
+        return self.frame.iloc[sl]
+
+    def control_batch_code(self, c, control_batch):
+        """Batch code of the control_batch-th batch of color c, or None when
+        it is not set or out of range."""
+        sl = self._slices.get(c)
+        if control_batch is None or sl is None or not 1 <= control_batch <= sl.stop - sl.start:
+            return None
+        return self.frame[BATCH_COL].iat[sl.start + control_batch - 1]
+
+    def phase2_mask(self, control_batches):
+        """One bool per cube row: the batch is in Phase II of its color, i.e. the
+        color's control batch (control_batches: color -> number) resolves and
+        Batch_Order >= it, as phase2_start decides for one color."""
+        mask = np.zeros(len(self.frame), dtype=bool)
+        orders = self.frame[ORDER_COL].to_numpy()
+        for c, sl in self._slices.items():
+            cb = control_batches.get(c)
+            if cb is not None and 1 <= cb <= sl.stop - sl.start:
+                mask[sl] = orders[sl] >= cb
+        return mask
+
+    def series(self, c=None, phase2_from=None):
+        """SPC batch series in the layout used by the charts:
+        {factor: {"lab": df, "line": df}} with columns 製造批號, Batch_Order, Time, value.
+
+        c=None takes the whole cube (a cube built from one color's rows).
+        phase2_from keeps only batches with Batch_Order >= phase2_from.
+        """
+        rows = self.frame if c is None else self.color(c)
+        if phase2_from is not None:
+            rows = rows[rows[ORDER_COL] >= phase2_from]
+        res = {}
+        for f in FACTORS:
+            res[f] = {
+                src: rows[[BATCH_COL, ORDER_COL, "First_Time", f"{src.upper()}_{f}"]]
+                .set_axis([BATCH_COL, ORDER_COL, "Time", "value"], axis=1)
+                .dropna().reset_index(drop=True)
+                for src in SOURCES
+            }
+        return res
+
+
+class BatchIndex:
+    """Per-color batch list in Batch_Order with first Time, row count and the
+    positions of each batch's rows in the inspection frame (CSR layout).
+
+    Control-batch lookup, the batch count check and Phase II row selection
+    are O(1) slices; first Times are sorted within a color, so a time range
+    maps to a Batch_Order range by binary search. extend() folds appended
+    rows in without regrouping the history. Instances are never modified,
+    so one can be shared by every session.
+    """
+
+    def __init__(self, batches, row_ptr, row_pos, n_rows, version=None):
+        self.batches = batches  # 塗料編號, 製造批號, Batch_Order, First_Time, Rows_in_Batch
+        self.row_ptr = row_ptr  # rows of batch i: row_pos[row_ptr[i]:row_ptr[i + 1]]
+        self.row_pos = row_pos
+        self.n_rows = n_rows
+        self.version = version
+        self._slices = _color_slices(batches[COLOR_COL].to_numpy())
+        self._times = batches["First_Time"].to_numpy()
+
+    @staticmethod
+    def _group(rows, offset):
+        """Batches of rows (color, batch, First_Time, Rows_in_Batch) plus each row's batch number (-1: none)."""
+        keys = rows[[COLOR_COL, BATCH_COL, "Time"]].astype({COLOR_COL: "category", BATCH_COL: "category"})
+        grouped = keys.groupby([COLOR_COL, BATCH_COL], sort=True, observed=True)
+        gid = grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+        batches = grouped["Time"].min().rename("First_Time").to_frame()
+        batches["Rows_in_Batch"] = grouped.size()
+        batches = batches.reset_index()
+        pos = np.arange(offset, offset + len(rows))
+        return batches, gid, pos
+
+    @staticmethod
+    def _sorted(batches):
+        """Number batches in Batch_Order; returns them sorted plus each input batch's new position."""
+        batches = batches.reset_index(drop=True)
+        batches.insert(2, ORDER_COL, batch_order(batches))
+        order = batches.sort_values([COLOR_COL, ORDER_COL], kind="stable").index.to_numpy()
+        slot = np.empty(len(order), dtype=np.int64)
+        slot[order] = np.arange(len(order))
+        return batches.iloc[order].reset_index(drop=True), slot
+
+    @classmethod
+    @timed("aggregate.batch_index")
+    def from_rows(cls, df, version=None):
+        batches, gid, pos = cls._group(df, 0)
+        batches, slot = cls._sorted(batches)
+        keep = gid >= 0
+        slots = slot[gid[keep]]
+        ptr = np.r_[0, np.cumsum(np.bincount(slots, minlength=len(batches)))]
+        return cls(batches, ptr, pos[keep][np.argsort(slots, kind="stable")], len(df), version)
+
+    @timed("aggregate.batch_index_extend")
+    def extend(self, tail, version=None):
+        """New index for the frame with ``tail`` appended after the indexed rows.
+
+        Only the tail is grouped; history batches are matched by key, the
+        batches are renumbered (a backdated row can move a batch) and rows
+        are scattered into their new batch segments without a full sort.
+        """
+        new, gid, pos = self._group(tail, self.n_rows)
+        old = self.batches.drop(columns=ORDER_COL)
+        for col in (COLOR_COL, BATCH_COL):
+            # keys stay categorical (sorted categories: integer sorts and lookups)
+            cats = old[col].cat.categories.union(new[col].cat.categories)
+            old[col] = old[col].cat.set_categories(cats)
+            new[col] = new[col].cat.set_categories(cats)
+        hit = pd.MultiIndex.from_frame(old[[COLOR_COL, BATCH_COL]]).get_indexer(pd.MultiIndex.from_frame(new[[COLOR_COL, BATCH_COL]]))
+        fresh = hit < 0
+        tail_batch = np.where(fresh, len(old) + np.cumsum(fresh) - 1, hit)
+        merged = pd.concat([old, new[fresh]], ignore_index=True)
+        seen = hit[~fresh]
+        merged.loc[seen, "First_Time"] = np.fmin(merged["First_Time"].to_numpy()[seen], new["First_Time"].to_numpy()[~fresh])
+        merged.loc[seen, "Rows_in_Batch"] += new["Rows_in_Batch"].to_numpy()[~fresh]
+        batches, slot = self._sorted(merged)
+        counts = batches["Rows_in_Batch"].to_numpy()
+        ptr = np.r_[0, np.cumsum(counts)]
+        row_pos = np.empty(ptr[-1], dtype=self.row_pos.dtype)
+        # history rows keep their place inside their batch, tail rows follow them
+        old_counts = np.diff(self.row_ptr)
+        row_pos[np.arange(len(self.row_pos)) + np.repeat(ptr[slot[:len(old)]] - self.row_ptr[:-1], old_counts)] = self.row_pos
+        before = np.zeros(len(batches), dtype=np.int64)
+        before[slot[:len(old)]] = old_counts
+        keep = gid >= 0
+        slots = slot[tail_batch[gid[keep]]]
+        order = np.argsort(slots, kind="stable")
+        slots = slots[order]
+        rank = np.arange(len(slots)) - np.searchsorted(slots, slots, "left")
+        row_pos[ptr[slots] + before[slots] + rank] = pos[keep][order]
+        return type(self)(batches, ptr, row_pos, self.n_rows + len(tail), version)
+
+    @property
+    def colors(self):
+        return list(self._slices)
+
+    def n_batches(self, c):
+        sl = self._slices.get(c)
+        return 0 if sl is None else sl.stop - sl.start
+
+    def control_batch_code(self, c, control_batch):
+        """Batch code of the control_batch-th batch of color c, or None when
+        it is not set or out of range."""
+        if control_batch is None or not 1 <= control_batch <= self.n_batches(c):
+            return None
+        return self.batches[BATCH_COL].iat[self._slices[c].start + control_batch - 1]
+
+    def batch_rows(self, c, first=1, last=None):
+        """Row positions of the batches of color c with first <= Batch_Order <= last."""
+        sl = self._slices.get(c)
+        if sl is None:
+            return self.row_pos[:0]
+        a = sl.start + max(first, 1) - 1
+        b = sl.stop if last is None else min(sl.start + last, sl.stop)
+        return self.row_pos[self.row_ptr[a]:self.row_ptr[max(a, b)]]
+
+    def order_range(self, c, start=None, end=None):
+        """(first, last) Batch_Order of the batches of c first seen in [start, end)."""
+        sl = self._slices.get(c)
+        if sl is None:
+            return 1, 0
+        times = self._times[sl]
+        a = 0 if start is None else np.searchsorted(times, np.datetime64(start), "left")
+        b = np.searchsorted(times, np.datetime64("NaT")) if end is None else np.searchsorted(times, np.datetime64(end), "left")
+        return int(a) + 1, int(b)
+
+
+def batch_order(batches):
+    """Batch_Order of each row of a (color, batch, First_Time) frame: 1-based
+    rank within its color by First_Time, then batch code; missing times last."""
+    ranked = batches[[COLOR_COL, "First_Time", BATCH_COL]].sort_values([COLOR_COL, "First_Time", BATCH_COL], kind="stable", na_position="last")
+    order = np.empty(len(batches), dtype=np.int32)
+    order[ranked.index.to_numpy()] = ranked.groupby(COLOR_COL, observed=True, sort=False).cumcount().to_numpy() + 1
+    return order
+
+
+def phase2_start(control_batch_code, control_batch):
+    """Batch_Order where Phase II starts, or None when the control batch is unresolved."""
+    return control_batch if control_batch_code is not None else None
+
+
+def summary_stats(series, src):
+    """Min / Max / Mean / Std Dev / n of each factor's batch values for one source."""
+    out = []
+    for k in FACTORS:
+        values = series[k][src]["value"].dropna()
+        if not values.empty:
+            out.append({"Factor": k, "Min": round(values.min(), 2), "Max": round(values.max(), 2), "Mean": round(values.mean(), 2), "Std Dev": round(values.std(), 2), "n": values.count()})
+    return pd.DataFrame(out)
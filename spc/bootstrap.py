@@ -0,0 +1,184 @@
+"""Bootstrap confidence intervals of the Control Limit Calculator results.
+
+Batches are resampled with replacement n_resamples times in one go: one
+resamples × batches index matrix per color, over the batches every factor
+has, picks the ΔL / Δa / Δb / ΔE of the same batches, so the resamples
+keep the pairing of the factors (the derived ΔE and the tolerance
+recommendation combine them). Mean, σ and quartiles of every resample are
+row-wise array operations (the quartiles through np.partition on the few
+order statistics they read). The limits, derived ΔE UCL and tolerance
+recommendation are evaluated on those arrays with the same code as the
+point estimates, so K / k changes never resample again.
+
+A seed makes a run reproducible. Fleet runs spawn one stream per color
+from it, so their results do not depend on how the colors are spread over
+a process pool.
+"""
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+from .aggregate import COLOR_COL, FACTORS, ORDER_COL
+from .calculator import DE_TARGET, VISUAL_CAP, LimitCalculator, SeriesStats, quantile, tolerance
+from .metrics import timed
+
+DEFAULT_RESAMPLES = 2000
+# Resampled values held at once (resamples × batches); longer series go in chunks.
+MAX_CELLS = 2**22
+LIMIT_NAMES = ("Std LCL", "Std UCL", "IQR LCL", "IQR UCL")
+
+
+class ResampledStats(SeriesStats):
+    """Mean, σ and quartiles of bootstrap resamples of one series, as arrays
+    (no outlier scores); filled a block of resamples at a time."""
+
+    def __init__(self, n, n_resamples):
+        self.n = n
+        self.mean, self.std, self.q1, self.median, self.q3 = (np.full(n_resamples, np.nan) for _ in range(5))
+        self.iqr = self.q3 - self.q1
+        self._kth = sorted({min(int(q * (n - 1)) + d, n - 1) for q in (0.25, 0.5, 0.75) for d in (0, 1)})
+
+    def fill(self, a, sample):
+        """Statistics of resamples a .. a + len(sample) (one row each)."""
+        b = a + len(sample)
+        self.mean[a:b] = sample.mean(axis=1)
+        if self.n > 1:
+            self.std[a:b] = sample.std(axis=1, ddof=1)
+        sample.partition(self._kth, axis=1)
+        self.q1[a:b], self.median[a:b], self.q3[a:b] = (quantile(sample, q) for q in (0.25, 0.5, 0.75))
+        self.iqr[a:b] = self.q3[a:b] - self.q1[a:b]
+
+
+def percentile_interval(values, level=0.95):
+    """(lower, upper) percentile interval over the last axis, ignoring NaNs
+    (NaN where every value is)."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanquantile(values, [(1 - level) / 2, (1 + level) / 2], axis=-1)
+
+
+def _per_factor(value, f):
+    return value[f] if isinstance(value, dict) else value
+
+
+def results(calc, sigma, iqr_k, source):
+    """Named Control Limit Calculator results of calc (point estimates, or
+    arrays for a resampled calculator): per factor LCL / UCL of both
+    methods and the recommended ± limit, the derived ΔE UCL of both
+    methods, the process ΔE and the ΔE of the recommended limits."""
+    out = {}
+    for f, s in calc.stats.items():
+        for name, v in zip(LIMIT_NAMES, s.limits(_per_factor(sigma, f), _per_factor(iqr_k, f))):
+            out[f"{f} {name}"] = v
+    out["ΔE UCL (Standard)"], out["ΔE UCL (IQR)"] = calc.derived_de(sigma, iqr_k)
+    tol = tolerance({f: s.std for f, s in calc.stats.items()}, DE_TARGET[source], VISUAL_CAP[source])
+    for f, v in tol["limit"].items():
+        out[f"{f} Recommended ±"] = v
+    out["Process ΔE (3σ)"] = tol["process_de"]
+    out["ΔE of recommended limits"] = tol["de"]
+    return out
+
+
+def paired_values(calc):
+    """{factor: values} of the batches every factor of calc has, in the same
+    batch order for all factors."""
+    shared = reduce(np.intersect1d, [s.batches for s in calc.stats.values()])
+    out = {}
+    for f, s in calc.stats.items():
+        order = np.argsort(s.batches, kind="stable")
+        out[f] = s.values[order[np.searchsorted(s.batches, shared, sorter=order)]]
+    return out
+
+
+def resample(calc, n_resamples=DEFAULT_RESAMPLES, seed=None):
+    """Calculator whose statistics are arrays over n_resamples resamples of
+    the batches of calc, the same batches for every factor; seed is anything
+    np.random.default_rng takes."""
+    rng = np.random.default_rng(seed)
+    values = paired_values(calc)
+    n = len(next(iter(values.values())))
+    stats = {f: ResampledStats(n, n_resamples) for f in values}
+    if n:
+        step = max(MAX_CELLS // n, 1)
+        for a in range(0, n_resamples, step):
+            idx = rng.integers(0, n, (min(step, n_resamples - a), n))
+            for f, v in values.items():
+                stats[f].fill(a, v[idx])
+    return LimitCalculator(stats, None, None)
+
+
+def intervals(calc, boot, sigma, iqr_k, source, level=0.95):
+    """Quantity, Estimate, Lower, Upper: the results of calc with the
+    percentile interval of the resampled calculator boot."""
+    est, res = results(calc, sigma, iqr_k, source), results(boot, sigma, iqr_k, source)
+    names = list(est)
+    n = len(next(iter(boot.stats.values())).mean)
+    lo, hi = percentile_interval(np.vstack([np.broadcast_to(res[k], n) for k in names]), level)
+    return pd.DataFrame({"Quantity": names, "Estimate": [float(est[k]) for k in names], "Lower": lo, "Upper": hi})
+
+
+# Worker-side copy of the fleet inputs, set once per process by the pool initializer.
+_SHARED = None
+
+
+def _init_worker(inputs):
+    global _SHARED
+    _SHARED = inputs
+
+
+def color_intervals(inputs, task):
+    """intervals() of a block of colors: task = (colors, seeds, sigma, iqr_k,
+    source, n_resamples, level); colors with too few batches are skipped."""
+    colors, seeds, sigma, iqr_k, source, n_resamples, level = task
+    parts = []
+    for c, seed in zip(colors, seeds):
+        calc = LimitCalculator.from_stats({f: SeriesStats(*inputs[c][f]) for f in FACTORS})
+        if not calc.ready():
+            continue
+        table = intervals(calc, resample(calc, n_resamples, seed), sigma, iqr_k, source, level)
+        table.insert(0, "Color Code", c)
+        parts.append(table)
+    return parts
+
+
+def _fleet_task(task):
+    return color_intervals(_SHARED, task)
+
+
+def fleet_inputs(cube, colors, source):
+    """{color: {factor: (values, Batch_Order)}} of the given source, the same
+    batches as cube.series(color) without building its frames."""
+    rows = cube.frame[cube.frame[COLOR_COL].isin(colors) & cube.frame["First_Time"].notna()]
+    inputs = {c: {} for c in colors}
+    for f in FACTORS:
+        part = rows[rows[f"{source.upper()}_{f}"].notna()]
+        values, orders = part[f"{source.upper()}_{f}"].to_numpy(dtype=float), part[ORDER_COL].to_numpy()
+        codes = part[COLOR_COL].to_numpy()
+        for c in colors:
+            keep = codes == c
+            inputs[c][f] = (values[keep], orders[keep])
+    return inputs
+
+
+@timed("bootstrap.fleet")
+def fleet_intervals(cube, colors, source="LINE", sigma=3.0, iqr_k=1.5, n_resamples=DEFAULT_RESAMPLES, level=0.95, seed=None, workers=1):
+    """intervals() of every color with enough batches, as one long table
+    with a Color Code column. workers > 1 spreads the colors over a process
+    pool; the series reach each worker once through its initializer."""
+    colors = list(colors)
+    inputs = fleet_inputs(cube, colors, source)
+    seeds = np.random.SeedSequence(seed).spawn(len(colors))
+    n_chunks = max(min(workers * 4, len(colors)), 1)
+    tasks = [(colors[i::n_chunks], seeds[i::n_chunks], sigma, iqr_k, source, n_resamples, level) for i in range(n_chunks)]
+    if workers > 1 and len(colors) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(inputs,)) as pool:
+            parts = [t for chunk in pool.map(_fleet_task, tasks) for t in chunk]
+    else:
+        parts = [t for task in tasks for t in color_intervals(inputs, task)]
+    if not parts:
+        return pd.DataFrame(columns=["Color Code", "Quantity", "Estimate", "Lower", "Upper"])
+    order = {c: i for i, c in enumerate(colors)}
+    return pd.concat(sorted(parts, key=lambda t: order[t["Color Code"].iat[0]]), ignore_index=True)
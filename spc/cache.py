@@ -0,0 +1,129 @@
+"""Process-wide result cache shared by every dashboard session.
+
+An LRU bounded by the (estimated) total size of its values, with
+single-flight computation: when several threads ask for the same missing
+key at once, one of them computes it and the others wait for that result
+instead of repeating the work. Cached values are shared, so callers must
+treat them as read-only.
+"""
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+from .metrics import count
+
+
+def sizeof(obj, seen=None):
+    """Rough size in bytes of frames, arrays and containers of them; an object
+    reached twice inside one value is counted once."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.index.memory_usage()) + sum(_column_bytes(col, seen) for _, col in obj.items())
+    if isinstance(obj, pd.Series):
+        return int(obj.index.memory_usage()) + _column_bytes(obj, seen)
+    if isinstance(obj, pd.Index):
+        return int(obj.memory_usage())
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sum(sizeof(v, seen) for v in obj.values()) + sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple)):
+        return sum(sizeof(v, seen) for v in obj) + sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        return sizeof(vars(obj), seen)
+    return sys.getsizeof(obj)
+
+
+def _column_bytes(col, seen):
+    # slices of a categorical share its categories: count them once
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        return col.cat.codes.to_numpy().nbytes + sizeof(col.dtype.categories, seen)
+    return int(col.memory_usage(index=False))
+
+
+class SharedCache:
+    """Thread-safe LRU capped at max_bytes with single-flight get_or_compute."""
+
+    def __init__(self, max_bytes=256 * 2**20, name="shared", sizer=sizeof):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.sizer = sizer
+        self.size = 0
+        self.hits = self.misses = 0
+        self._items = OrderedDict()  # key -> (value, nbytes)
+        self._inflight = {}  # key -> Future of the computation in progress
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        count("cache_calls", cache=self.name)
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                count("cache_misses", cache=self.name)
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        nbytes = self.sizer(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._items[key] = (value, nbytes)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                _, (_, dropped) = self._items.popitem(last=False)
+                self.size -= dropped
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def get_or_compute(self, key, compute):
+        """Cached value of key, calling compute() once across threads on a miss."""
+        count("cache_calls", cache=self.name)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            self.misses += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = Future()
+        if not leader:
+            count("cache_waits", cache=self.name)
+            return flight.result()
+        count("cache_misses", cache=self.name)
+        try:
+            value = compute()
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            self.put(key, value)
+            flight.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
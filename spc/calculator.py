@@ -0,0 +1,156 @@
+"""Control Limit Calculator on precomputed per-series statistics.
+
+For every factor of one color × source the mean, σ, quartiles and the
+sorted outlier scores of its batches are computed once. Limits for a
+Sigma (K) / IQR sensitivity (k) setting are then a few multiplications,
+and the share of batches a setting flags is a binary search in the sorted
+scores: a batch leaves μ ± Kσ exactly when |x − μ| / σ > K, and leaves
+the IQR fences exactly when max(Q1 − x, x − Q3) / IQR > k. A whole K / k
+grid (the false-alarm rate vs ΔE UCL trade-off) is one vectorized call.
+The tolerance recommendation works on σ alone, so it takes floats or the
+σ arrays of bootstrap resamples (spc.bootstrap) alike.
+"""
+import numpy as np
+import pandas as pd
+
+from .aggregate import FACTORS, ORDER_COL
+from .metrics import timed
+
+MIN_BATCHES = 3
+# Derived ΔE UCL target and visual cap of one factor's limit, per source.
+DE_TARGET = {"LINE": 1.0, "LAB": 0.5}
+VISUAL_CAP = {"LINE": 0.600, "LAB": 0.350}
+# Natural process spread used by the tolerance recommendation.
+PROCESS_SIGMA = 3
+
+
+def quantile(sorted_values, q):
+    """Linear-interpolated quantile (pandas' default method) of values sorted
+    along the last axis; only the order statistics it reads need to be in place."""
+    n = sorted_values.shape[-1]
+    pos = q * (n - 1)
+    lo = int(pos)
+    hi = min(lo + 1, n - 1)
+    return sorted_values[..., lo] + (sorted_values[..., hi] - sorted_values[..., lo]) * (pos - lo)
+
+
+def tolerance(stds, threshold, cap):
+    """Tolerance recommendation from the σ of each factor ({factor: σ}).
+
+    A capable process (PROCESS_SIGMA·σ ΔE within threshold) gets the whole
+    threshold split over the factors in proportion to σ; otherwise the
+    practical limit is PROCESS_SIGMA·σ. Either is capped at cap. Returns
+    process_de, capable, raw / limit / capped per factor and de, the ΔE of
+    the recommended limits.
+    """
+    stds = {f: np.asarray(s, dtype=float) for f, s in stds.items()}
+    var_sum = sum(s**2 for s in stds.values())
+    process_de = PROCESS_SIGMA * np.sqrt(var_sum)
+    capable = process_de <= threshold
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(capable, threshold / np.sqrt(var_sum), PROCESS_SIGMA)
+        raw = {f: scale * s for f, s in stds.items()}
+    limit = {f: np.minimum(r, cap) for f, r in raw.items()}
+    return {
+        "process_de": process_de, "capable": capable, "raw": raw, "limit": limit,
+        "capped": {f: r > cap for f, r in raw.items()}, "de": np.sqrt(sum(v**2 for v in limit.values())),
+    }
+
+
+def flag_rate(sorted_scores, thresholds):
+    """Share of scores strictly above each threshold."""
+    n = len(sorted_scores)
+    if not n:
+        return np.full(np.shape(thresholds), np.nan)
+    return (n - np.searchsorted(sorted_scores, thresholds, "right")) / n
+
+
+def _scores(dev, scale):
+    """dev / scale with a zero scale flagging any deviation and nothing else."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = dev / scale
+    return np.where(np.isnan(s), -np.inf, s)
+
+
+class SeriesStats:
+    """Mean, σ, quartiles and outlier scores of one factor series."""
+
+    def __init__(self, values, batches):
+        """values and Batch_Order of the batches of the series, without NaNs."""
+        v = np.asarray(values, dtype=float)
+        self.n = len(v)
+        self.sorted = np.sort(v)
+        if self.n:
+            self.mean = float(v.mean())
+            self.std = float(v.std(ddof=1)) if self.n > 1 else np.nan
+            self.q1, self.median, self.q3 = (float(quantile(self.sorted, q)) for q in (0.25, 0.5, 0.75))
+        else:
+            self.mean = self.std = self.q1 = self.median = self.q3 = np.nan
+        self.iqr = self.q3 - self.q1
+        # per batch: its value and the K / k above which it stops being flagged
+        self.values, self.batches = v, np.asarray(batches)
+        self.std_score = _scores(np.abs(v - self.mean), self.std)
+        self.iqr_score = _scores(np.maximum(self.q1 - v, v - self.q3), self.iqr)
+
+    def limits(self, sigma, iqr_k):
+        """(std LCL, std UCL, IQR LCL, IQR UCL); sigma / iqr_k may be arrays."""
+        return (self.mean - sigma * self.std, self.mean + sigma * self.std,
+                self.q1 - iqr_k * self.iqr, self.q3 + iqr_k * self.iqr)
+
+
+class LimitCalculator:
+    """SeriesStats of every factor of one color × source, plus the joint
+    (any factor) scores of each batch."""
+
+    def __init__(self, stats, joint_std, joint_iqr):
+        self.stats = stats  # factor -> SeriesStats
+        self.joint_std, self.joint_iqr = joint_std, joint_iqr  # sorted per-batch max over factors
+
+    @classmethod
+    @timed("calculator.build")
+    def from_series(cls, series, source):
+        """From SPC series ({factor: {"lab": df, "line": df}}) and source LINE / LAB."""
+        return cls.from_stats({f: SeriesStats(series[f][source.lower()]["value"], series[f][source.lower()][ORDER_COL]) for f in FACTORS})
+
+    @classmethod
+    def from_stats(cls, stats):
+        """From {factor: SeriesStats}, adding the joint scores."""
+        _, batch = np.unique(np.concatenate([s.batches for s in stats.values()]), return_inverse=True)
+        joint = []
+        for score in ("std_score", "iqr_score"):
+            top = np.full(batch.max() + 1 if len(batch) else 0, -np.inf)
+            np.maximum.at(top, batch, np.concatenate([getattr(s, score) for s in stats.values()]))
+            joint.append(np.sort(top))
+        return cls(stats, *joint)
+
+    def ready(self):
+        """Every factor has enough batches for limits."""
+        return all(s.n >= MIN_BATCHES for s in self.stats.values())
+
+    def derived_de(self, sigma, iqr_k):
+        """(ΔE UCL of the std limits, ΔE UCL of the IQR limits): per factor the
+        larger |limit|, combined as √(ΔL² + Δa² + Δb²). sigma / iqr_k are
+        {factor: value} or one value (or array) for every factor."""
+        std_sq = iqr_sq = 0
+        for f, s in self.stats.items():
+            lcl, ucl, ilcl, iucl = s.limits(sigma[f] if isinstance(sigma, dict) else sigma, iqr_k[f] if isinstance(iqr_k, dict) else iqr_k)
+            std_sq = std_sq + np.maximum(np.abs(lcl), np.abs(ucl)) ** 2
+            iqr_sq = iqr_sq + np.maximum(np.abs(ilcl), np.abs(iucl)) ** 2
+        return np.sqrt(std_sq), np.sqrt(iqr_sq)
+
+    def sweep(self, sigmas, iqr_ks):
+        """Trade-off table of a K grid (std method) and a k grid (IQR method)
+        applied to every factor: the derived ΔE UCL and the false-alarm
+        rate, i.e. the share of batches flagged by at least one factor."""
+        sigmas, iqr_ks = np.asarray(sigmas, dtype=float), np.asarray(iqr_ks, dtype=float)
+        de_std, _ = self.derived_de(sigmas, 0.0)
+        _, de_iqr = self.derived_de(0.0, iqr_ks)
+        n_std, n_iqr = len(self.joint_std), len(self.joint_iqr)
+        rate_std, rate_iqr = flag_rate(self.joint_std, sigmas), flag_rate(self.joint_iqr, iqr_ks)
+        return pd.DataFrame({
+            "Method": ["Standard"] * len(sigmas) + ["IQR"] * len(iqr_ks),
+            "K / k": np.r_[sigmas, iqr_ks],
+            "ΔE UCL": np.r_[np.broadcast_to(de_std, sigmas.shape), np.broadcast_to(de_iqr, iqr_ks.shape)],
+            "False-alarm rate": np.r_[rate_std, rate_iqr],
+            "Flagged batches": np.r_[np.rint(rate_std * n_std), np.rint(rate_iqr * n_iqr)],
+        })
@@ -0,0 +1,112 @@
+"""Process capability (Cp, Cpk, Pp, Ppk, expected ppm) of the whole catalog.
+
+Batch means are the individual values, as on the control charts. One
+grouped pass per cube column gives, for every color at once, the batch
+count, mean, overall σ (Pp / Ppk) and the mean moving range between
+consecutive batches in Batch_Order, whose MR̄ / d2 is the within σ
+(Cp / Cpk). Spec limits are the LCL / UCL of the limit sheet; thickness
+uses its optional Thickness LSL / USL columns. Expected ppm out of spec
+follows the normal model with the overall σ. A one-sided spec has no
+Cp / Pp and only its own side in Cpk / Ppk.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from .aggregate import COLOR_COL, FACTORS
+from .limits import THICKNESS
+from .metrics import timed
+
+D2 = 1.128  # d2 of moving ranges of two
+MIN_BATCHES = 3
+# Cpk / Ppk levels of the Level column.
+CAPABLE, MARGINAL = 1.33, 1.0
+# (Source, Factor, cube column, limit sheet source / factor) of every capability series.
+SERIES = [(src.upper(), f, f"{src.upper()}_{f}", src.upper(), f) for src in ("lab", "line") for f in FACTORS] + [
+    ("THICKNESS", "Thickness", "THICKNESS", THICKNESS, THICKNESS)]
+CAPABILITY_COLUMNS = [
+    "Color Code", "Source", "Factor", "Batches", "Mean", "σ Within", "σ Overall", "LSL", "USL",
+    "Cp", "Cpk", "Pp", "Ppk", "Expected ppm", "Level",
+]
+
+_erfc = np.frompyfunc(math.erfc, 1, 1)
+
+
+def normal_tail(z):
+    """P(Z > z) of the standard normal, elementwise."""
+    return 0.5 * _erfc(np.asarray(z, dtype=float) / math.sqrt(2)).astype(float)
+
+
+def moments(values, group, n_groups):
+    """(n, mean, overall σ, within σ) per group of values in series order;
+    NaN values are skipped and the moving ranges bridge over them."""
+    keep = ~np.isnan(values)
+    v, g = values[keep], group[keep]
+    n = np.bincount(g, minlength=n_groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.bincount(g, v, n_groups) / n
+        overall = np.sqrt(np.bincount(g, (v - mean[g]) ** 2, n_groups) / (n - 1))
+        same = g[1:] == g[:-1]
+        mr = np.bincount(g[1:][same], np.abs(np.diff(v))[same], n_groups) / (n - 1)
+    return n, mean, np.where(n >= 2, overall, np.nan), np.where(n >= 2, mr / D2, np.nan)
+
+
+def indices(mean, within, overall, lsl, usl):
+    """Cp, Cpk, Pp, Ppk and expected ppm out of spec; lsl / usl NaN when not set."""
+    lsl, usl = np.asarray(lsl, dtype=float), np.asarray(usl, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        res = {}
+        for prefix, s in (("C", within), ("P", overall)):
+            res[f"{prefix}p"] = (usl - lsl) / (6 * s)
+            res[f"{prefix}pk"] = np.fmin((usl - mean) / (3 * s), (mean - lsl) / (3 * s))
+        tails = np.where(np.isnan(lsl), 0, normal_tail((mean - lsl) / overall)) + np.where(np.isnan(usl), 0, normal_tail((usl - mean) / overall))
+    res["Expected ppm"] = np.where(np.isnan(lsl) & np.isnan(usl), np.nan, tails * 1e6)
+    return res
+
+
+def level(cpk):
+    if cpk != cpk: return ""
+    if cpk >= CAPABLE: return "✅ Capable"
+    if cpk >= MARGINAL: return "⚠️ Marginal"
+    return "❌ Not capable"
+
+
+def series_capability(values, lsl, usl):
+    """Indices of one series (values in order), e.g. a filtered chart or the
+    rows behind the thickness histogram. lsl / usl may be None."""
+    v = np.asarray(values, dtype=float)
+    n, mean, overall, within = moments(v, np.zeros(len(v), dtype=np.int64), 1)
+    res = indices(mean, within, overall, np.nan if lsl is None else lsl, np.nan if usl is None else usl)
+    return {"n": int(n[0]), "mean": float(mean[0]), "σ Within": float(within[0]), "σ Overall": float(overall[0]), **{k: float(np.ravel(x)[0]) for k, x in res.items()}}
+
+
+@timed("capability.catalog")
+def catalog(cube, limits, colors=None):
+    """Capability of every color × source × factor and the thickness
+    (columns: CAPABILITY_COLUMNS); series with fewer than MIN_BATCHES
+    batches are left out. colors restricts and orders the colors."""
+    frame = cube.frame
+    if colors is not None:
+        frame = frame[frame[COLOR_COL].isin(list(colors))]
+    frame = frame[frame["First_Time"].notna()]
+    codes = frame[COLOR_COL].astype("category")
+    names = list(codes.cat.categories) if colors is None else [c for c in colors if c in set(codes.cat.categories)]
+    codes = codes.cat.set_categories(names)
+    group = codes.cat.codes.to_numpy().astype(np.int64)
+    parts = []
+    for source, factor, col, lim_src, lim_fac in SERIES:
+        n, mean, overall, within = moments(frame[col].to_numpy(dtype=float), group, len(names))
+        spec = [limits.get(c, lim_src, lim_fac) for c in names]
+        lsl = np.array([np.nan if lo is None else lo for lo, _ in spec], dtype=float)
+        usl = np.array([np.nan if hi is None else hi for _, hi in spec], dtype=float)
+        part = pd.DataFrame({
+            "Color Code": names, "Source": source, "Factor": factor, "Batches": n, "Mean": mean,
+            "σ Within": within, "σ Overall": overall, "LSL": lsl, "USL": usl,
+            **indices(mean, within, overall, lsl, usl),
+        })
+        parts.append(part[n >= MIN_BATCHES])
+    out = pd.concat(parts, ignore_index=True)
+    out["Level"] = [level(v) for v in out["Cpk"]]
+    order = {c: i for i, c in enumerate(names)}
+    return out.sort_values("Color Code", key=lambda s: s.map(order), kind="stable").reset_index(drop=True)[CAPABILITY_COLUMNS]
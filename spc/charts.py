@@ -0,0 +1,322 @@
+"""Matplotlib chart builders of the Main Dashboard.
+
+Each builder takes plain data and returns a Figure (or None when there is
+nothing to draw). The builders never display or close anything; see
+spc.render for turning a figure into cached image bytes.
+
+Batch charts take an optional Batch_Order window (first, last) to zoom
+into. Above LARGE_SERIES batches they switch to a numeric Batch_Order axis
+with sparse batch-code labels and draw a min-max decimation of each line
+that always keeps the flagged (OOC, Nelson, signal) points, so drawing
+time stays bounded whatever the history length.
+"""
+import math
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+
+from . import shift
+from .aggregate import BATCH_COL, ORDER_COL
+from .rules import nelson_rules
+
+
+# Batch charts with more points than this use a numeric axis and decimation.
+LARGE_SERIES = 200
+# Points per line kept by the decimation (plus the flagged ones).
+MAX_POINTS = 500
+
+
+def normal_pdf(x, mean, std): return (1 / (std * math.sqrt(2 * math.pi))) * np.exp(-0.5 * ((x - mean) / std) ** 2)
+
+
+def decimate(values, n_points=MAX_POINTS, keep=None):
+    """Positions of values to draw: the first and last point, the min and max
+    of each of n_points / 2 equal buckets, and every position where keep is
+    True. Short series are returned whole."""
+    n = len(values)
+    if n <= n_points:
+        return np.arange(n)
+    size = -(-n // max(n_points // 2, 1))
+    v = np.full(size * -(-n // size), np.nan)
+    v[:n] = values
+    v = v.reshape(-1, size)
+    base = np.arange(len(v)) * size
+    nan = np.isnan(v)
+    pick = np.zeros(n, dtype=bool)
+    pick[[0, n - 1]] = True
+    for pos in (base + np.argmin(np.where(nan, np.inf, v), axis=1), base + np.argmax(np.where(nan, -np.inf, v), axis=1)):
+        pick[pos[pos < n]] = True
+    if keep is not None:
+        pick |= np.asarray(keep, dtype=bool)
+    return np.flatnonzero(pick)
+
+
+def _in_window(part, window):
+    """Mask of the rows of part inside the Batch_Order window (first, last)."""
+    if window is None:
+        return np.ones(len(part), dtype=bool)
+    order = part[ORDER_COL].to_numpy()
+    return (order >= window[0]) & (order <= window[1])
+
+
+def _x_col(parts):
+    """x column of the drawn parts: batch codes, or Batch_Order for long series."""
+    return ORDER_COL if max(len(p) for p in parts) > LARGE_SERIES else BATCH_COL
+
+
+def _line(ax, part, x, y, keep=None, fmt="o-", **kw):
+    """Plot y against part[x]; decimated (no markers) on the Batch_Order axis."""
+    if x == ORDER_COL:
+        pos = decimate(np.asarray(y, dtype=float), MAX_POINTS, keep)
+        return ax.plot(part[x].to_numpy()[pos], np.asarray(y)[pos], fmt.replace("o", ""), **kw)
+    return ax.plot(part[x], y, fmt, **kw)
+
+
+def _order_labels(ax, parts, x):
+    """Sparse batch-code tick labels on a Batch_Order axis."""
+    if x != ORDER_COL:
+        return
+    codes = {o: c for p in parts for o, c in zip(p[ORDER_COL].tolist(), p[BATCH_COL].tolist())}
+    ax.xaxis.set_major_locator(MaxNLocator(nbins=12, integer=True))
+    ax.xaxis.set_major_formatter(FuncFormatter(lambda v, _: codes.get(int(round(v)), "")))
+
+
+def _finish(fig, ax, title):
+    ax.set_title(title); ax.legend(bbox_to_anchor=(1.02, 1), loc="upper left"); ax.grid(True); ax.tick_params(axis="x", rotation=45); fig.subplots_adjust(right=0.78)
+    return fig
+
+
+def _phase2_marker(parts, phase2_from, x=BATCH_COL, window=None):
+    """x (batch code or Batch_Order) of the first Phase II batch drawn (where
+    the Phase II line goes); None when it falls outside the zoom window."""
+    p2 = [p[p[ORDER_COL] >= phase2_from] for p in parts]
+    p2 = [p.loc[p[ORDER_COL].idxmin()] for p in p2 if not p.empty]
+    if not p2: return None
+    first = min(p2, key=lambda r: r[ORDER_COL])
+    if window is not None and not window[0] <= first[ORDER_COL] <= window[1]: return None
+    return first[x]
+
+
+def _ooc(part, lim):
+    """Mask of values outside (LCL, UCL), or None without limits."""
+    if lim[0] is None or lim[1] is None:
+        return None
+    return ((part["value"] > lim[1]) | (part["value"] < lim[0])).to_numpy()
+
+
+def combined(lab, line, title, lab_lim, line_lim, phase2_from, window=None):
+    lab_w, line_w = lab[_in_window(lab, window)], line[_in_window(line, window)]
+    x = _x_col((lab_w, line_w))
+    control_batch_code = _phase2_marker((lab, line), phase2_from, x, window) if phase2_from is not None else None
+    lab, line = lab_w, line_w
+    out_lab, out_line = _ooc(lab, lab_lim), _ooc(line, line_lim)
+    fig, ax = plt.subplots(figsize=(12, 4))
+    _line(ax, lab, x, lab["value"], out_lab, label="LAB", color="#1f77b4")
+    _line(ax, line, x, line["value"], out_line, label="LINE", color="#2ca02c")
+    if control_batch_code is not None:
+        ax.axvline(x=control_batch_code, color="#b22222", linestyle="--", linewidth=1.5)
+        ax.text(control_batch_code, ax.get_ylim()[1] * 0.97, "Phase II", color="#b22222", fontsize=9, ha="center", va="top")
+    if out_lab is not None: ax.scatter(lab[x][out_lab], lab["value"][out_lab], color="red", s=80, zorder=5)
+    if out_line is not None: ax.scatter(line[x][out_line], line["value"][out_line], color="red", s=80, zorder=5)
+    if lab_lim[0] is not None: ax.axhline(lab_lim[0], color="#1f77b4", linestyle=":", label="LAB LCL"); ax.axhline(lab_lim[1], color="#1f77b4", linestyle=":", label="LAB UCL")
+    if line_lim[0] is not None: ax.axhline(line_lim[0], color="red", label="LINE LCL"); ax.axhline(line_lim[1], color="red", label="LINE UCL")
+    _order_labels(ax, (lab, line), x)
+    return _finish(fig, ax, title)
+
+
+def combined_phase2(lab, line, title, lab_lim, line_lim, phase2_from, window=None):
+    if phase2_from is None: return None
+    lab2 = lab[lab[ORDER_COL] >= phase2_from]; line2 = line[line[ORDER_COL] >= phase2_from]
+    if lab2.empty and line2.empty: return None
+    # Nelson rules run on the whole Phase II sequence, before zooming
+    nels = [nelson_rules(p["value"].to_numpy(dtype=float)) > 0 for p in (lab2, line2)]
+    wins = [_in_window(p, window) for p in (lab2, line2)]
+    x = _x_col([p[w] for p, w in zip((lab2, line2), wins)])
+    control_batch_code = _phase2_marker((lab2, line2), phase2_from, x, window)
+    (lab2, line2), nels = [p[w] for p, w in zip((lab2, line2), wins)], [n[w] for n, w in zip(nels, wins)]
+    outs = [_ooc(lab2, lab_lim), _ooc(line2, line_lim)]
+    fig, ax = plt.subplots(figsize=(12, 4))
+    for part, out, nel, name, colr in zip((lab2, line2), outs, nels, ("LAB", "LINE"), ("#1f77b4", "#2ca02c")):
+        if not part.empty: _line(ax, part, x, part["value"], nel if out is None else nel | out, label=name, color=colr)
+    for part, out in zip((lab2, line2), outs):
+        if not part.empty and out is not None: ax.scatter(part[x][out], part["value"][out], color="red", s=90, zorder=6)
+    for part, nel in zip((lab2, line2), nels):
+        if nel.any(): ax.scatter(part[x][nel], part["value"][nel], facecolors="none", edgecolors="#ff8c00", s=180, linewidths=2, zorder=7, label="Nelson rule")
+    if control_batch_code is not None: ax.axvline(x=control_batch_code, color="#b22222", linestyle="--", linewidth=1.5, label="Phase II start")
+    if lab_lim[0] is not None: ax.axhline(lab_lim[0], color="#1f77b4", linestyle=":", label="LAB LCL"); ax.axhline(lab_lim[1], color="#1f77b4", linestyle=":", label="LAB UCL")
+    if line_lim[0] is not None: ax.axhline(line_lim[0], color="red", label="LINE LCL"); ax.axhline(line_lim[1], color="red", label="LINE UCL")
+    _order_labels(ax, (lab2, line2), x)
+    return _finish(fig, ax, title)
+
+
+def shift_phase2(lab, line, title, mode, params, phase2_from, window=None):
+    """CUSUM / EWMA of the Phase II batches, standardized by the Phase I mean / std (σ units)."""
+    if phase2_from is None: return None
+    x = _x_col([p[(p[ORDER_COL] >= phase2_from).to_numpy() & _in_window(p, window)] for p in (lab, line)])
+    fig, ax = plt.subplots(figsize=(12, 4)); drawn = []
+    for part, name, colr in ((lab, "LAB", "#1f77b4"), (line, "LINE", "#2ca02c")):
+        p2 = (part[ORDER_COL] >= phase2_from).to_numpy()
+        target, sigma = shift.baseline(part["value"], p2)
+        if not p2.any() or not sigma: continue
+        # statistics over the whole Phase II sequence, then cut to the zoom window
+        z = (part["value"].to_numpy(dtype=float)[p2] - target) / sigma
+        win = _in_window(part[p2], window)
+        part = part[p2][win]
+        if part.empty: continue
+        if mode == "CUSUM":
+            hi, lo, sig, _ = shift.cusum(z, 0.0, 1.0, params["k"], params["h"])
+            hi, lo, sig = hi[win], lo[win], sig[win]
+            _line(ax, part, x, hi, sig, color=colr, label=f"{name} C+"); _line(ax, part, x, -lo, sig, "o--", color=colr, label=f"{name} C−")
+            ax.scatter(part[x][sig & (hi > params["h"])], hi[sig & (hi > params["h"])], color="red", s=90, zorder=6)
+            ax.scatter(part[x][sig & (lo > params["h"])], -lo[sig & (lo > params["h"])], color="red", s=90, zorder=6)
+        else:
+            ez, lcl, ucl, sig, _ = shift.ewma(z, 0.0, 1.0, params["lam"], params["L"])
+            ez, lcl, ucl, sig = ez[win], lcl[win], ucl[win], sig[win]
+            _line(ax, part, x, ez, sig, color=colr, label=f"{name} EWMA")
+            lim = decimate(ucl, MAX_POINTS) if x == ORDER_COL else slice(None)
+            ax.step(part[x].to_numpy()[lim], ucl[lim], where="mid", color=colr, linestyle=":", label=f"{name} UCL"); ax.step(part[x].to_numpy()[lim], lcl[lim], where="mid", color=colr, linestyle=":", label=f"{name} LCL")
+            ax.scatter(part[x][sig], ez[sig], color="red", s=90, zorder=6)
+        drawn.append(part)
+    if not drawn: plt.close(fig); return None
+    if mode == "CUSUM": ax.axhline(params["h"], color="red", label="+h"); ax.axhline(-params["h"], color="red", label="−h")
+    ax.axhline(0, color="gray", linewidth=0.8)
+    ax.set_ylabel("σ (Phase I)")
+    _order_labels(ax, drawn, x)
+    return _finish(fig, ax, title)
+
+
+def distribution(values, lcl, ucl, title, bar_color):
+    """Histogram of batch averages with the normal fit; bins outside the limits in red."""
+    mean, std = values.mean(), values.std()
+    fig, ax = plt.subplots(figsize=(5, 4))
+    bins = np.histogram_bin_edges(values, bins=10)
+    counts, _, patches = ax.hist(values, bins=bins, edgecolor="white", color=bar_color, alpha=0.85)
+    for p, l, r in zip(patches, bins[:-1], bins[1:]):
+        center = (l + r) / 2
+        if lcl is not None and ucl is not None and (center < lcl or center > ucl): p.set_facecolor("#ff6b6b")
+    if std > 0:
+        x = np.linspace(mean - 4 * std, mean + 4 * std, 500)
+        ax.plot(x, normal_pdf(x, mean, std) * len(values) * (bins[1] - bins[0]), color="black", linewidth=2)
+    if lcl is not None: ax.axvline(lcl, color="red", linestyle="--", linewidth=1.5, label="LSL")
+    if ucl is not None: ax.axvline(ucl, color="red", linestyle="--", linewidth=1.5, label="USL")
+    ax.text(0.02, 0.95, f"N = {len(values)}\nMean = {mean:.3f}\nStd = {std:.3f}", transform=ax.transAxes, va="top", fontsize=9, bbox=dict(facecolor="white", alpha=0.9))
+    ax.set_title(title); ax.grid(axis="y", alpha=0.3); ax.legend(fontsize=8)
+    return fig
+
+
+def snap_range(lo, hi, step):
+    """(lo, hi) widened to multiples of step plus a 5 % margin, so the range
+    only changes when a value crosses a step boundary."""
+    step = step if step > 0 else 1.0
+    lo, hi = math.floor(lo / step) * step, math.ceil(hi / step) * step
+    pad = (hi - lo) * 0.05 or step
+    return lo - pad, hi + pad
+
+
+# Styles of the calculator limit lines, shared by the base legend and the overlay.
+STD_LINE = dict(color="#d62728", linestyle="--", linewidth=1.5)
+IQR_LINE = dict(color="#1f77b4", linestyle=":", linewidth=2)
+
+
+def limit_base(batch, values, spec, mean, ylim):
+    """Control Limit Calculator chart without its K / k limit lines: process
+    data, spec (LCL, UCL) or None, the mean and legend entries for the lines
+    that are painted on later (spc.render.BaseImage)."""
+    fig, ax = plt.subplots(figsize=(10, 4.5))
+    ax.plot(batch, values, "o-", color="#808080", alpha=0.5, label="Process Data")
+    if spec is not None:
+        ax.axhline(spec[0], color="black", linestyle="-", linewidth=1.5, label="0. Spec")
+        ax.axhline(spec[1], color="black", linestyle="-", linewidth=1.5)
+    ax.plot([], [], label="1. Std (μ ± Kσ)", **STD_LINE)
+    ax.plot([], [], label="2. IQR (k · IQR fences)", **IQR_LINE)
+    ax.axhline(mean, color="#2ca02c", linestyle="-.", alpha=0.5, label="Mean")
+    ax.set_ylim(*ylim)
+    ax.legend(loc="center left", bbox_to_anchor=(1.02, 0.5), fontsize=9)
+    ax.grid(True, alpha=0.3)
+    plt.setp(ax.get_xticklabels(), rotation=45)
+    fig.subplots_adjust(right=0.75, bottom=0.2)
+    return fig
+
+
+def tradeoff(sweep, threshold, title):
+    """False-alarm rate vs derived ΔE UCL of a K / k sweep (spc.calculator)."""
+    fig, ax = plt.subplots(figsize=(10, 4.5))
+    for method, style in (("Standard", STD_LINE), ("IQR", IQR_LINE)):
+        part = sweep[sweep["Method"] == method]
+        ax.plot(part["ΔE UCL"], part["False-alarm rate"] * 100, marker="o", markersize=3, label=method, **{**style, "linestyle": "-"})
+        for _, r in part.iloc[::max(len(part) // 6, 1)].iterrows():
+            ax.annotate(f"{r['K / k']:g}", (r["ΔE UCL"], r["False-alarm rate"] * 100), fontsize=7, xytext=(3, 3), textcoords="offset points", color=style["color"])
+    ax.axvline(threshold, color="black", linestyle="--", linewidth=1.2, label=f"ΔE limit {threshold}")
+    ax.set_xlabel("Derived ΔE UCL")
+    ax.set_ylabel("False-alarm rate (% of batches)")
+    ax.set_title(title)
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    return fig
+
+
+def thickness_scatter(thickness, de):
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.scatter(thickness, de, alpha=0.75)
+    if len(de) > 0:
+        ax.axhline(de.mean(), linestyle="--", linewidth=2, label=f"Mean ΔE = {de.mean():.2f}")
+    ax.set_xlabel("Average Thickness")
+    ax.set_ylabel("ΔE")
+    ax.set_title("Thickness – Color Relationship per Coil")
+    ax.legend()
+    ax.grid(True, linestyle="--", alpha=0.4)
+    return fig
+
+
+def de_distribution(data_de):
+    if len(data_de) == 0: return None
+    fig, ax = plt.subplots(figsize=(10, 4))
+    mean_de, std_de = data_de.mean(), data_de.std()
+    ax.hist(data_de, bins=20, density=True, alpha=0.7, edgecolor="black", label="ΔE Histogram")
+    if std_de > 0:
+        x_de = np.linspace(mean_de - 5*std_de, mean_de + 5*std_de, 1000)
+        ax.plot(x_de, normal_pdf(x_de, mean_de, std_de), linewidth=3, label="Normal Distribution")
+    ax.axvline(mean_de, linestyle="--", linewidth=2, label=f"Mean = {mean_de:.2f}")
+    ax.set_xlabel("ΔE")
+    ax.set_ylabel("Density")
+    ax.set_title("ΔE Distribution")
+    ax.legend()
+    ax.grid(True, linestyle="--", alpha=0.4)
+    return fig
+
+
+def thickness_distribution(data, LSL, USL):
+    mean, std = data.mean(), data.std()
+    fig, ax = plt.subplots(figsize=(10, 4))
+    ax.hist(data, bins=20, density=True, alpha=0.7, edgecolor="black", label="Thickness Histogram")
+    x = np.linspace(mean - 5 * std, mean + 5 * std, 1000)
+    ax.plot(x, normal_pdf(x, mean, std), linewidth=3, label="Normal Distribution")
+    ax.axvline(mean, linestyle="--", linewidth=2, color="red", label=f"Mean = {mean:.2f}")
+    ax.axvline(LSL, linestyle="--", linewidth=2, color="green", label=f"LSL = {LSL:.2f}")
+    ax.axvline(USL, linestyle="--", linewidth=2, color="green", label=f"USL = {USL:.2f}")
+    ax.axvspan(LSL, USL, alpha=0.15, label="Spec Zone")
+    ax.set_xlim(mean - 5 * std, mean + 5 * std)
+    ax.set_xlabel("Average Thickness")
+    ax.set_ylabel("Density")
+    ax.grid(True, linestyle="--", alpha=0.4)
+    ax.legend()
+    return fig
+
+
+def coil_correlation(coil_df, factor_col, factor_label, ooc_mask, fit=None):
+    """Phase II thickness vs color factor per coil; fit = (slope, intercept, r2) or None."""
+    x = coil_df["Avergage Thickness"].values
+    fig, ax = plt.subplots(figsize=(9, 6))
+    ax.scatter(coil_df[~ooc_mask]["Avergage Thickness"], coil_df[~ooc_mask][factor_col], alpha=0.7, label="Normal Coil")
+    if ooc_mask.any():
+        ax.scatter(coil_df[ooc_mask]["Avergage Thickness"], coil_df[ooc_mask][factor_col], color="red", s=80, label="OOC Coil")
+    if fit is not None:
+        slope, intercept, r2 = fit
+        ax.plot(np.linspace(x.min(), x.max(), 100), slope * np.linspace(x.min(), x.max(), 100) + intercept, linestyle="--", linewidth=2, label=f"Regression Line (R² = {r2:.3f})")
+    ax.set_title(f"Phase II – Per Coil Analysis\nThickness vs {factor_label}" + (f" | r = {coil_df['Avergage Thickness'].corr(coil_df[factor_col]):.3f}, R² = {fit[2]:.3f}" if fit is not None else ""))
+    ax.set_xlabel("Average Thickness (per Coil)")
+    ax.set_ylabel(factor_label)
+    ax.legend()
+    ax.grid(True, linestyle="--", alpha=0.4)
+    return fig
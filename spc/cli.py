@@ -0,0 +1,127 @@
+"""Command-line entry point: ``python -m spc <command>``.
+
+    python -m spc ingest                                  # sync both snapshots
+    python -m spc run --color A01 --out results.parquet   # per-batch OOC results
+    python -m spc run --all --out results.parquet
+    python -m spc status --out status.csv                 # Limit Status Summary
+    python -m spc offsets --out offsets.csv               # Lab-to-Line offsets, all colors
+    python -m spc thickness --out thickness.csv           # thickness-sensitive colors
+    python -m spc intervals --seed 0 --out intervals.csv  # bootstrap CIs of calculator limits
+    python -m spc capability --out capability.csv         # Cp / Cpk / Pp / Ppk, all colors
+    python -m spc report --colors A01 B02 --out report.pdf
+    python -m spc monitor --alerts alerts.jsonl
+
+Sources default to SPC_DATA_SOURCE / SPC_LIMIT_SOURCE, as in the dashboard.
+Nothing here imports Streamlit.
+"""
+import argparse
+import logging
+import os
+import sys
+
+log = logging.getLogger(__name__)
+
+# Subcommands that own their argument parsing.
+DELEGATED = {"report": "spc.report", "monitor": "spc.monitor"}
+
+
+def _sources(p):
+    p.add_argument("--source", default=os.environ.get("SPC_DATA_SOURCE"), required="SPC_DATA_SOURCE" not in os.environ,
+                   help="inspection CSV (path or URL)")
+    p.add_argument("--limits", default=os.environ.get("SPC_LIMIT_SOURCE"), required="SPC_LIMIT_SOURCE" not in os.environ,
+                   help="limit sheet CSV (path or URL)")
+    p.add_argument("--snapshots", default=os.environ.get("SPC_SNAPSHOT_DIR", ".spc_snapshots"))
+    p.add_argument("--max-age", type=float, default=0, help="reuse a URL snapshot younger than this (seconds)")
+
+
+def _parser():
+    p = argparse.ArgumentParser(prog="python -m spc", description="SPC pipeline without Streamlit")
+    sub = p.add_subparsers(dest="command", required=True)
+    _sources(sub.add_parser("ingest", help="sync the data and limit snapshots"))
+    run = sub.add_parser("run", help="per-batch OOC results of one or more colors")
+    _sources(run)
+    run.add_argument("--color", action="append", default=[], help="color code (repeatable)")
+    run.add_argument("--all", action="store_true", help="every color")
+    run.add_argument("--out", required=True, help="output file (.parquet or .csv)")
+    status = sub.add_parser("status", help="Limit Status Summary of all colors")
+    _sources(status)
+    status.add_argument("--consec", type=int, default=2, help="consecutive OOC threshold")
+    status.add_argument("--total", type=int, default=5, help="total OOC threshold")
+    status.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    status.add_argument("--out", required=True, help="output file (.parquet or .csv)")
+    offsets = sub.add_parser("offsets", help="Lab-to-Line scale-up offsets of all colors")
+    _sources(offsets)
+    offsets.add_argument("--level", type=float, default=0.95, help="prediction interval level")
+    offsets.add_argument("--out", required=True, help="output file (.parquet or .csv)")
+    thickness = sub.add_parser("thickness", help="colors ranked by Phase II thickness sensitivity")
+    _sources(thickness)
+    thickness.add_argument("--out", required=True, help="output file (.parquet or .csv)")
+    intervals = sub.add_parser("intervals", help="bootstrap confidence intervals of the calculator limits, all colors")
+    _sources(intervals)
+    intervals.add_argument("--series", choices=["LINE", "LAB"], default="LINE", help="which readings the limits are for")
+    intervals.add_argument("--sigma", type=float, default=3.0, help="Sigma (K) of the standard limits")
+    intervals.add_argument("--iqr-k", type=float, default=1.5, help="IQR sensitivity (k)")
+    intervals.add_argument("--resamples", type=int, default=2000)
+    intervals.add_argument("--level", type=float, default=0.95, help="confidence level")
+    intervals.add_argument("--seed", type=int, default=None)
+    intervals.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    intervals.add_argument("--out", required=True, help="output file (.parquet or .csv)")
+    capability = sub.add_parser("capability", help="process capability of every color × source × factor")
+    _sources(capability)
+    capability.add_argument("--out", required=True, help="output file (.parquet or .csv)")
+    for name, module in DELEGATED.items():
+        sub.add_parser(name, help=f"see python -m {module} --help", add_help=False)
+    return p
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in DELEGATED:
+        import importlib
+        return importlib.import_module(DELEGATED[argv[0]]).main(argv[1:])
+    args = _parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    from . import metrics, pipeline
+    with metrics.Trace(f"cli.{args.command}") as trace:
+        _run(args, pipeline)
+    # one JSON line with the stage timings of this run (logger spc.metrics)
+    trace.log()
+    return 0
+
+
+def _run(args, pipeline):
+    data = pipeline.load(args.source, args.limits, args.snapshots, max_age=args.max_age)
+    log.info("data %s (%d rows), limits %s", data.data_version, len(data.rows), data.limit_version)
+    for problem in data.limits.problems:
+        log.warning("limit sheet: %s", problem)
+    if args.command == "run":
+        if not args.all and not args.color:
+            _parser().error("run needs --color or --all")
+        colors = None if args.all else args.color
+        unknown = sorted(set(colors or []) - set(data.colors))
+        if unknown:
+            log.warning("no rows for color(s): %s", ", ".join(unknown))
+        frame = pipeline.results(data, colors)
+        pipeline.write(frame, args.out)
+        log.info("wrote %s (%d batch points)", args.out, len(frame))
+    elif args.command == "status":
+        frame = pipeline.status(data, args.consec, args.total, workers=args.workers)
+        pipeline.write(frame, args.out)
+        log.info("wrote %s (%d colors)", args.out, len(frame))
+    elif args.command == "offsets":
+        frame = pipeline.offsets(data, args.level)
+        pipeline.write(frame, args.out)
+        log.info("wrote %s (%d color × factor models)", args.out, len(frame))
+    elif args.command == "thickness":
+        frame = pipeline.thickness_ranking(data)
+        pipeline.write(frame, args.out)
+        log.info("wrote %s (%d colors)", args.out, len(frame))
+    elif args.command == "intervals":
+        frame = pipeline.limit_intervals(data, args.series, args.sigma, args.iqr_k, args.resamples, args.level, args.seed, args.workers)
+        pipeline.write(frame, args.out)
+        log.info("wrote %s (%d colors)", args.out, frame["Color Code"].nunique())
+    elif args.command == "capability":
+        frame = pipeline.capability_catalog(data)
+        pipeline.write(frame, args.out)
+        log.info("wrote %s (%d series)", args.out, len(frame))
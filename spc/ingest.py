@@ -0,0 +1,345 @@
+"""Ingestion layer.
+
+The inspection sheet and the limit sheet are pulled once, cleaned (header
+whitespace, Time parsing, numeric coercion) and stored as a typed columnar
+snapshot. The dashboard then opens the snapshot instead of downloading and
+re-parsing the CSV export on every cache miss.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+import urllib.request
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from .metrics import count, span, timed
+
+try:
+    import pyarrow  # noqa: F401
+    SNAPSHOT_FORMAT = "parquet"
+except ImportError:
+    SNAPSHOT_FORMAT = "pickle"
+
+log = logging.getLogger(__name__)
+
+# Bumped when normalization changes, so older snapshots are re-ingested:
+# 2 stored 塗料編號 / 製造批號 as categoricals, 3 keeps Coil No. as text.
+SCHEMA = 3
+
+# Appended tails are kept as separate part files up to this many parts.
+MAX_PARTS = 32
+
+NUMERIC_COLUMNS = [
+    "入料檢測 ΔL 正面", "入料檢測 Δa 正面", "入料檢測 Δb 正面",
+    "正-北 ΔL", "正-南 ΔL", "正-北 Δa", "正-南 Δa", "正-北 Δb", "正-南 Δb",
+    "Avergage Thickness", "Average value ΔE 正面", "Average value ΔL 正面",
+    "Average value Δa 正面", "Average value Δb 正面"
+]
+
+# Identifier columns stored as categoricals: few distinct values, compared
+# and grouped on constantly (color filter, batch group-bys). Coil No. is
+# nearly unique per row, where a categorical costs more than it saves.
+CATEGORY_COLUMNS = ["塗料編號", "製造批號"]
+
+# Local exports (e.g. "DATA 1.csv") carry the unit in the thickness header.
+COLUMN_ALIASES = {"Avergage Thickness (µm)正面": "Avergage Thickness"}
+
+
+def clean_columns(columns):
+    """Collapse line breaks, full-width spaces and repeated whitespace in headers."""
+    return (
+        pd.Index(columns).astype(str)
+        .str.replace("\r\n", " ", regex=False).str.replace("\n", " ", regex=False)
+        .str.replace("　", " ", regex=False).str.replace(r"\s+", " ", regex=True).str.strip()
+    )
+
+
+def normalize_data(df):
+    df.columns = clean_columns(df.columns)
+    aliases = {k: v for k, v in COLUMN_ALIASES.items() if k in df.columns and v not in df.columns}
+    df = df.rename(columns=aliases)
+    df["Time"] = pd.to_datetime(df["Time"], errors="coerce")
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("string").str.strip().astype("category")
+    return df
+
+
+def normalize_limits(df):
+    df.columns = clean_columns(df.columns)
+    return df
+
+
+def is_url(source):
+    return str(source).startswith(("http://", "https://"))
+
+
+@timed("ingest.fetch")
+def read_source(source):
+    """Raw bytes of a CSV export, from a URL or a local path."""
+    if is_url(source):
+        with urllib.request.urlopen(source, timeout=60) as resp:
+            return resp.read()
+    with open(source, "rb") as fh:
+        return fh.read()
+
+
+def source_stamp(source):
+    """(mtime, size) of a local source, None for URLs."""
+    if is_url(source):
+        return None
+    st = os.stat(source)
+    return [st.st_mtime, st.st_size]
+
+
+class SnapshotStore:
+    """Directory of normalized tables: per name, a JSON meta file (watermark,
+    version, list of part files) plus the Parquet/pickle part files."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _meta_path(self, name):
+        return os.path.join(self.root, f"{name}.meta.json")
+
+    def read_meta(self, name):
+        try:
+            with open(self._meta_path(name), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _read_file(self, path):
+        if path.endswith(".parquet"):
+            return pd.read_parquet(path)
+        return pd.read_pickle(path)
+
+    def _write_file(self, stem, frame):
+        """Write frame next to stem, returning the file name actually used."""
+        fname = f"{stem}.{SNAPSHOT_FORMAT}"
+        try:
+            if SNAPSHOT_FORMAT == "parquet":
+                frame.to_parquet(os.path.join(self.root, fname + ".tmp"), index=False)
+            else:
+                frame.to_pickle(os.path.join(self.root, fname + ".tmp"))
+        except (ValueError, TypeError, ImportError):
+            # Mixed-type object columns can't always be typed for Parquet.
+            fname = f"{stem}.pickle"
+            frame.to_pickle(os.path.join(self.root, fname + ".tmp"))
+        os.replace(os.path.join(self.root, fname + ".tmp"), os.path.join(self.root, fname))
+        return fname
+
+    def write_meta(self, name, meta):
+        with open(self._meta_path(name) + ".tmp", "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(self._meta_path(name) + ".tmp", self._meta_path(name))
+        return meta
+
+    @timed("ingest.snapshot_read")
+    def read(self, name):
+        meta = self.read_meta(name)
+        if meta is None:
+            return None, None
+        try:
+            parts = [self._read_file(os.path.join(self.root, f)) for f in meta["files"]]
+        except Exception:
+            log.warning("snapshot %s unreadable, ignoring", name, exc_info=True)
+            return None, None
+        frame = parts[0] if len(parts) == 1 else conform_concat(parts)
+        return frame, meta
+
+    @timed("ingest.snapshot_write")
+    def write(self, name, frame, meta):
+        """Replace the snapshot with a single compacted file."""
+        os.makedirs(self.root, exist_ok=True)
+        old = self.read_meta(name)
+        fname = self._write_file(name, frame)
+        meta = self.write_meta(name, dict(meta, files=[fname]))
+        self._remove_stale(old, meta)
+        return meta
+
+    def append(self, name, tail, meta):
+        """Store tail rows as an extra part file; compact once parts pile up."""
+        files = list(meta["files"])
+        if len(files) >= MAX_PARTS:
+            frame, _ = self.read(name)
+            return self.write(name, conform_concat([frame, tail]), meta)
+        files.append(self._write_file(f"{name}.part{len(files):03d}", tail))
+        return self.write_meta(name, dict(meta, files=files))
+
+    def _remove_stale(self, old, meta):
+        for f in set((old or {}).get("files", [])) - set(meta["files"]):
+            try:
+                os.remove(os.path.join(self.root, f))
+            except OSError:
+                pass
+
+
+def conform_concat(frames):
+    """Concatenate snapshot parts, keeping the dtypes of the first part.
+
+    Categorical columns are combined with union_categoricals, so values
+    first seen in a later part are kept.
+    """
+    base = frames[0]
+    cats = [c for c, dtype in base.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    rest = []
+    for part in frames[1:]:
+        part = part.reindex(columns=base.columns)
+        for col, dtype in base.dtypes.items():
+            if col in cats:
+                if not isinstance(part[col].dtype, pd.CategoricalDtype):
+                    part[col] = part[col].astype("category")
+                if part[col].cat.categories.dtype != dtype.categories.dtype:
+                    part[col] = part[col].cat.rename_categories(part[col].cat.categories.astype(dtype.categories.dtype))
+            elif part[col].dtype != dtype:
+                try:
+                    part[col] = part[col].astype(dtype)
+                except (ValueError, TypeError):
+                    pass
+        rest.append(part)
+    out = pd.concat([f.drop(columns=cats) for f in [base] + rest], ignore_index=True)
+    for col in cats:
+        out[col] = union_categoricals([f[col] for f in [base] + rest], sort_categories=True)
+    return out[base.columns]
+
+
+def _watermark(raw, frame, columns, text_columns):
+    times = frame["Time"] if "Time" in frame.columns else None
+    last = times.max() if times is not None else None
+    return {
+        "bytes": len(raw),
+        "sha": hashlib.sha1(raw).hexdigest(),
+        "columns": list(columns),
+        "text_columns": list(text_columns),
+        "rows": len(frame),
+        "last_time": None if last is None or pd.isna(last) else last.isoformat(),
+    }
+
+
+def _full_ingest(store, name, source, normalize, raw):
+    with span("ingest.parse"):
+        parsed = pd.read_csv(io.BytesIO(raw))
+    columns = list(parsed.columns)
+    # Tails are parsed with these forced to text so inference can't drift.
+    text_columns = [c for c in columns if not pd.api.types.is_numeric_dtype(parsed[c])]
+    with span("ingest.clean"):
+        frame = normalize(parsed)
+    meta = dict(
+        _watermark(raw, frame, columns, text_columns),
+        source=str(source), stamp=source_stamp(source), schema=SCHEMA,
+        version=hashlib.sha1(raw).hexdigest()[:12], synced_at=time.time(),
+    )
+    return frame, store.write(name, frame, meta)
+
+
+def ingest(store, name, source, normalize):
+    """Full pull: fetch, normalize once and write the snapshot."""
+    return _full_ingest(store, name, source, normalize, read_source(source))
+
+
+def _starts_row(raw, wm):
+    """True when the bytes after the watermark begin a new row.
+
+    Exports end without a trailing line break, so the watermark usually sits
+    at the end of the last row. Bytes continuing that line are an in-place
+    edit of the last row, not new rows.
+    """
+    return wm == 0 or raw[wm - 1:wm] in (b"\n", b"\r") or raw[wm:wm + 1] in (b"", b"\n", b"\r")
+
+
+def _valid_tail(tail):
+    """Appended rows must carry a parseable Time and a batch number."""
+    for col in ("Time", "製造批號"):
+        if col in tail.columns and tail[col].isna().any():
+            return False
+    return True
+
+
+def sync(store, name, source, normalize, frame=None, meta=None):
+    """Incremental pull keyed on the byte watermark of the last sync.
+
+    When the new export still starts with exactly the bytes seen last time
+    (rows are only ever appended at the end of the sheet), only the tail is
+    parsed, validated, normalized and appended as a new snapshot part. Any
+    other change (edited history or last row, new header, tail rows without
+    Time or batch) falls back to a full ingest. Pass the snapshot as
+    frame/meta when it has already been read.
+
+    Returns (frame, meta, tail); tail is None after a full ingest.
+    """
+    if frame is None:
+        frame, meta = store.read(name)
+    raw = read_source(source)
+    wm = meta.get("bytes") if meta else None
+    if (frame is None or wm is None or meta.get("source") != str(source) or meta.get("schema") != SCHEMA or len(raw) < wm
+            or hashlib.sha1(raw[:wm]).hexdigest() != meta["sha"] or not _starts_row(raw, wm)):
+        frame, meta = _full_ingest(store, name, source, normalize, raw)
+        return frame, meta, None
+
+    tail_raw = raw[wm:]
+    tail = frame.iloc[0:0]
+    if tail_raw.strip():
+        try:
+            with span("ingest.parse_tail"):
+                tail = normalize(pd.read_csv(
+                    io.BytesIO(tail_raw), header=None, names=meta["columns"],
+                    dtype={c: str for c in meta["text_columns"]},
+                ))
+        except (ValueError, pd.errors.ParserError):
+            log.warning("tail of %s failed validation, re-ingesting", name, exc_info=True)
+            frame, meta = _full_ingest(store, name, source, normalize, raw)
+            return frame, meta, None
+    if list(tail.columns) != list(frame.columns) or not _valid_tail(tail):
+        log.warning("tail of %s failed validation, re-ingesting", name)
+        frame, meta = _full_ingest(store, name, source, normalize, raw)
+        return frame, meta, None
+
+    meta = dict(meta, stamp=source_stamp(source), synced_at=time.time())
+    if len(tail):
+        # lineage: this version is the parent's rows plus the tail, so derived
+        # indexes can be extended instead of rebuilt
+        meta.update(parent=meta["version"], parent_rows=len(frame))
+        frame = conform_concat([frame, tail])
+        tail = frame.iloc[len(frame) - len(tail):]
+        meta.update(_watermark(raw, frame, meta["columns"], meta["text_columns"]), version=hashlib.sha1(raw).hexdigest()[:12])
+        meta = store.append(name, tail.reset_index(drop=True), meta)
+    else:
+        meta.update(bytes=len(raw), sha=hashlib.sha1(raw).hexdigest())
+        meta = store.write_meta(name, meta)
+    return frame, meta, tail
+
+
+def is_fresh(meta, source, max_age):
+    if meta is None or meta.get("source") != str(source) or meta.get("schema") != SCHEMA:
+        return False
+    if not is_url(source):
+        return meta.get("stamp") == source_stamp(source)
+    return time.time() - meta.get("synced_at", 0) < max_age
+
+
+def load_table(store, name, source, normalize, max_age=300):
+    """Open the snapshot if it is still current, otherwise sync the new tail.
+
+    Returns (frame, version). When the source can't be reached the last
+    snapshot is served rather than failing the page.
+    """
+    frame, meta = store.read(name)
+    if frame is not None and is_fresh(meta, source, max_age):
+        count("snapshot_loads", table=name, result="fresh")
+        return frame, meta["version"]
+    count("snapshot_loads", table=name, result="sync")
+    try:
+        frame, meta, _ = sync(store, name, source, normalize, frame, meta)
+    except Exception:
+        if frame is None:
+            raise
+        log.warning("could not refresh %s from %s, serving last snapshot", name, source, exc_info=True)
+    return frame, meta["version"]
@@ -0,0 +1,128 @@
+"""Control-limit lookup table.
+
+The limit sheet is parsed once into color -> (source, factor) -> (LCL, UCL)
+plus the control batch number, so lookups are plain dict hits instead of a
+row scan and per-column string matching on every call.
+"""
+import re
+
+import pandas as pd
+
+from .metrics import timed
+
+SOURCES = ["LAB", "LINE"]
+FACTORS = ["ΔL", "ΔA", "ΔB", "ΔE"]
+THICKNESS = "THICKNESS"
+
+
+def color_key(c):
+    return str(c).strip().upper()
+
+
+def _to_float(val):
+    try:
+        num = float(val)
+    except (TypeError, ValueError):
+        return None
+    return None if pd.isna(num) else num
+
+
+def parse_limit_column(col):
+    """(source, factor, "LCL"/"UCL") for a limit header, None for other columns.
+
+    Matching is case-insensitive and accepts "Δa" as well as "DELTA A".
+    Optional thickness spec columns ("Thickness LSL" / "Thickness USL") map
+    to (THICKNESS, THICKNESS, "LCL"/"UCL").
+    """
+    cup = str(col).strip().upper()
+    if "THICK" in cup:
+        kind = "LCL" if "LSL" in cup or "LCL" in cup else "UCL" if "USL" in cup or "UCL" in cup else None
+        return (THICKNESS, THICKNESS, kind) if kind else None
+    kind = "LCL" if "LCL" in cup else "UCL" if "UCL" in cup else None
+    src = next((s for s in SOURCES if s in cup), None)
+    fac = next((f for f in FACTORS if f in cup or f.replace("Δ", "DELTA ") in cup), None)
+    if kind is None or src is None or fac is None:
+        return None
+    return src, fac, kind
+
+
+def parse_control_batch(value):
+    if pd.isna(value):
+        return None
+    if isinstance(value, str):
+        m = re.search(r"\d+", value)
+        if m:
+            return int(m.group())
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class LimitTable:
+    """Indexed view of the limit sheet.
+
+    Raises ValueError when the sheet has no Color_code column; softer header
+    problems (no recognizable LCL/UCL columns, duplicated colors) are listed
+    in ``problems`` so the app can surface them.
+    """
+
+    @timed("limits.parse")
+    def __init__(self, limit_df):
+        if "Color_code" not in limit_df.columns:
+            raise ValueError("Limit sheet has no 'Color_code' column")
+        self.frame = limit_df
+        self.problems = []
+        parsed = {col: parse_limit_column(col) for col in limit_df.columns}
+        limit_cols = [col for col, p in parsed.items() if p is not None]
+        if not limit_cols:
+            self.problems.append("No LCL/UCL columns recognised in the limit sheet")
+        if "Control_batch" not in limit_df.columns:
+            self.problems.append("Limit sheet has no 'Control_batch' column")
+
+        self._rows = {}
+        self._limits = {}
+        self._control = {}
+        self._configured = set()
+        keys = limit_df["Color_code"].map(color_key)
+        dup = sorted(set(keys[keys.duplicated()]))
+        if dup:
+            self.problems.append(f"Duplicated Color_code rows (first one is used): {', '.join(dup)}")
+        for pos, key in enumerate(keys):
+            if key in self._rows:
+                continue
+            self._rows[key] = pos
+            rec = limit_df.iloc[pos]
+            lim = {}
+            for col in limit_cols:
+                src, fac, kind = parsed[col]
+                num = _to_float(rec[col])
+                if num is not None:
+                    lcl, ucl = lim.get((src, fac), (None, None))
+                    lim[(src, fac)] = (num, ucl) if kind == "LCL" else (lcl, num)
+            self._limits[key] = lim
+            if "Control_batch" in limit_df.columns:
+                self._control[key] = parse_control_batch(rec["Control_batch"])
+            # "Current Limits" in the status view: any LCL/UCL cell filled in
+            if rec[[c for c in limit_df.columns if "LCL" in c or "UCL" in c]].notna().any():
+                self._configured.add(key)
+
+    def get(self, color, src, fac):
+        """(LCL, UCL) for color/source/factor; each is None when not set."""
+        lim = self._limits.get(color_key(color))
+        if lim is None:
+            return None, None
+        return lim.get((str(src).strip().upper(), str(fac).strip().upper()), (None, None))
+
+    def control_batch(self, color):
+        return self._control.get(color_key(color))
+
+    def has_limits(self, color):
+        return color_key(color) in self._configured
+
+    def row(self, color):
+        """The sheet row of a color as a one-row DataFrame (empty if unknown)."""
+        pos = self._rows.get(color_key(color))
+        if pos is None:
+            return self.frame.iloc[0:0]
+        return self.frame.iloc[[pos]]
@@ -0,0 +1,195 @@
+"""Lightweight instrumentation: timed spans, counters and per-run traces.
+
+Spans and counters go to a process-wide registry that renders in the
+Prometheus text format (``prometheus()``, or ``serve(port)`` for a /metrics
+endpoint). A Trace collects the spans, section laps and counters of one
+dashboard rerun for the debug panel and a one-line JSON log record. Spans
+outside a trace (CLI, monitor, worker threads) only feed the registry.
+"""
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("spc_trace", default=None)
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Registry:
+    """Thread-safe counters and timing summaries keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.timings = {}  # key -> [count, sum, max]
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            t = self.timings.setdefault(key, [0, 0.0, 0.0])
+            t[0] += 1
+            t[1] += seconds
+            t[2] = max(t[2], seconds)
+
+    def prometheus(self, prefix="spc_"):
+        def fmt(labels):
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timings = sorted(self.timings.items())
+        lines, typed = [], set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {prefix}{name}_total counter")
+                typed.add(name)
+            lines.append(f"{prefix}{name}_total{fmt(labels)} {value}")
+        for (name, labels), (count, total, peak) in timings:
+            if name not in typed:
+                lines.append(f"# TYPE {prefix}{name} summary")
+                typed.add(name)
+            lines.append(f"{prefix}{name}_count{fmt(labels)} {count}")
+            lines.append(f"{prefix}{name}_sum{fmt(labels)} {total:.6f}")
+            lines.append(f"{prefix}{name}_max{fmt(labels)} {peak:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def count(name, value=1, **labels):
+    """Increment a counter in the registry and in the current trace."""
+    REGISTRY.inc(name, value, **labels)
+    trace = _current.get()
+    if trace is not None:
+        key = (name, _labels(labels))
+        trace.counters[key] = trace.counters.get(key, 0) + value
+
+
+@contextmanager
+def span(name):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t
+        REGISTRY.observe("span_seconds", dt, span=name)
+        trace = _current.get()
+        if trace is not None:
+            trace.spans.append((name, dt))
+
+
+def timed(name):
+    """Decorator form of span()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+class Trace:
+    """Spans, section laps and counters of one run (e.g. one Streamlit rerun).
+
+    With memory=True tracemalloc is started (if needed) and the peak traced
+    allocation of the process during the run is reported; tracing slows
+    Python allocations down, so it is opt-in.
+    """
+
+    def __init__(self, name, memory=False):
+        self.name = name
+        self.memory = memory
+        self.spans = []
+        self.laps = []
+        self.counters = {}
+        self.peak_bytes = None
+        self.total = None
+        self._started_tracemalloc = False
+
+    def __enter__(self):
+        return self.start()
+
+    def start(self):
+        """Make this the current trace (for code that can't use ``with``)."""
+        self._token = _current.set(self)
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            tracemalloc.reset_peak()
+        self._start = self._last = time.perf_counter()
+        return self
+
+    def lap(self, section):
+        """Close a view section: time since the previous lap (or the start)."""
+        now = time.perf_counter()
+        self.laps.append((section, now - self._last))
+        REGISTRY.observe("section_seconds", now - self._last, section=section)
+        self._last = now
+
+    def __exit__(self, *exc):
+        self.finish()
+        return False
+
+    def finish(self):
+        if self.total is not None:
+            return self
+        self.total = time.perf_counter() - self._start
+        REGISTRY.observe("run_seconds", self.total, run=self.name)
+        if self.memory and tracemalloc.is_tracing():
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+        _current.reset(self._token)
+        return self
+
+    def as_dict(self):
+        return {
+            "run": self.name, "total_s": round(self.total or 0.0, 6), "peak_bytes": self.peak_bytes,
+            "laps": [{"section": s, "s": round(d, 6)} for s, d in self.laps],
+            "spans": [{"span": s, "s": round(d, 6)} for s, d in self.spans],
+            "counters": [dict(labels, name=name, value=v) for (name, labels), v in self.counters.items()],
+        }
+
+    def log(self, level=logging.INFO):
+        log.log(level, json.dumps(self.as_dict(), ensure_ascii=False, default=str))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, host="0.0.0.0"):
+    """Serve /metrics (Prometheus text format) from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="spc-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,411 @@
+"""Streaming SPC monitor.
+
+Rows are pushed one at a time. Each row updates the running LAB / LINE sums
+of its batch, and the revised batch average is checked against the sheet
+limits and the Nelson rules, as the dashboard's OOC table does: batches are
+numbered in Batch_Order (first Time, then batch code), and the center / σ
+are Welford running mean / variance of the Phase II batches of each color /
+source / factor, with a 15-point rule window in Batch_Order. A push is O(1)
+unless a backdated row moves a batch, which renumbers that color. The
+monitor can run as a long-lived process tailing the inspection sheet:
+
+    python -m spc.monitor --source "DATA 1.csv" --limits limits.csv --alerts alerts.jsonl
+"""
+import argparse
+import bisect
+import json
+import logging
+import math
+import os
+import sys
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+from . import ingest
+from .aggregate import BATCH_COL, COLOR_COL, FACTORS, SOURCES, batch_order, lab_col, line_cols
+from .limits import LimitTable
+from .rules import describe, nelson_rules
+
+log = logging.getLogger(__name__)
+
+# Longest Nelson pattern (rule 7) spans 15 points.
+RULE_WINDOW = 15
+
+# Revised batch values remove / re-push their Welford terms; the series
+# stats are recomputed from the values this often so rounding can't drift.
+RESEED_EVERY = 1000
+
+
+class Welford:
+    """Running mean / sample variance, with O(1) removal of a past value."""
+
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self):
+        self.n, self.mean, self.m2 = 0, 0.0, 0.0
+
+    def push(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def remove(self, x):
+        if self.n <= 1:
+            self.n, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        mean_old = (self.n * self.mean - x) / (self.n - 1)
+        self.m2 = max(self.m2 - (x - mean_old) * (x - self.mean), 0.0)
+        self.n -= 1
+        self.mean = mean_old
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else float("nan")
+
+
+class SeriesState:
+    """Running state of the Phase II batch series of one color / source / factor.
+
+    Keeps Welford statistics over the Phase II batch values (the mean / σ
+    detect_out_of_control uses) and the batches in Batch_Order for the
+    Nelson rule window. A batch value is revised in place as more of its
+    coils arrive.
+    """
+
+    __slots__ = ("stats", "orders", "codes", "values", "revisions")
+
+    def __init__(self):
+        self.stats = Welford()
+        self.orders, self.codes = [], []  # Batch_Order / code of the batches, ascending
+        self.values = {}
+        self.revisions = 0
+
+    def reseed(self):
+        """Recompute the running stats from the batch values (two-pass)."""
+        v = np.fromiter(self.values.values(), dtype=float, count=len(self.values))
+        self.stats = Welford()
+        self.stats.n = len(v)
+        if len(v):
+            self.stats.mean = float(v.mean())
+            self.stats.m2 = float(((v - self.stats.mean) ** 2).sum())
+        self.revisions = 0
+
+    def append(self, order, code, value):
+        """Add the batch after the last one, without judging it."""
+        self.orders.append(order)
+        self.codes.append(code)
+        self.values[code] = value
+        self.stats.push(value)
+
+    def update(self, order, code, value):
+        """Set the value of batch ``code`` at Batch_Order ``order``; returns its
+        Nelson bitmask against the mean / σ of the series including it."""
+        old = self.values.get(code)
+        if old is None:
+            pos = bisect.bisect_left(self.orders, order)
+            self.orders.insert(pos, order)
+            self.codes.insert(pos, code)
+        else:
+            self.stats.remove(old)
+            self.revisions += 1
+        self.values[code] = value
+        self.stats.push(value)
+        if self.revisions >= RESEED_EVERY:
+            self.reseed()
+        sigma = self.stats.std
+        if not sigma > 0:
+            return 0
+        end = bisect.bisect_right(self.orders, order)
+        pts = [self.values[c] for c in self.codes[max(end - RULE_WINDOW, 0):end]]
+        return int(nelson_rules(np.array(pts), center=self.stats.mean, sigma=sigma)[-1])
+
+    def masks(self):
+        """Nelson bitmask of every batch in Batch_Order, as the dashboard computes them."""
+        return nelson_rules(np.array([self.values[c] for c in self.codes]), center=self.stats.mean, sigma=self.stats.std)
+
+
+class BatchAccumulator:
+    """Running LAB / LINE sums of one batch."""
+
+    __slots__ = ("code", "index", "first_time", "rows", "sums", "counts")
+
+    def __init__(self, code, index, first_time):
+        self.code, self.index, self.first_time, self.rows = code, index, first_time, 0
+        self.sums = {}
+        self.counts = {}
+
+    def add(self, key, value):
+        if math.isnan(value):
+            return False
+        self.sums[key] = self.sums.get(key, 0.0) + value
+        self.counts[key] = self.counts.get(key, 0) + 1
+        return True
+
+    def mean(self, key):
+        return self.sums[key] / self.counts[key]
+
+    def order_key(self):
+        """Sort key of the batch within its color, as batch_order ranks them."""
+        t = self.first_time
+        return (1, 0, str(self.code)) if t is None or pd.isna(t) else (0, pd.Timestamp(t).value, str(self.code))
+
+
+def _num(row, col):
+    try:
+        return float(row.get(col))
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class OnlineMonitor:
+    """Streaming counterpart of detect_out_of_control.
+
+    push(row) takes one inspection row (a dict keyed by the cleaned column
+    names), folds it into its batch average, re-judges that batch point on
+    the six LAB / LINE series and returns any new alerts. Batches are
+    numbered per color in Batch_Order; alerts are only raised from the
+    control batch on (Phase II), and a batch is reported again only when
+    its verdict changes.
+    """
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.batches = {}  # (color, code) -> BatchAccumulator
+        self.order = {}  # color -> (order keys, codes) of its batches in Batch_Order
+        self.series = {}  # (color, src, f) -> SeriesState of the Phase II batches
+        self.phase2 = {}  # color -> control batch its series were built for
+        self.reported = {}
+
+    def _fold(self, row):
+        """Fold one row into its batch; returns (color, batch, order key before
+        the row, updated (src, factor) keys), or None for rows without a batch."""
+        color, code = row.get(COLOR_COL), row.get(BATCH_COL)
+        if pd.isna(color) or pd.isna(code):
+            return None
+        batch = self.batches.get((color, code))
+        if batch is None:
+            old_key = None
+            batch = self.batches[(color, code)] = BatchAccumulator(code, 0, None)
+        else:
+            old_key = batch.order_key()
+        batch.rows += 1
+        t = row.get("Time")
+        if t is not None and not pd.isna(t) and (batch.first_time is None or pd.isna(batch.first_time) or t < batch.first_time):
+            batch.first_time = t
+        touched = []
+        for f in FACTORS:
+            n, s = (_num(row, c) for c in line_cols(f))
+            line = (n + s) / 2 if not (math.isnan(n) or math.isnan(s)) else s if math.isnan(n) else n
+            for src, x in (("lab", _num(row, lab_col(f))), ("line", line)):
+                if batch.add((src, f), x):
+                    touched.append((src, f))
+        return color, batch, old_key, touched
+
+    def _place(self, color, batch, old_key):
+        """Keep the color's batches in Batch_Order; True when other batches were renumbered."""
+        keys, codes = self.order.setdefault(color, ([], []))
+        key = batch.order_key()
+        if key == old_key:
+            return False
+        if old_key is not None:
+            old_pos = bisect.bisect_left(keys, old_key)
+            del keys[old_pos], codes[old_pos]
+        pos = bisect.bisect_left(keys, key)
+        keys.insert(pos, key)
+        codes.insert(pos, batch.code)
+        if old_key is None and pos == len(keys) - 1:
+            batch.index = pos + 1
+            return False
+        if old_key is not None and pos == old_pos:
+            return False
+        for i in range(pos if old_key is None else min(pos, old_pos), len(codes)):
+            self.batches[(color, codes[i])].index = i + 1
+        return True
+
+    def _rebuild(self, color):
+        """Series states of the Phase II batches of one color, from its batch sums."""
+        cb = self.limits.control_batch(color)
+        self.phase2[color] = cb
+        for src in SOURCES:
+            for f in FACTORS:
+                self.series.pop((color, src, f), None)
+        if cb is None:
+            return
+        for code in self.order.get(color, ([], []))[1][max(cb, 1) - 1:]:
+            batch = self.batches[(color, code)]
+            for src, f in batch.counts:
+                self.series.setdefault((color, src, f), SeriesState()).append(batch.index, code, batch.mean((src, f)))
+        for src in SOURCES:
+            for f in FACTORS:
+                if (color, src, f) in self.series:
+                    self.series[(color, src, f)].reseed()
+
+    def push(self, row):
+        folded = self._fold(row)
+        if folded is None:
+            return []
+        color, batch, old_key, touched = folded
+        if self._place(color, batch, old_key) or self.phase2.get(color, 0) != self.limits.control_batch(color):
+            # a backdated row moved a batch (or the control batch changed): Phase II and windows shift
+            self._rebuild(color)
+        alerts = []
+        for src, f in touched:
+            alert = self._judge(color, batch, src, f)
+            if alert:
+                alerts.append(alert)
+        return alerts
+
+    def _judge(self, color, batch, src, f):
+        cb = self.phase2[color]
+        if cb is None or batch.index < cb:
+            return None
+        mask = self.series.setdefault((color, src, f), SeriesState()).update(batch.index, batch.code, batch.mean((src, f)))
+        return self._report(color, batch, src, f, mask)
+
+    def _report(self, color, batch, src, f, mask):
+        """Record the verdict of one Phase II batch point; returns an alert when
+        it changed and the point is out of control."""
+        value = batch.mean((src, f))
+        lcl, ucl = self.limits.get(color, src, f)
+        rule_cl = lcl is not None and ucl is not None and not lcl <= value <= ucl
+        key = (color, batch.code, src, f)
+        verdict = (bool(rule_cl), int(mask))
+        if self.reported.get(key, (False, 0)) == verdict:
+            return None
+        self.reported[key] = verdict
+        if not (rule_cl or mask):
+            return None
+        first = batch.first_time
+        return {
+            "color": str(color), "batch": str(batch.code), "source": src.upper(), "factor": f,
+            "time": None if first is None or pd.isna(first) else pd.Timestamp(first).isoformat(),
+            "batch_index": batch.index, "rows": batch.rows, "value": round(value, 4),
+            "lcl": lcl, "ucl": ucl, "rule_cl": bool(rule_cl), "nelson": describe(mask),
+        }
+
+    def feed(self, frame):
+        """Push every row of a frame (in order); returns all alerts."""
+        alerts = []
+        for row in frame.to_dict("records"):
+            alerts += self.push(row)
+        return alerts
+
+    def warm_up(self, frame, reported=None):
+        """Load history: accumulate batch sums, number the batches with
+        batch_order and build each series' state once, then judge every
+        Phase II point as the dashboard does. Without ``reported`` the
+        verdicts are recorded silently; with the verdicts of a previous
+        monitor, the points whose verdict changed are returned as alerts."""
+        for row in frame.to_dict("records"):
+            self._fold(row)
+        items = list(self.batches.items())
+        keys = pd.DataFrame({
+            COLOR_COL: [c for (c, _), _ in items], BATCH_COL: [str(code) for (_, code), _ in items],
+            "First_Time": pd.to_datetime(pd.Series([b.first_time for _, b in items], dtype=object)),
+        })
+        for (_, b), order in zip(items, batch_order(keys) if items else []):
+            b.index = int(order)
+        self.order = {}
+        for (color, code), b in sorted(items, key=lambda kv: (str(kv[0][0]), kv[1].index)):
+            color_keys, codes = self.order.setdefault(color, ([], []))
+            color_keys.append(b.order_key())
+            codes.append(code)
+        self.series, self.phase2 = {}, {}
+        self.reported = dict(reported or {})
+        alerts = []
+        for color in self.order:
+            self._rebuild(color)
+            for src in SOURCES:
+                for f in FACTORS:
+                    state = self.series.get((color, src, f))
+                    if state is None:
+                        continue
+                    for code, mask in zip(state.codes, state.masks()):
+                        alert = self._report(color, self.batches[(color, code)], src, f, mask)
+                        if alert and reported is not None:
+                            alerts.append(alert)
+        return alerts
+
+
+def publish(alerts, out=None, webhook=None):
+    """Write alerts as JSON lines (stdout or an append-only file), optionally POST them."""
+    if not alerts:
+        return
+    lines = "".join(json.dumps(a, ensure_ascii=False) + "\n" for a in alerts)
+    if out:
+        with open(out, "a", encoding="utf-8") as fh:
+            fh.write(lines)
+    else:
+        sys.stdout.write(lines)
+        sys.stdout.flush()
+    if webhook:
+        req = urllib.request.Request(
+            webhook, data=json.dumps(alerts, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            urllib.request.urlopen(req, timeout=10).close()
+        except OSError:
+            log.warning("webhook delivery failed", exc_info=True)
+
+
+def run(source, limit_source, snapshot_dir, interval=60, out=None, webhook=None, once=False):
+    """Tail the inspection sheet and publish alerts until interrupted.
+
+    The history up to the monitor's last sync is replayed silently to warm
+    up the running state; rows appended since then (while the monitor was
+    down) and on every later sync are pushed and judged.
+    """
+    store = ingest.SnapshotStore(snapshot_dir)
+    # own snapshot names so the monitor never races the dashboard's snapshots
+    frame, meta, tail = ingest.sync(store, "monitor", source, ingest.normalize_data)
+    limit_df, limit_version = ingest.load_table(store, "monitor_limit", limit_source, ingest.normalize_limits, max_age=interval)
+    monitor = OnlineMonitor(LimitTable(limit_df))
+    # rows appended while the monitor was down are judged, not folded into the history
+    backlog = tail if tail is not None else frame.iloc[0:0]
+    monitor.warm_up(frame.iloc[:len(frame) - len(backlog)])
+    log.info("monitor warmed up on %d rows, %d colors", len(frame) - len(backlog), len(monitor.order))
+    publish(monitor.feed(backlog), out, webhook)
+    if once:
+        return monitor
+    while True:
+        time.sleep(interval)
+        limit_df, version = ingest.load_table(store, "monitor_limit", limit_source, ingest.normalize_limits, max_age=interval)
+        if version != limit_version:
+            monitor.limits, limit_version = LimitTable(limit_df), version
+        frame, meta, tail = ingest.sync(store, "monitor", source, ingest.normalize_data)
+        if tail is None:
+            log.warning("source history changed, rebuilding monitor state")
+            previous = monitor
+            monitor = OnlineMonitor(previous.limits)
+            alerts = monitor.warm_up(frame, previous.reported)
+        else:
+            alerts = monitor.feed(tail)
+        publish(alerts, out, webhook)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m spc.monitor", description="Streaming SPC alert monitor")
+    p.add_argument("--source", default=os.environ.get("SPC_DATA_SOURCE"), required="SPC_DATA_SOURCE" not in os.environ,
+                   help="inspection CSV (path or URL)")
+    p.add_argument("--limits", default=os.environ.get("SPC_LIMIT_SOURCE"), required="SPC_LIMIT_SOURCE" not in os.environ,
+                   help="limit sheet CSV (path or URL)")
+    p.add_argument("--snapshots", default=os.environ.get("SPC_SNAPSHOT_DIR", ".spc_snapshots"))
+    p.add_argument("--interval", type=float, default=60, help="seconds between syncs")
+    p.add_argument("--alerts", default=None, help="append alerts to this JSON-lines file (default: stdout)")
+    p.add_argument("--webhook", default=None, help="POST each alert batch to this URL")
+    p.add_argument("--once", action="store_true", help="sync once and exit")
+    args = p.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        run(args.source, args.limits, args.snapshots, args.interval, args.alerts, args.webhook, args.once)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Importable SPC pipeline: the dashboard's computations without Streamlit.
+
+    from spc import pipeline
+    data = pipeline.load("DATA 1.csv", "limits.csv")
+    frame = pipeline.color_results(data, "A01")
+    status = pipeline.status(data)
+    table = pipeline.offsets(data)
+"""
+import numpy as np
+import pandas as pd
+
+from . import capability, ingest
+from .aggregate import BATCH_COL, COLOR_COL, FACTORS, ORDER_COL, BatchCube, BatchIndex
+from .bootstrap import DEFAULT_RESAMPLES, fleet_intervals
+from .limits import LimitTable
+from .metrics import timed
+from .rules import ALL_RULES, cube_rule_masks, describe
+from .scaleup import ScaleUpModels
+from .status import limit_status_summary
+from .thickness import CoilCorrelation, phase2_positions
+from .timeindex import TimeIndex
+
+RESULT_COLUMNS = [
+    COLOR_COL, BATCH_COL, ORDER_COL, "Time", "Source", "Factor", "value", "LCL", "UCL",
+    "Phase2", "Rule_CL", "Rule_3Sigma", "Nelson_Rules", "Out_of_Control",
+]
+# Nelson_Rules text of every bitmask value.
+RULE_TEXT = np.array([describe(m) for m in range(1 << len(ALL_RULES))], dtype=object)
+
+
+class Dataset:
+    """Inspection rows, limit table, batch cube and time index of one data / limit version."""
+
+    def __init__(self, rows, limits, data_version=None, limit_version=None):
+        self.rows = rows
+        self.limits = limits
+        self.data_version = data_version
+        self.limit_version = limit_version
+        self.cube = BatchCube.from_rows(rows)
+        self.time_index = TimeIndex.from_rows(rows, data_version)
+
+    @property
+    def colors(self):
+        return sorted(self.rows[COLOR_COL].dropna().unique())
+
+    def color_rows(self, color, years=(), months=()):
+        """Rows of one color in time order, optionally of some years / months."""
+        return self.rows.iloc[self.time_index.select(color, years, months)]
+
+    def rows_between(self, color, start=None, end=None):
+        """Rows of one color with start <= Time < end, e.g. the last 90 days."""
+        return self.rows.iloc[self.time_index.between(color, start, end)]
+
+
+def load(source, limit_source, snapshot_dir=".spc_snapshots", max_age=300):
+    """Load (or incrementally sync) both sheets through the snapshot store."""
+    store = ingest.SnapshotStore(snapshot_dir)
+    rows, data_version = ingest.load_table(store, "data", source, ingest.normalize_data, max_age=max_age)
+    limit_df, limit_version = ingest.load_table(store, "limit", limit_source, ingest.normalize_limits, max_age=max_age)
+    return Dataset(rows, LimitTable(limit_df), data_version, limit_version)
+
+
+def color_results(data, color):
+    """Every batch point of one color (columns: RESULT_COLUMNS).
+
+    OOC flags are computed on the Phase II batches only, exactly as in the
+    dashboard's OOC table; Phase I rows carry False.
+    """
+    return results(data, [color])
+
+
+@timed("pipeline.results")
+def results(data, colors=None):
+    """color_results of several colors (all by default), concatenated, in one
+    vectorized pass over the cube: Nelson masks of every Phase II series
+    from rules.cube_rule_masks, the sheet limits joined per color × chart."""
+    colors = data.colors if colors is None else list(colors)
+    cube = data.cube
+    long = cube_rule_masks(cube, keep=cube.phase2_mask({c: data.limits.control_batch(c) for c in cube.colors}))
+    long = long[long[COLOR_COL].isin(colors)]
+    if long.empty:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    charts = [(c, src, f) for c in colors for f in FACTORS for src in ("LAB", "LINE")]
+    spec = pd.DataFrame(charts, columns=["_color", "Source", "Factor"])
+    spec[["LCL", "UCL"]] = [[np.nan if v is None else v for v in data.limits.get(c, src, f)] for c, src, f in charts]
+    spec["_chart"] = np.arange(len(spec))
+    frame = long.assign(_color=long[COLOR_COL].astype(str)).merge(spec, on=["_color", "Source", "Factor"], how="left")
+    # color order of the request, then factor / source / Batch_Order as per color
+    frame = frame.sort_values(["_chart", ORDER_COL], kind="stable").reset_index(drop=True)
+    value, lcl, ucl = (frame[c].to_numpy(dtype=float) for c in ("value", "LCL", "UCL"))
+    masks = frame["Rules"].to_numpy()
+    frame[COLOR_COL] = frame.pop("_color")
+    frame["Phase2"] = frame.pop("Keep").astype(bool)
+    frame["Rule_CL"] = frame["Phase2"].to_numpy() & ~np.isnan(lcl) & ~np.isnan(ucl) & ((value < lcl) | (value > ucl))
+    frame["Rule_3Sigma"] = (masks & 1) > 0  # Nelson rule 1 is the 3σ band of the Phase II mean / σ
+    frame["Nelson_Rules"] = pd.Series(RULE_TEXT[masks], dtype=object)
+    frame["Out_of_Control"] = frame["Rule_CL"] | (masks > 0)
+    return frame[RESULT_COLUMNS]
+
+
+def status(data, c_th=2, t_th=5, workers=1, executor="process"):
+    """Limit Status Summary of every color."""
+    return limit_status_summary(data.cube, data.limits, data.colors, c_th, t_th, workers=workers, executor=executor)
+
+
+def offsets(data, level=0.95):
+    """Lab-to-Line scale-up model and offset suggestion of every color × factor."""
+    return ScaleUpModels.from_cube(data.cube).offsets(level)
+
+
+def thickness_ranking(data):
+    """Colors ranked by Phase II thickness sensitivity of their color factors."""
+    index = BatchIndex.from_rows(data.rows)
+    return CoilCorrelation.from_rows(data.rows.iloc[phase2_positions(index, data.limits, data.colors)], data.limits).ranking()
+
+
+def limit_intervals(data, source="LINE", sigma=3.0, iqr_k=1.5, n_resamples=DEFAULT_RESAMPLES, level=0.95, seed=None, workers=1):
+    """Bootstrap intervals of the Control Limit Calculator results of every color."""
+    return fleet_intervals(data.cube, data.colors, source, sigma, iqr_k, n_resamples, level, seed, workers)
+
+
+def capability_catalog(data):
+    """Cp, Cpk, Pp, Ppk and expected ppm of every color × source × factor and the thickness."""
+    return capability.catalog(data.cube, data.limits, data.colors)
+
+
+def write(frame, out):
+    """Write a result frame; .csv writes CSV, anything else Parquet."""
+    if str(out).lower().endswith(".csv"):
+        frame.to_csv(out, index=False, encoding="utf-8-sig")
+    else:
+        frame.to_parquet(out, index=False)
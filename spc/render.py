@@ -0,0 +1,128 @@
+"""Render-once chart cache.
+
+Figures are rendered to image bytes once per key and the matplotlib figure
+is closed right away, so a long-lived server never accumulates open
+figures. The bytes are kept in an LRU bounded by total size; keys are built
+by the caller from everything the picture depends on (data version, color,
+filters, limits, chart type and parameters).
+
+BaseImage keeps a figure as RGBA pixels instead, for charts whose only
+changing part is a set of horizontal lines: those are painted onto a copy
+of the pixels, so moving them costs no matplotlib work at all.
+"""
+import io
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import to_rgba
+
+from .cache import SharedCache
+from .metrics import span
+
+# Same defaults as st.pyplot, so a cached PNG looks exactly like the live one.
+DISPLAY_DPI = 200
+# st.image re-scales anything wider than this on every call; cache it pre-scaled.
+DISPLAY_WIDTH = 1460
+
+# Base images are displayed at their pixel size; no need for the export DPI.
+OVERLAY_DPI = 100
+
+_NOTHING = b""  # builder returned None (e.g. no Phase II data); cached too
+
+
+def to_bytes(fig, fmt="png", dpi=DISPLAY_DPI):
+    """Render a figure and always release it."""
+    try:
+        buf = io.BytesIO()
+        with span("render.savefig"):
+            fig.savefig(buf, format=fmt, dpi=dpi, bbox_inches="tight")
+        return buf.getvalue()
+    finally:
+        plt.close(fig)
+
+
+def fit_width(png, max_width):
+    """Downscale PNG bytes to max_width pixels (bilinear, as st.image does)."""
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(png))
+    if img.width <= max_width:
+        return png
+    img = img.resize((max_width, int(img.height * max_width / img.width)), Image.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class FigureCache(SharedCache):
+    """Shared cache of rendered chart bytes, capped at max_bytes."""
+
+    def __init__(self, max_bytes=64 * 2**20):
+        super().__init__(max_bytes, name="figure", sizer=len)
+
+    def chart(self, key, build, fmt="png", dpi=DISPLAY_DPI, max_width=None):
+        """Image bytes for key, calling build() -> Figure | None only on a miss.
+
+        max_width (PNG only) returns a pre-scaled copy for display, derived
+        from the cached full-resolution render. Returns None when the builder
+        had nothing to draw. Concurrent sessions asking for the same chart
+        render it once.
+        """
+        if max_width:
+            def scaled():
+                full = self.chart(key, build, fmt, dpi)
+                return _NOTHING if full is None else fit_width(full, max_width)
+            return self.get_or_compute((key, fmt, dpi, max_width), scaled) or None
+
+        def render():
+            with span("render.build"):
+                fig = build()
+            return _NOTHING if fig is None else to_bytes(fig, fmt, dpi)
+        return self.get_or_compute((key, fmt, dpi), render) or None
+
+
+class BaseImage:
+    """A figure rendered to RGBA pixels, with the pixel box and y range of its axes."""
+
+    def __init__(self, pixels, box, ylim):
+        self.pixels = pixels  # H × W × 4 uint8, shared: never modified
+        self.box = box  # (left, right, top, bottom) pixel bounds of the axes
+        self.ylim = ylim
+
+    @classmethod
+    def from_figure(cls, fig, ax=None, dpi=OVERLAY_DPI):
+        """Render fig once (and release it); ax (default: the first axes) is
+        the one lines go on."""
+        ax = ax or fig.axes[0]
+        try:
+            fig.set_dpi(dpi)
+            canvas = FigureCanvasAgg(fig)
+            with span("render.base"):
+                canvas.draw()
+            pixels = np.asarray(canvas.buffer_rgba()).copy()
+            x0, y0, x1, y1 = ax.get_window_extent().extents
+            h = pixels.shape[0]
+            return cls(pixels, (int(round(x0)), int(round(x1)), h - y1, h - y0), ax.get_ylim())
+        finally:
+            plt.close(fig)
+
+    def hlines(self, lines):
+        """Copy of the pixels with lines painted across the axes.
+
+        lines are (y, color, width_px, dash), dash = (on_px, off_px) or None
+        for a solid line; lines outside the y range are left out.
+        """
+        out = self.pixels.copy()
+        left, right, top, bottom = self.box
+        lo, hi = self.ylim
+        for y, color, width, dash in lines:
+            if y is None or not np.isfinite(y) or not lo <= y <= hi:
+                continue
+            row = top + (hi - y) / (hi - lo) * (bottom - top)
+            rows = slice(max(int(round(row - width / 2)), 0), max(int(round(row + width / 2)), int(round(row - width / 2)) + 1))
+            cols = np.arange(left, right)
+            if dash is not None:
+                cols = cols[(cols - left) % (dash[0] + dash[1]) < dash[0]]
+            out[rows, cols] = (np.array(to_rgba(color)) * 255).astype(np.uint8)
+        return out
@@ -0,0 +1,259 @@
+"""Multi-color SPC report (PDF).
+
+For every requested color the report holds the batch summary statistics,
+the combined and Phase II charts, the LINE / LAB distributions and the
+Phase II out-of-control table, over an optional date range:
+
+    python -m spc.report --source "DATA 1.csv" --limits limits.csv --colors A01 B02 \\
+        --start 2025-01-01 --end 2025-03-31 --out spc_report.pdf --workers 4
+
+Colors are rendered in a process pool. Each worker writes its charts as PNG
+files to a scratch directory and closes the figures at once; the parent lays
+the pages out in color order, keeps at most ``workers * 2`` colors in flight
+and deletes a color's images as soon as its pages are drawn.
+"""
+import argparse
+import logging
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import pandas as pd
+from reportlab.lib import colors as rl_colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle
+
+from . import charts, ingest
+from .aggregate import BATCH_COL, COLOR_COL, FACTORS, BatchCube, phase2_start, summary_stats
+from .limits import LimitTable
+from .render import to_bytes
+from .rules import ooc_table
+
+log = logging.getLogger(__name__)
+
+REPORT_DPI = 110
+PAGE = landscape(A4)
+MARGIN = 36
+
+# Worker-side limit table, set once per process by the pool initializer.
+_LIMITS = None
+
+
+def _init_worker(limits):
+    global _LIMITS
+    _LIMITS = limits
+
+
+def _font():
+    """DejaVu Sans (shipped with matplotlib) so Δ / σ / µ print; Helvetica otherwise."""
+    try:
+        pdfmetrics.getFont("DejaVuSans")
+        return "DejaVuSans"
+    except KeyError:
+        pass
+    path = os.path.join(matplotlib.get_data_path(), "fonts", "ttf", "DejaVuSans.ttf")
+    try:
+        pdfmetrics.registerFont(TTFont("DejaVuSans", path))
+    except Exception:
+        return "Helvetica"
+    return "DejaVuSans"
+
+
+def color_report(color, rows, workdir, start=None, end=None, dpi=REPORT_DPI, limits=None):
+    """Render one color: tables as DataFrames, charts as PNG files in workdir.
+
+    rows are all rows of the color; the control batch is resolved on the
+    full history (as in the dashboard) before the date range is applied.
+    """
+    limits = limits or _LIMITS
+    control_batch = limits.control_batch(color)
+    full = BatchCube.from_rows(rows)
+    cb_code = full.control_batch_code(color, control_batch)
+    phase2_from = phase2_start(cb_code, control_batch)
+    view = rows
+    if start is not None: view = view[view["Time"] >= start]
+    if end is not None: view = view[view["Time"] < end + pd.Timedelta(days=1)]
+    series = (full if view is rows else BatchCube.from_rows(view, reference=full)).series(color)
+
+    images = []
+
+    def save(fig, caption):
+        if fig is None: return
+        fd, path = tempfile.mkstemp(suffix=".png", dir=workdir)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(to_bytes(fig, dpi=dpi))
+        images.append((caption, path))
+
+    for k in FACTORS:
+        lab_lim, line_lim = limits.get(color, "LAB", k), limits.get(color, "LINE", k)
+        save(charts.combined(series[k]["lab"], series[k]["line"], f"COMBINED {k}", lab_lim, line_lim, phase2_from), "combined")
+        save(charts.combined_phase2(series[k]["lab"], series[k]["line"], f"{k} – LAB + LINE (Phase II)", lab_lim, line_lim, phase2_from), "phase2")
+    for src, bar in (("line", "#4dabf7"), ("lab", "#1f77b4")):
+        for k in FACTORS:
+            values = series[k][src]["value"].dropna()
+            if len(values) < 3: continue
+            lcl, ucl = limits.get(color, src.upper(), k)
+            save(charts.distribution(values, lcl, ucl, f"{k} ({src.upper()})", bar), "dist")
+    return {
+        "color": color, "control_batch": control_batch, "control_batch_code": cb_code,
+        "t_min": view["Time"].min(), "t_max": view["Time"].max(), "n_batches": view[BATCH_COL].nunique(),
+        "summary_line": summary_stats(series, "line"), "summary_lab": summary_stats(series, "lab"),
+        "ooc": ooc_table(series, limits, color, phase2_from).rename(columns={BATCH_COL: "Batch"}),
+        "images": images,
+    }
+
+
+class PdfWriter:
+    """Top-down page layout on a reportlab canvas (landscape A4)."""
+
+    def __init__(self, out):
+        self.canvas = canvas.Canvas(out, pagesize=PAGE, pageCompression=1)
+        self.font = _font()
+        self.width = PAGE[0] - 2 * MARGIN
+        self.y = PAGE[1] - MARGIN
+        self.pages = 0
+
+    def new_page(self):
+        self.canvas.showPage()
+        self.pages += 1
+        self.y = PAGE[1] - MARGIN
+
+    def _room(self, h):
+        if self.y - h < MARGIN and self.y < PAGE[1] - MARGIN:
+            self.new_page()
+
+    def text(self, line, size=10, gap=4):
+        self._room(size + gap)
+        self.canvas.setFont(self.font, size)
+        self.canvas.drawString(MARGIN, self.y - size, str(line))
+        self.y -= size + gap
+
+    def table(self, frame, size=8):
+        if frame.empty: return
+        data = [list(frame.columns)] + [["" if pd.isna(v) else str(v) for v in row] for row in frame.itertuples(index=False)]
+        t = Table(data, repeatRows=1, hAlign="LEFT")
+        t.setStyle(TableStyle([
+            ("FONT", (0, 0), (-1, -1), self.font, size),
+            ("BACKGROUND", (0, 0), (-1, 0), rl_colors.HexColor("#e0f2fe")),
+            ("GRID", (0, 0), (-1, -1), 0.25, rl_colors.grey),
+        ]))
+        while t is not None:
+            _, h = t.wrapOn(self.canvas, self.width, self.y - MARGIN)
+            if h <= self.y - MARGIN:
+                t.drawOn(self.canvas, MARGIN, self.y - h)
+                self.y -= h + 8
+                return
+            parts = t.split(self.width, self.y - MARGIN)
+            if len(parts) < 2:
+                if self.y >= PAGE[1] - MARGIN: raise ValueError("table row taller than a page")
+                self.new_page()
+                continue
+            _, h = parts[0].wrapOn(self.canvas, self.width, self.y - MARGIN)
+            parts[0].drawOn(self.canvas, MARGIN, self.y - h)
+            self.new_page()
+            t = parts[1]
+
+    def images(self, paths, per_row=1):
+        """Images scaled to 1/per_row of the text width, laid out left to right."""
+        w = (self.width - 8 * (per_row - 1)) / per_row
+        for i in range(0, len(paths), per_row):
+            row = [ImageReader(p) for p in paths[i:i + per_row]]
+            h = max(w * img.getSize()[1] / img.getSize()[0] for img in row)
+            self._room(h)
+            for j, img in enumerate(row):
+                iw, ih = img.getSize()
+                self.canvas.drawImage(img, MARGIN + j * (w + 8), self.y - w * ih / iw, width=w, height=w * ih / iw)
+            self.y -= h + 8
+
+    def color_pages(self, res):
+        self.text(f"SPC Report — {res['color']}", size=16, gap=8)
+        t_min = res["t_min"].strftime("%Y-%m-%d") if pd.notna(res["t_min"]) else "N/A"
+        t_max = res["t_max"].strftime("%Y-%m-%d") if pd.notna(res["t_max"]) else "N/A"
+        cb = f"Batch #{res['control_batch']} → {res['control_batch_code']}" if res["control_batch_code"] is not None else "not defined"
+        self.text(f"{t_min} → {t_max} | n = {res['n_batches']} batches | Control batch: {cb}")
+        for src in ("line", "lab"):
+            self.text(f"Summary Statistics – {src.upper()}", size=11)
+            self.table(res[f"summary_{src}"])
+        paths = {kind: [p for c, p in res["images"] if c == kind] for kind in ("combined", "phase2", "dist")}
+        self.images(paths["combined"])
+        self.images(paths["phase2"])
+        self.images(paths["dist"], per_row=3)
+        self.text("Out-of-Control Batches (Phase II)", size=11)
+        if res["ooc"].empty: self.text("No out-of-control batches detected")
+        else: self.table(res["ooc"])
+        self.new_page()
+
+    def save(self):
+        self.canvas.save()
+
+
+def _bounded(pool, fn, tasks, window):
+    """pool.map in task order with at most ``window`` tasks submitted at a time."""
+    pending = deque()
+    for args in tasks:
+        pending.append(pool.submit(fn, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def build_report(df, limits, colors, out, start=None, end=None, workers=1, dpi=REPORT_DPI):
+    """Write the PDF report for ``colors`` to ``out``; returns the page count."""
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    colors = list(colors)
+    positions = df.groupby(COLOR_COL, sort=False).indices
+    pdf = PdfWriter(out)
+    with tempfile.TemporaryDirectory(prefix="spc_report_") as workdir:
+        # rows are sliced lazily, so only the colors in flight are copied
+        tasks = ((c, df.iloc[positions.get(c, [])], workdir, start, end, dpi) for c in colors)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(limits,)) as pool:
+                for res in _bounded(pool, color_report, tasks, workers * 2):
+                    _write(pdf, res)
+        else:
+            for args in tasks:
+                _write(pdf, color_report(*args, limits=limits))
+    pdf.save()
+    return pdf.pages
+
+
+def _write(pdf, res):
+    pdf.color_pages(res)
+    for _, path in res["images"]:
+        os.remove(path)
+    log.info("report: %s done", res["color"])
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m spc.report", description="Multi-color SPC PDF report")
+    p.add_argument("--source", default=os.environ.get("SPC_DATA_SOURCE"), required="SPC_DATA_SOURCE" not in os.environ,
+                   help="inspection CSV (path or URL)")
+    p.add_argument("--limits", default=os.environ.get("SPC_LIMIT_SOURCE"), required="SPC_LIMIT_SOURCE" not in os.environ,
+                   help="limit sheet CSV (path or URL)")
+    p.add_argument("--snapshots", default=os.environ.get("SPC_SNAPSHOT_DIR", ".spc_snapshots"))
+    p.add_argument("--colors", nargs="*", default=None, help="color codes (default: all)")
+    p.add_argument("--start", default=None, help="first day (YYYY-MM-DD)")
+    p.add_argument("--end", default=None, help="last day, inclusive (YYYY-MM-DD)")
+    p.add_argument("--out", default="spc_report.pdf")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--dpi", type=int, default=REPORT_DPI)
+    args = p.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    store = ingest.SnapshotStore(args.snapshots)
+    df, _ = ingest.load_table(store, "data", args.source, ingest.normalize_data)
+    limit_df, _ = ingest.load_table(store, "limit", args.limits, ingest.normalize_limits)
+    colors = args.colors or sorted(df[COLOR_COL].dropna().unique())
+    pages = build_report(df, LimitTable(limit_df), colors, args.out, args.start, args.end, args.workers, args.dpi)
+    log.info("wrote %s (%d pages, %d colors)", args.out, pages, len(colors))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Western Electric / Nelson rule engine.
+
+Rules are evaluated with cumulative-sum windows and run-length encoding on
+NumPy arrays, so many series (colors x sources x factors) are checked in one
+call by passing a ``groups`` array; windows and runs never cross a group
+boundary. The result is one uint8 bitmask per point: bit r-1 is set when
+Nelson rule r fires on that point (the point completing the pattern).
+"""
+import numpy as np
+import pandas as pd
+
+from .aggregate import BATCH_COL, COLOR_COL, FACTORS, ORDER_COL, SOURCES
+from .metrics import timed
+
+RULES = {
+    1: "1 point beyond 3σ",
+    2: "9 points in a row on one side of the mean",
+    3: "6 points in a row steadily increasing or decreasing",
+    4: "14 points in a row alternating up and down",
+    5: "2 of 3 points beyond 2σ on the same side",
+    6: "4 of 5 points beyond 1σ on the same side",
+    7: "15 points in a row within 1σ",
+    8: "8 points in a row beyond 1σ on both sides",
+}
+ALL_RULES = tuple(RULES)
+
+
+def run_lengths(cond, groups=None):
+    """Length of the True-run ending at each position (0 where cond is False).
+
+    Runs restart wherever ``groups`` changes value, so one call handles many
+    contiguous series at once.
+    """
+    cond = np.asarray(cond, dtype=bool)
+    idx = np.arange(len(cond))
+    marker = np.where(cond, -1, idx)
+    if groups is not None and len(cond):
+        groups = np.asarray(groups)
+        start = np.r_[True, groups[1:] != groups[:-1]]
+        marker = np.maximum(marker, np.where(start, idx - 1, -1))
+    last_break = np.maximum.accumulate(marker) if len(cond) else marker
+    return np.where(cond, idx - last_break, 0)
+
+
+def _group_ids(groups, n):
+    if groups is None:
+        return np.zeros(n, dtype=int)
+    groups = np.asarray(groups)
+    if not n:
+        return np.zeros(0, dtype=int)
+    return np.cumsum(np.r_[True, groups[1:] != groups[:-1]]) - 1
+
+
+def _position_in_group(gid):
+    idx = np.arange(len(gid))
+    if not len(gid):
+        return idx
+    starts = np.flatnonzero(np.r_[True, gid[1:] != gid[:-1]])
+    return idx - starts[gid]
+
+
+def group_mean_std(values, gid):
+    """Per-point mean and sample std of its group, ignoring NaN."""
+    ok = ~np.isnan(values)
+    n_groups = gid.max() + 1 if len(gid) else 0
+    n = np.bincount(gid, weights=ok, minlength=n_groups)
+    s1 = np.bincount(gid, weights=np.where(ok, values, 0.0), minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = s1 / n
+        dev = np.where(ok, values - mean[gid], 0.0)
+        var = np.bincount(gid, weights=dev ** 2, minlength=n_groups) / (n - 1)
+    return mean[gid], np.sqrt(var)[gid]
+
+
+def _window_count(cond, w, pos):
+    """Number of True in the w points ending at each position (-1 if the window
+    would cross the start of the group)."""
+    c = np.r_[0, np.cumsum(cond)]
+    idx = np.arange(len(cond))
+    lo = np.maximum(idx + 1 - w, 0)
+    return np.where(pos >= w - 1, c[idx + 1] - c[lo], -1)
+
+
+def nelson_rules(values, groups=None, center=None, sigma=None, rules=ALL_RULES):
+    """Bitmask of the Nelson rules firing at each point.
+
+    values: 1-D array of consecutive points (several series concatenated when
+    ``groups`` is given; each series must be contiguous). center / sigma may
+    be scalars or per-point arrays; by default each series' own mean and
+    sample standard deviation are used. NaN points never fire.
+    """
+    x = np.asarray(values, dtype=float)
+    gid = _group_ids(groups, len(x))
+    pos = _position_in_group(gid)
+    if center is None or sigma is None:
+        m, s = group_mean_std(x, gid)
+        center = m if center is None else center
+        sigma = s if sigma is None else sigma
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (x - center) / np.where(np.asarray(sigma) > 0, sigma, np.nan)
+    mask = np.zeros(len(x), dtype=np.uint8)
+    if not len(x):
+        return mask
+
+    above, below = z > 0, z < 0
+    d = np.r_[np.nan, np.diff(x)]
+    d[pos == 0] = np.nan
+    checks = {
+        1: lambda: np.abs(z) > 3,
+        2: lambda: (run_lengths(above, gid) >= 9) | (run_lengths(below, gid) >= 9),
+        3: lambda: (run_lengths(d > 0, gid) >= 5) | (run_lengths(d < 0, gid) >= 5),
+        4: lambda: run_lengths(d * np.r_[np.nan, d[:-1]] < 0, gid) >= 12,
+        5: lambda: ((z > 2) & (_window_count(z > 2, 3, pos) >= 2)) | ((z < -2) & (_window_count(z < -2, 3, pos) >= 2)),
+        6: lambda: ((z > 1) & (_window_count(z > 1, 5, pos) >= 4)) | ((z < -1) & (_window_count(z < -1, 5, pos) >= 4)),
+        7: lambda: run_lengths(np.abs(z) < 1, gid) >= 15,
+        8: lambda: (run_lengths(np.abs(z) > 1, gid) >= 8) & (_window_count(z > 1, 8, pos) >= 1) & (_window_count(z < -1, 8, pos) >= 1),
+    }
+    for r in rules:
+        mask |= checks[r]().astype(np.uint8) << np.uint8(r - 1)
+    return mask
+
+
+def describe(mask):
+    """'1, 5' style list of the rules set in one bitmask value."""
+    return ", ".join(str(r) for r in ALL_RULES if int(mask) & (1 << (r - 1)))
+
+
+def cube_rule_masks(cube, rules=ALL_RULES, keep=None):
+    """Nelson bitmasks for every color x source x factor batch series in one call.
+
+    Returns a long frame (塗料編號, 製造批號, Batch_Order, Source, Factor, value, Rules)
+    ordered by series then Batch_Order. keep (one bool per cube row, e.g.
+    BatchCube.phase2_mask) judges each series on its kept batches only, with
+    their own mean / σ as in the dashboard's OOC table; the other rows get 0
+    and the frame gains a Keep column.
+    """
+    parts = []
+    for src in SOURCES:
+        for f in FACTORS:
+            part = cube.frame[[COLOR_COL, BATCH_COL, ORDER_COL, "First_Time", f"{src.upper()}_{f}"]]
+            part = part.set_axis([COLOR_COL, BATCH_COL, ORDER_COL, "Time", "value"], axis=1).assign(Source=src.upper(), Factor=f)
+            if keep is not None:
+                part["Keep"] = keep
+            parts.append(part.dropna())
+    long = pd.concat(parts, ignore_index=True)
+    long = long.sort_values([COLOR_COL, "Source", "Factor", ORDER_COL], kind="stable").reset_index(drop=True)
+    series_id = long.groupby([COLOR_COL, "Source", "Factor"], sort=False, observed=True).ngroup().to_numpy()
+    values = long["value"].to_numpy(dtype=float)
+    if keep is None:
+        long["Rules"] = nelson_rules(values, series_id, rules=rules)
+    else:
+        sub = long["Keep"].to_numpy(dtype=bool)
+        masks = np.zeros(len(long), dtype=np.uint8)
+        masks[sub] = nelson_rules(values[sub], series_id[sub], rules=rules)
+        long["Rules"] = masks
+    return long
+
+
+def flag_out_of_control(spc_df, lcl, ucl):
+    """Batch series with the Rule_CL / Rule_3Sigma / Nelson / Out_of_Control columns added."""
+    mean = spc_df["value"].mean()
+    std = spc_df["value"].std()
+    result = spc_df.copy()
+    result["Rule_CL"] = False
+    result["Rule_3Sigma"] = False
+    if lcl is not None and ucl is not None:
+        result["Rule_CL"] = ((result["value"] < lcl) | (result["value"] > ucl))
+    if std > 0:
+        result["Rule_3Sigma"] = ((result["value"] > mean + 3 * std) | (result["value"] < mean - 3 * std))
+    # Nelson 1–8 on the same mean / std as the 3σ band
+    result["Nelson"] = nelson_rules(result["value"].to_numpy(dtype=float), center=mean, sigma=std)
+    result["Nelson_Rules"] = result["Nelson"].map(describe)
+    result["Out_of_Control"] = (result["Rule_CL"] | result["Rule_3Sigma"] | (result["Nelson"] > 0))
+    return result
+
+
+def detect_out_of_control(spc_df, lcl, ucl):
+    """Rows of a batch series breaking the sheet limits, the 3σ band or a Nelson rule."""
+    result = flag_out_of_control(spc_df, lcl, ucl)
+    return result[result["Out_of_Control"]]
+
+
+@timed("rules.ooc_table")
+def ooc_table(series, limits, color, phase2_from):
+    """Out-of-control Phase II batches (Batch_Order >= phase2_from) of one color
+    (the dashboard's OOC table)."""
+    rows = []
+    if phase2_from is None:
+        return pd.DataFrame(rows)
+    for k in FACTORS:
+        for src in ("LINE", "LAB"):
+            lcl, ucl = limits.get(color, src, k)
+            part = series[k][src.lower()]
+            ooc = detect_out_of_control(part[part[ORDER_COL] >= phase2_from], lcl, ucl)
+            for _, r in ooc.iterrows(): rows.append({"Factor": k, "Type": src, BATCH_COL: r[BATCH_COL], "Value": round(r["value"], 2), "Rule_CL": r["Rule_CL"], "Rule_3Sigma": r["Rule_3Sigma"], "Nelson_Rules": r["Nelson_Rules"]})
+    return pd.DataFrame(rows)
@@ -0,0 +1,135 @@
+"""Lab-to-Line scale-up models of every color × factor.
+
+Per batch, the LINE outcome (mean of the north / south means) is regressed
+on the LAB reading. All colors and factors are fitted in one grouped pass
+over centered sums: slope, intercept, R², residual σ, the Line − Lab bias
+and its spread. A prediction is then a table lookup plus one multiply,
+with a t-based prediction interval for a new batch. A model needs
+MIN_PAIRS batches; its interval needs MIN_PI_DF residual degrees of
+freedom (n − 2), below that t explodes (12.7 at df = 1) and the
+interval is left NaN.
+"""
+import math
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from .aggregate import BATCH_COL, COLOR_COL, FACTORS
+from .metrics import timed
+
+# Batches with every LAB and LINE N / S reading, as the scale-up view has always used.
+PAIR_COLUMNS = [f"LAB_{f}" for f in FACTORS] + [f"LINE_{f}_{s}" for f in FACTORS for s in ("N", "S")]
+MODEL_COLUMNS = [
+    "n", "lab_mean", "line_mean", "sxx", "slope", "intercept", "r2",
+    "resid_sd", "bias", "bias_sd", "lab_for_zero",
+]
+MIN_PAIRS = 3
+MIN_PI_DF = 3
+
+
+def t_quantile(p, df):
+    """Student-t quantile: closed forms (exact) for df 1, 2 and 4, the
+    Cornish-Fisher expansion otherwise; that reads slightly low at df = 3
+    (-0.1 % at p = 0.975, -0.8 % at p = 0.995) and within 0.1 % of the
+    exact value from df = 5 on."""
+    df = np.asarray(df, dtype=float)
+    z = NormalDist().inv_cdf(p)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (z + (z**3 + z) / (4 * df) + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+             + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3)
+             + (79 * z**9 + 776 * z**7 + 1482 * z**5 - 1920 * z**3 - 945 * z) / (92160 * df**4))
+        t = np.where(df == 1, math.tan(math.pi * (p - 0.5)), t)
+        a = 4 * p * (1 - p)
+        t = np.where(df == 2, (2 * p - 1) * math.sqrt(2 / a), t)
+        t = np.where(df == 4, math.copysign(2 * math.sqrt(math.cos(math.acos(math.sqrt(a)) / 3) / math.sqrt(a) - 1), p - 0.5), t)
+    return np.where(df >= 1, t, np.nan)
+
+
+def pairs(frame):
+    """Long (color, factor, batch, lab, line) table of the paired batches of a cube frame."""
+    rows = frame.dropna(subset=PAIR_COLUMNS)
+    parts = [
+        pd.DataFrame({
+            COLOR_COL: rows[COLOR_COL].to_numpy(), "factor": f, BATCH_COL: rows[BATCH_COL].to_numpy(),
+            "lab": rows[f"LAB_{f}"].to_numpy(dtype=float),
+            "line": rows[[f"LINE_{f}_N", f"LINE_{f}_S"]].mean(axis=1).to_numpy(dtype=float),
+        })
+        for f in FACTORS
+    ]
+    return pd.concat(parts, ignore_index=True)
+
+
+class ScaleUpModels:
+    """Fitted LAB → LINE regressions, indexed by (color, factor)."""
+
+    def __init__(self, models, points):
+        self.models = models  # index (color, factor), columns MODEL_COLUMNS
+        self.points = points  # the paired batches the models were fitted on
+
+    @classmethod
+    @timed("scaleup.fit")
+    def from_cube(cls, cube):
+        pts = pairs(cube.frame)
+        keys = [pts[COLOR_COL], pts["factor"]]
+        g = pts.groupby(keys, sort=True, observed=True)
+        n = g.size()
+        mx, my = g["lab"].transform("mean"), g["line"].transform("mean")
+        dx, dy, d = pts["lab"] - mx, pts["line"] - my, pts["line"] - pts["lab"]
+        sums = pd.DataFrame({"sxx": dx * dx, "sxy": dx * dy, "syy": dy * dy, "d": d}).groupby(keys, sort=True, observed=True)
+        sxx, sxy, syy = sums["sxx"].sum(), sums["sxy"].sum(), sums["syy"].sum()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = sxy / sxx
+            m = pd.DataFrame({"n": n, "lab_mean": g["lab"].mean(), "line_mean": g["line"].mean(), "sxx": sxx, "slope": slope})
+            m["intercept"] = m["line_mean"] - slope * m["lab_mean"]
+            m["r2"] = sxy**2 / (sxx * syy)
+            m["resid_sd"] = np.sqrt(np.clip(syy - slope * sxy, 0, None) / (n - 2))
+            m["bias"] = sums["d"].mean()
+            m["bias_sd"] = sums["d"].std(ddof=0)
+            m["lab_for_zero"] = -m["intercept"] / slope
+        m = m[m["n"] >= MIN_PAIRS]
+        m.index.names = [COLOR_COL, "factor"]
+        return cls(m[MODEL_COLUMNS], pts)
+
+    def get(self, color, factor):
+        """Model row (a Series of MODEL_COLUMNS) or None with too few pairs."""
+        try:
+            return self.models.loc[(color, factor)]
+        except KeyError:
+            return None
+
+    def color_points(self, color, factor):
+        """(lab, line) arrays of the batches behind one model, in cube order."""
+        pts = self.points[(self.points[COLOR_COL] == color) & (self.points["factor"] == factor)]
+        return pts["lab"].to_numpy(), pts["line"].to_numpy()
+
+    @staticmethod
+    def pi_quantile(n, level):
+        """t quantile of the prediction interval, NaN below MIN_PI_DF."""
+        df = np.asarray(n, dtype=float) - 2
+        return np.where(df >= MIN_PI_DF, t_quantile((1 + level) / 2, df), np.nan)
+
+    def predict(self, color, factor, lab, level=0.95):
+        """(predicted LINE, lower, upper) for LAB readings lab; the interval
+        is the regression prediction interval of one new batch (NaN with
+        fewer than MIN_PI_DF + 2 batches)."""
+        m = self.get(color, factor)
+        if m is None:
+            return None
+        lab = np.asarray(lab, dtype=float)
+        pred = m["slope"] * lab + m["intercept"]
+        half = self.pi_quantile(m["n"], level) * m["resid_sd"] * np.sqrt(1 + 1 / m["n"] + (lab - m["lab_mean"]) ** 2 / m["sxx"])
+        return pred, pred - half, pred + half
+
+    def offsets(self, level=0.95):
+        """Catalog-wide offset suggestions: one row per color × factor (PI
+        NaN with fewer than MIN_PI_DF + 2 batches)."""
+        m = self.models
+        half = self.pi_quantile(m["n"], level) * m["resid_sd"].to_numpy() * np.sqrt(1 + 1 / m["n"].to_numpy())
+        return pd.DataFrame({
+            "Color Code": m.index.get_level_values(0), "Factor": m.index.get_level_values(1),
+            "Batches": m["n"].to_numpy(), "Bias (Line − Lab)": m["bias"].to_numpy(), "Bias σ": m["bias_sd"].to_numpy(),
+            "Slope": m["slope"].to_numpy(), "Intercept": m["intercept"].to_numpy(), "R²": m["r2"].to_numpy(),
+            "Residual σ": m["resid_sd"].to_numpy(), f"PI ± ({level:.0%}, at mean LAB)": half,
+            "Suggested LAB Offset": -m["bias"].to_numpy(), "LAB for LINE = 0 (fit)": m["lab_for_zero"].to_numpy(),
+        })
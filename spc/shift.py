@@ -0,0 +1,109 @@
+"""CUSUM and EWMA charts for small shifts in the batch averages.
+
+Both are vectorized over a whole series (CUSUM through the closed form of
+the Lindley recursion, EWMA through a blocked closed form) and return their
+end state, so a series can be continued one batch or one tail at a time.
+k, h and L are in units of sigma.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+# EWMA is evaluated in blocks so (1 - λ)^-i never overflows.
+_EWMA_BLOCK = 32
+
+
+@dataclass
+class CusumState:
+    c_plus: float = 0.0
+    c_minus: float = 0.0
+    n: int = 0
+
+    def update(self, x, target, sigma, k=0.5, h=5.0):
+        """One new value; returns True when either side signals."""
+        z = (x - target) / sigma
+        self.c_plus = max(0.0, self.c_plus + z - k)
+        self.c_minus = max(0.0, self.c_minus - z - k)
+        self.n += 1
+        return self.c_plus > h or self.c_minus > h
+
+
+@dataclass
+class EwmaState:
+    z: float = None
+    n: int = 0
+
+    def update(self, x, target, sigma, lam=0.2, L=3.0):
+        """One new value; returns (z, lcl, ucl, signal)."""
+        self.z = (target if self.z is None else self.z) * (1 - lam) + lam * x
+        self.n += 1
+        w = L * sigma * np.sqrt(lam / (2 - lam) * (1 - (1 - lam) ** (2 * self.n)))
+        return self.z, target - w, target + w, abs(self.z - target) > w
+
+
+def _lindley(y, c0):
+    """C_t = max(0, C_{t-1} + y_t) for all t at once, starting from c0."""
+    s = np.cumsum(y)
+    return s - np.minimum(np.minimum.accumulate(s), -c0)
+
+
+def cusum(values, target, sigma, k=0.5, h=5.0, state=None):
+    """Tabular CUSUM of a series (NaN points are skipped: they carry the sums).
+
+    Returns (c_plus, c_minus, signal, state), all in sigma units.
+    """
+    x = np.asarray(values, dtype=float)
+    state = state or CusumState()
+    z = (x - target) / sigma
+    ok = ~np.isnan(z)
+    c_plus = np.full(len(x), np.nan)
+    c_minus = np.full(len(x), np.nan)
+    c_plus[ok] = _lindley(z[ok] - k, state.c_plus)
+    c_minus[ok] = _lindley(-z[ok] - k, state.c_minus)
+    signal = (c_plus > h) | (c_minus > h)
+    if ok.any():
+        state = CusumState(float(c_plus[ok][-1]), float(c_minus[ok][-1]), state.n + int(ok.sum()))
+    return c_plus, c_minus, signal, state
+
+
+def ewma(values, target, sigma, lam=0.2, L=3.0, state=None):
+    """EWMA statistic with its exact (time-varying) limits.
+
+    Returns (z, lcl, ucl, signal, state). NaN points are skipped.
+    """
+    x = np.asarray(values, dtype=float)
+    state = state or EwmaState()
+    ok = ~np.isnan(x)
+    xs = x[ok]
+    z = np.empty(len(xs))
+    prev = target if state.z is None else state.z
+    q = 1 - lam
+    for lo in range(0, len(xs), _EWMA_BLOCK):
+        blk = xs[lo:lo + _EWMA_BLOCK]
+        if q == 0:
+            zb = blk.copy()
+        else:
+            p = q ** np.arange(len(blk))
+            # z_i = q^(i+1) * prev + λ * Σ_{j<=i} q^(i-j) x_j
+            zb = q * p * prev + lam * p * np.cumsum(blk / p)
+        z[lo:lo + len(blk)] = zb
+        prev = zb[-1]
+    n = state.n + np.arange(1, len(xs) + 1)
+    w = L * sigma * np.sqrt(lam / (2 - lam) * (1 - q ** (2 * n)))
+    out = np.full((3, len(x)), np.nan)
+    out[0, ok], out[1, ok], out[2, ok] = z, target - w, target + w
+    signal = np.abs(out[0] - target) > (out[2] - target)
+    if len(xs):
+        state = EwmaState(float(z[-1]), state.n + len(xs))
+    return out[0], out[1], out[2], signal, state
+
+
+def baseline(values, phase2_mask=None):
+    """Target and sigma for the charts: the Phase I batches when there are at
+    least two of them, otherwise the whole series."""
+    v = np.asarray(values, dtype=float)
+    ref = v[~phase2_mask] if phase2_mask is not None and (~phase2_mask).sum() >= 2 else v
+    ref = ref[~np.isnan(ref)]
+    if len(ref) < 2:
+        return None, None
+    return float(ref.mean()), float(ref.std(ddof=1))
@@ -0,0 +1,171 @@
+"""All-colors Limit Status Summary.
+
+Everything is computed on the batch cube in one grouped pass: batch counts,
+control-batch resolution, Phase II membership and, per chart (source x
+factor), total OOC batches and the longest consecutive OOC run, using
+run-length encoding on NumPy arrays instead of a Python loop per color.
+The OOC scan is independent per color and can be split over a process or
+thread pool for large catalogs.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .aggregate import BATCH_COL, COLOR_COL, FACTORS, SOURCES
+from .metrics import timed
+from .rules import run_lengths
+
+STATUS_COLUMNS = [
+    "Color Code", "Total Batches", "Phase II Batches", "Current Limits",
+    "Ready for Calc (Total)", "Recommend Recalc (Phase II)",
+]
+
+
+def _limit_arrays(limits, colors, src, fac):
+    lcl = np.full(len(colors), np.nan)
+    ucl = np.full(len(colors), np.nan)
+    for i, c in enumerate(colors):
+        lo, hi = limits.get(c, src, fac)
+        if lo is not None and hi is not None:
+            lcl[i], ucl[i] = lo, hi
+    return lcl, ucl
+
+
+def _chart_arrays(frame, limits, colors):
+    """Read-only inputs of the OOC scan: one value column and per-color limits per chart."""
+    charts = {}
+    for f in FACTORS:
+        for src in SOURCES:
+            lcl, ucl = _limit_arrays(limits, colors, src, f)
+            charts[(src, f)] = (frame[f"{src.upper()}_{f}"].to_numpy(dtype=float), lcl, ucl)
+    return charts
+
+
+def ooc_stats(arrays, rows=None, color_range=None):
+    """Max consecutive and max total OOC over the six Phase II charts.
+
+    ``arrays`` holds color_idx, phase2, has_time and charts (see
+    _chart_arrays). rows / color_range restrict the scan to a contiguous
+    block of colors so the work can be split across a pool; results are
+    indexed relative to color_range.
+    """
+    rows = rows or (0, len(arrays["color_idx"]))
+    c_lo, c_hi = color_range or (0, len(arrays["n_batches"]))
+    sl = slice(*rows)
+    color_idx = arrays["color_idx"][sl] - c_lo
+    base = arrays["phase2"][sl] & arrays["has_time"][sl]
+    n_colors = c_hi - c_lo
+    max_consec = np.zeros(n_colors, dtype=int)
+    max_total = np.zeros(n_colors, dtype=int)
+    for vals, lcl, ucl in arrays["charts"].values():
+        vals = vals[sl]
+        row_lcl, row_ucl = lcl[c_lo:c_hi][color_idx], ucl[c_lo:c_hi][color_idx]
+        # same rows as the per-color series: Phase II, value and Time present
+        keep = base & ~np.isnan(vals) & ~np.isnan(row_lcl)
+        v, g = vals[keep], color_idx[keep]
+        ooc = (v < row_lcl[keep]) | (v > row_ucl[keep])
+        np.maximum.at(max_consec, g, run_lengths(ooc, g))
+        max_total = np.maximum(max_total, np.bincount(g, weights=ooc, minlength=n_colors).astype(int))
+    return max_consec, max_total
+
+
+# Worker-side copy of the scan inputs, set once per process by the pool initializer.
+_SHARED = None
+
+
+def _init_worker(arrays):
+    global _SHARED
+    _SHARED = arrays
+
+
+def _ooc_task(bounds):
+    rows, color_range = bounds
+    return ooc_stats(_SHARED, rows, color_range)
+
+
+def _chunks(n_batches, n_chunks):
+    """Split colors into contiguous blocks with roughly equal batch counts."""
+    bounds = np.r_[0, np.cumsum(n_batches)]
+    cuts = np.searchsorted(bounds, np.linspace(0, bounds[-1], n_chunks + 1)[1:-1])
+    edges = np.unique(np.r_[0, cuts, len(n_batches)])
+    return [((int(bounds[a]), int(bounds[b])), (int(a), int(b))) for a, b in zip(edges[:-1], edges[1:])]
+
+
+def parallel_ooc_stats(arrays, workers, executor="process"):
+    """ooc_stats over a concurrent.futures pool, merged back in color order.
+
+    With the process pool the arrays reach each worker once through the
+    initializer (inherited for free under fork); tasks only carry row and
+    color bounds.
+    """
+    tasks = _chunks(arrays["n_batches"], workers * 4)
+    if executor == "thread":
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(lambda b: ooc_stats(arrays, *b), tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(arrays,)) as pool:
+            parts = list(pool.map(_ooc_task, tasks))
+    if not parts:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+@timed("status.summary")
+def limit_status_summary(cube, limits, colors, c_th, t_th, workers=1, executor="process", min_colors_per_worker=50):
+    """Status table for every color in ``colors`` (columns: STATUS_COLUMNS).
+
+    workers > 1 fans the OOC scan out over a pool once there are at least
+    min_colors_per_worker colors per worker; smaller catalogs stay in-process
+    where pool start-up would cost more than it saves.
+    """
+    colors = list(colors)
+    pos = {c: i for i, c in enumerate(colors)}
+    frame = cube.frame[cube.frame[COLOR_COL].isin(pos)]
+    color_idx = frame[COLOR_COL].map(pos).to_numpy(dtype=int)
+    order = np.argsort(color_idx, kind="stable")
+    frame, color_idx = frame.iloc[order], color_idx[order]
+
+    total_batches = np.bincount(color_idx, minlength=len(colors))
+    # position of each batch within its color (cube is sorted by Batch_Order)
+    starts = np.r_[0, np.cumsum(total_batches)[:-1]]
+    order_in_color = np.arange(len(frame)) - starts[color_idx]
+
+    cb = np.array([limits.control_batch(c) or 0 for c in colors])
+    resolved = (cb >= 1) & (cb <= total_batches)
+    cb_codes = [
+        frame[BATCH_COL].iloc[starts[i] + cb[i] - 1] if resolved[i] else None
+        for i in range(len(colors))
+    ]
+    phase2 = resolved[color_idx] & (order_in_color >= cb[color_idx] - 1)
+    phase2_batches = np.bincount(color_idx, weights=phase2, minlength=len(colors)).astype(int)
+
+    arrays = {
+        "color_idx": color_idx, "phase2": phase2, "n_batches": total_batches,
+        "has_time": frame["First_Time"].notna().to_numpy(),
+        "charts": _chart_arrays(frame, limits, colors),
+    }
+    workers = min(workers or 1, len(colors) // min_colors_per_worker)
+    if workers > 1:
+        max_consec, max_total = parallel_ooc_stats(arrays, workers, executor)
+    else:
+        max_consec, max_total = ooc_stats(arrays)
+
+    rows = []
+    for i, c in enumerate(colors):
+        status = "✅ Yes" if limits.has_limits(c) else "❌ No"
+        recalc = "❌ Not Enough Data"
+        if cb_codes[i] is not None and phase2_batches[i] >= 3:
+            if status != "✅ Yes":
+                recalc = "❌ Missing Current Limits"
+            elif max_consec[i] >= c_th:
+                recalc = f"⚠️ Propose Recalc ({max_consec[i]} Consec. OOCs)"
+            elif max_total[i] >= t_th:
+                recalc = f"⚠️ Propose Recalc ({max_total[i]} Total OOCs)"
+            else:
+                recalc = f"✅ Stable (Max Consec: {max_consec[i]}, Total: {max_total[i]})"
+        rows.append((
+            c, int(total_batches[i]), int(phase2_batches[i]), status,
+            "✅ Yes" if total_batches[i] >= 3 else "❌ No", recalc,
+        ))
+    return pd.DataFrame(rows, columns=STATUS_COLUMNS)
@@ -0,0 +1,138 @@
+"""Phase II thickness – color correlation per coil, for every color at once.
+
+Phase II rows are averaged per (color, coil) once; every color factor is
+then regressed on Avergage Thickness in one grouped pass over centered
+sums (slope, intercept, r, R²). The OOC-clustering check compares the mean
+thickness of out-of-limit coils with the quartiles of the in-limit ones.
+The dashboard reads one color × factor from the result; ranking() orders
+the whole catalog by thickness sensitivity.
+"""
+import numpy as np
+import pandas as pd
+
+from .aggregate import BATCH_COL, COLOR_COL, THICKNESS_COL, phase2_start
+from .metrics import timed
+
+COIL_COL = "Coil No."
+# Candidate columns per factor; the last one present in the sheet is used.
+COLOR_FACTORS = {
+    "ΔL": ["入料檢測 ΔL 正面", "Average value ΔL 正面"],
+    "Δa": ["入料檢測 Δa 正面", "Average value Δa 正面"],
+    "Δb": ["入料檢測 Δb 正面", "Average value Δb 正面"],
+    "ΔE": ["Average value ΔE 正面"],
+}
+# R² levels of the Interpretation block.
+STRONG_R2, MODERATE_R2 = 0.6, 0.3
+
+
+def factor_columns(columns):
+    """factor label -> column of the sheet holding it."""
+    return {k: c for k, cols in COLOR_FACTORS.items() for c in cols if c in columns}
+
+
+def level(r2):
+    if r2 >= STRONG_R2: return "Strong"
+    if r2 >= MODERATE_R2: return "Moderate"
+    return "Weak"
+
+
+def phase2_positions(index, limits, colors):
+    """Row positions of the Phase II batches of each color (none without a control batch)."""
+    parts = []
+    for c in colors:
+        cb = limits.control_batch(c)
+        p2 = phase2_start(index.control_batch_code(c, cb), cb)
+        if p2 is not None:
+            parts.append(index.batch_rows(c, p2))
+    return np.sort(np.concatenate(parts)) if parts else np.array([], dtype=np.int64)
+
+
+class CoilCorrelation:
+    """Per-coil Phase II aggregate and thickness fits, indexed by (color, factor)."""
+
+    def __init__(self, coils, stats, factors):
+        self.coils = coils  # color, factor, coil, thickness, value, batch, ooc
+        self.stats = stats  # index (color, factor): n, slope, intercept, r, r2, n_ooc, ooc_thickness, normal_q1, normal_q3, risk
+        self.factors = factors  # factor label -> sheet column
+
+    @classmethod
+    @timed("thickness.correlate")
+    def from_rows(cls, rows, limits):
+        """Fits for the given Phase II inspection rows (any number of colors)."""
+        factors = factor_columns(rows.columns)
+        cols = [THICKNESS_COL] + list(dict.fromkeys(factors.values()))
+        coil = rows.groupby([COLOR_COL, COIL_COL], sort=True, observed=True).agg({**{c: "mean" for c in cols}, BATCH_COL: "first"}).reset_index()
+        parts = []
+        for label, col in factors.items():
+            part = coil[[COLOR_COL, COIL_COL, THICKNESS_COL, col, BATCH_COL]].dropna().rename(columns={col: "value"})
+            part.insert(1, "factor", label)
+            parts.append(part)
+        coils = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=[COLOR_COL, "factor", COIL_COL, THICKNESS_COL, "value", BATCH_COL])
+        keys = [COLOR_COL, "factor"]
+        grouped = coils.groupby(keys, sort=True, observed=True)
+        gid = grouped.ngroup().to_numpy()
+        groups = grouped.size().index
+        n = np.bincount(gid, minlength=len(groups))
+
+        # LINE limits of each (color, factor) broadcast to its coils
+        lims = [limits.get(c, "LINE", f) for c, f in groups]
+        lcl = np.array([lo if lo is not None and hi is not None else np.nan for lo, hi in lims], dtype=float)
+        ucl = np.array([hi if lo is not None and hi is not None else np.nan for lo, hi in lims], dtype=float)
+        x, y = coils[THICKNESS_COL].to_numpy(dtype=float), coils["value"].to_numpy(dtype=float)
+        ooc = (y < lcl[gid]) | (y > ucl[gid])
+        coils["ooc"] = ooc
+
+        # centered sums per group
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mx, my = np.bincount(gid, x, len(groups)) / n, np.bincount(gid, y, len(groups)) / n
+            dx, dy = x - mx[gid], y - my[gid]
+            sxx, sxy, syy = (np.bincount(gid, w, len(groups)) for w in (dx * dx, dx * dy, dy * dy))
+            fit = (n >= 2) & (sxx > 0)
+            slope = np.where(fit, sxy / sxx, np.nan)
+            stats = pd.DataFrame({
+                "n": n, "slope": slope, "intercept": my - slope * mx, "r": sxy / np.sqrt(sxx * syy),
+                "r2": np.where(fit, np.where(syy > 0, sxy**2 / (sxx * syy), 0.0), np.nan),
+            }, index=groups)
+            # OOC clustering: mean thickness of OOC coils vs Q1 / Q3 of the normal ones
+            n_ooc = np.bincount(gid, ooc, len(groups))
+            stats["n_ooc"] = n_ooc.astype(int)
+            stats["ooc_thickness"] = np.bincount(gid, x * ooc, len(groups)) / np.where(n_ooc > 0, n_ooc, np.nan)
+        q = pd.Series(x[~ooc]).groupby(gid[~ooc]).quantile([0.25, 0.75]).unstack().reindex(range(len(groups)))
+        stats["normal_q1"] = q[0.25].to_numpy() if len(q.columns) else np.nan
+        stats["normal_q3"] = q[0.75].to_numpy() if len(q.columns) else np.nan
+        stats["risk"] = np.select([stats["ooc_thickness"] > stats["normal_q3"], stats["ooc_thickness"] < stats["normal_q1"]], ["HIGH", "LOW"], None)
+        stats.index.names = keys
+        return cls(coils, stats, factors)
+
+    def get(self, color, factor):
+        """Stats row of one color × factor, or None without coils."""
+        try:
+            return self.stats.loc[(color, factor)]
+        except KeyError:
+            return None
+
+    def coil_frame(self, color, factor):
+        """Coils of one color × factor in the layout of the dashboard table:
+        Coil No., Avergage Thickness, <factor column>, 製造批號; plus the OOC mask."""
+        part = self.coils[(self.coils[COLOR_COL] == color) & (self.coils["factor"] == factor)]
+        frame = part[[COIL_COL, THICKNESS_COL, "value", BATCH_COL]].rename(columns={"value": self.factors[factor]}).reset_index(drop=True)
+        return frame, part["ooc"].to_numpy()
+
+    def ranking(self):
+        """Colors ranked by thickness sensitivity: the factor with the highest R²
+        per color, plus the R² of every factor."""
+        s = self.stats.dropna(subset=["r2"]).reset_index()
+        if s.empty:
+            return pd.DataFrame(columns=["Color Code", "Most Sensitive Factor", "R²", "r", "Slope (per µm)", "Level", "Coils", "OOC Coils", "OOC Thickness Zone"])
+        best = s.sort_values(["r2", "n"], ascending=False, kind="stable").drop_duplicates(COLOR_COL)
+        out = pd.DataFrame({
+            "Color Code": best[COLOR_COL].astype(str).to_numpy(), "Most Sensitive Factor": best["factor"].to_numpy(),
+            "R²": best["r2"].to_numpy(), "r": best["r"].to_numpy(), "Slope (per µm)": best["slope"].to_numpy(),
+            "Level": [level(v) for v in best["r2"]], "Coils": best["n"].to_numpy(),
+            "OOC Coils": best["n_ooc"].to_numpy(), "OOC Thickness Zone": best["risk"].to_numpy(),
+        })
+        per_factor = s.pivot_table(index=s[COLOR_COL].astype(str), columns="factor", values="r2", observed=True)
+        for f in COLOR_FACTORS:
+            if f in per_factor.columns:
+                out[f"R² {f}"] = per_factor[f].reindex(out["Color Code"]).to_numpy()
+        return out.reset_index(drop=True)
@@ -0,0 +1,117 @@
+"""Time-partitioned row layout of the inspection sheet.
+
+Row positions are kept sorted by (塗料編號, Time), undated rows last within
+their color, together with the offsets of every (year, month) partition.
+A year / month filter is then a few slices of that order and a date range
+two binary searches, instead of dt.year / dt.month scans over the rows of
+a color. Instances are never modified, so one can be shared by every
+session.
+"""
+import numpy as np
+import pandas as pd
+
+from .aggregate import COLOR_COL
+from .metrics import timed
+
+_UNDATED = np.iinfo(np.int64).max
+
+
+def _runs(keep, start, stop):
+    """(start, stop) of the maximal runs of consecutive kept partitions."""
+    idx = np.flatnonzero(keep)
+    if not len(idx):
+        return []
+    cut = np.flatnonzero(np.diff(idx) > 1)
+    return list(zip(start[idx[np.r_[0, cut + 1]]], stop[idx[np.r_[cut, len(idx) - 1]]]))
+
+
+class TimeIndex:
+    """Per-color row positions in time order with (year, month) partitions."""
+
+    def __init__(self, pos, times, part_start, part_stop, part_month, colors, n_rows, version=None):
+        self.pos = pos  # row positions sorted by (color, Time), undated last
+        self.times = times  # Time of pos (datetime64)
+        self.part_start, self.part_stop = part_start, part_stop  # partition p: pos[part_start[p]:part_stop[p]]
+        self.part_month = part_month  # months since 1970-01 of each partition, _UNDATED for undated rows
+        self.colors = colors  # color -> slice of its partitions
+        self.n_rows = n_rows
+        self.version = version
+
+    @classmethod
+    @timed("timeindex.build")
+    def from_rows(cls, df, version=None):
+        colors = df[COLOR_COL].astype("category")
+        codes = colors.cat.codes.to_numpy()
+        times = df["Time"].to_numpy()
+        ticks = np.where(np.isnat(times), _UNDATED, times.view(np.int64))
+        months = np.where(np.isnat(times), _UNDATED, times.astype("datetime64[M]").view(np.int64))
+        order = np.lexsort((ticks, codes))
+        order = order[codes[order] >= 0]
+        sc, sm = codes[order], months[order]
+        start = np.flatnonzero(np.r_[True, (sc[1:] != sc[:-1]) | (sm[1:] != sm[:-1])]) if len(order) else np.array([], dtype=np.int64)
+        stop = np.r_[start[1:], len(order)].astype(np.int64)
+        pc = sc[start]
+        first = np.flatnonzero(np.r_[True, pc[1:] != pc[:-1]]) if len(pc) else np.array([], dtype=np.int64)
+        last = np.r_[first[1:], len(pc)]
+        names = colors.cat.categories
+        slices = {names[pc[a]]: slice(a, b) for a, b in zip(first, last)}
+        return cls(order, times[order], start, stop, sm[start], slices, len(df), version)
+
+    def _dated(self, c):
+        """Partition slice of color c without its undated partition."""
+        sl = self.colors.get(c)
+        if sl is None:
+            return slice(0, 0)
+        return slice(sl.start, sl.stop - 1) if self.part_month[sl.stop - 1] == _UNDATED else sl
+
+    def periods(self, c):
+        """(year, month) of every month with rows of color c, in time order."""
+        m = self.part_month[self._dated(c)]
+        return list(zip((m // 12 + 1970).tolist(), (m % 12 + 1).tolist()))
+
+    def years(self, c):
+        return sorted({y for y, _ in self.periods(c)})
+
+    def months(self, c):
+        return sorted({m for _, m in self.periods(c)})
+
+    def select(self, c, years=(), months=(), periods=None):
+        """Row positions of color c in time order, restricted to the given
+        years, months of the year and (year, month) periods; without any
+        restriction every row of c, undated ones last."""
+        sl = self.colors.get(c)
+        if sl is None:
+            return self.pos[:0]
+        if not len(years) and not len(months) and periods is None:
+            return self.pos[self.part_start[sl.start]:self.part_stop[sl.stop - 1]]
+        dated = self._dated(c)
+        m = self.part_month[dated]
+        keep = np.ones(len(m), dtype=bool)
+        if len(years):
+            keep &= np.isin(m // 12 + 1970, list(years))
+        if len(months):
+            keep &= np.isin(m % 12 + 1, list(months))
+        if periods is not None:
+            keep &= np.isin(m, [(y - 1970) * 12 + mo - 1 for y, mo in periods])
+        runs = _runs(keep, self.part_start[dated], self.part_stop[dated])
+        if len(runs) == 1:
+            return self.pos[runs[0][0]:runs[0][1]]
+        return np.concatenate([self.pos[a:b] for a, b in runs]) if runs else self.pos[:0]
+
+    def between(self, c, start=None, end=None):
+        """Row positions of color c with start <= Time < end, in time order."""
+        dated = self._dated(c)
+        if dated.stop <= dated.start:
+            return self.pos[:0]
+        a, b = self.part_start[dated.start], self.part_stop[dated.stop - 1]
+        times = self.times[a:b]
+        lo = 0 if start is None else np.searchsorted(times, np.datetime64(pd.Timestamp(start)), "left")
+        hi = len(times) if end is None else np.searchsorted(times, np.datetime64(pd.Timestamp(end)), "left")
+        return self.pos[a + lo:a + max(lo, hi)]
+
+    def latest(self, c):
+        """Last Time of color c (NaT when it has no dated rows)."""
+        dated = self._dated(c)
+        if dated.stop <= dated.start:
+            return pd.NaT
+        return pd.Timestamp(self.times[self.part_stop[dated.stop - 1] - 1])
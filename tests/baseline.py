@@ -0,0 +1,120 @@
+"""Formulas of the original single-file app.py, kept as reference values for
+the engines that replaced them (row loops and per-color groupbys as they
+were, only lifted out of the Streamlit views).
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+FACTORS = ["ΔL", "Δa", "Δb"]
+
+
+def calculate_batch_averages(df_filtered_color):
+    res = {}
+    for f in FACTORS:
+        tmp = df_filtered_color.copy()
+        # LINE
+        col_n, col_s = f"正-北 {f}", f"正-南 {f}"
+        tmp[col_n] = pd.to_numeric(tmp[col_n], errors='coerce')
+        tmp[col_s] = pd.to_numeric(tmp[col_s], errors='coerce')
+        tmp["row_avg"] = tmp[[col_n, col_s]].mean(axis=1)
+        line_b = tmp.groupby("製造批號", as_index=False).agg({"Time": "min", "row_avg": "mean"}).rename(columns={"row_avg": "value"}).dropna()
+        # LAB
+        col_lab = f"入料檢測 {f} 正面"
+        tmp[col_lab] = pd.to_numeric(tmp[col_lab], errors='coerce')
+        lab_b = tmp.groupby("製造批號", as_index=False).agg({"Time": "min", col_lab: "mean"}).rename(columns={col_lab: "value"}).dropna()
+        res[f] = {"line": line_b, "lab": lab_b}
+    return res
+
+
+def get_control_batch_code(df_unfiltered, control_batch):
+    if control_batch is None or df_unfiltered.empty: return None
+    batch_order = df_unfiltered.sort_values("Time").groupby("製造批號", as_index=False).first().reset_index(drop=True)
+    if 1 <= control_batch <= len(batch_order): return batch_order.loc[control_batch - 1, "製造批號"]
+    return None
+
+
+def detect_out_of_control(spc_df, lcl, ucl):
+    mean = spc_df["value"].mean()
+    std = spc_df["value"].std()
+    result = spc_df.copy()
+    result["Rule_CL"] = False
+    result["Rule_3Sigma"] = False
+    if lcl is not None and ucl is not None:
+        result["Rule_CL"] = ((result["value"] < lcl) | (result["value"] > ucl))
+    if std > 0:
+        result["Rule_3Sigma"] = ((result["value"] > mean + 3 * std) | (result["value"] < mean - 3 * std))
+    result["Out_of_Control"] = (result["Rule_CL"] | result["Rule_3Sigma"])
+    return result[result["Out_of_Control"]]
+
+
+def calculator_limits(d, sig, iqr_k):
+    """Std / IQR limits of one Control Limit Calculator series."""
+    m, s = d.mean(), d.std()
+    q1, q3 = d.quantile(0.25), d.quantile(0.75)
+    return {"m": m, "s": s, "median": d.median(), "std_lcl": m - sig*s, "std_ucl": m + sig*s,
+            "iqr_lcl": q1 - iqr_k*(q3-q1), "iqr_ucl": q3 + iqr_k*(q3-q1)}
+
+
+def derived_de(calc_res):
+    dE_std_sq = dE_iqr_sq = 0
+    for res in calc_res.values():
+        dE_std_sq += max(abs(res["std_lcl"]), abs(res["std_ucl"]))**2
+        dE_iqr_sq += max(abs(res["iqr_lcl"]), abs(res["iqr_ucl"]))**2
+    return math.sqrt(dE_std_sq), math.sqrt(dE_iqr_sq)
+
+
+def tolerance_recommendation(s_L, s_a, s_b, calc_source):
+    """(proc_dE, {factor: (recommended ±, capped)}) of the AI Tolerance Recommendation."""
+    limit_threshold = 1.0 if calc_source.upper() == "LINE" else 0.5
+    visual_cap = 0.600 if calc_source.upper() == "LINE" else 0.350
+    var_sum = s_L**2 + s_a**2 + s_b**2
+    proc_L, proc_a, proc_b = 3 * s_L, 3 * s_a, 3 * s_b
+    proc_dE = math.sqrt(proc_L**2 + proc_a**2 + proc_b**2)
+    if proc_dE <= limit_threshold:
+        M = limit_threshold / math.sqrt(var_sum)
+        raw = M * s_L, M * s_a, M * s_b
+    else:
+        raw = proc_L, proc_a, proc_b
+    return proc_dE, {f: (min(v, visual_cap), v > visual_cap) for f, v in zip(FACTORS, raw)}
+
+
+def scale_up(df):
+    """{factor: (n, mean_bias, std_dev, slope, intercept, r2_score)} of the Lab vs Line view."""
+    batch_compare = df.groupby("製造批號", as_index=False).agg({
+        "入料檢測 ΔL 正面": "mean", "入料檢測 Δa 正面": "mean", "入料檢測 Δb 正面": "mean",
+        "正-北 ΔL": "mean", "正-南 ΔL": "mean",
+        "正-北 Δa": "mean", "正-南 Δa": "mean",
+        "正-北 Δb": "mean", "正-南 Δb": "mean"
+    }).dropna()
+    out = {}
+    for f in FACTORS:
+        x = batch_compare[f"入料檢測 {f} 正面"].values
+        y = batch_compare[[f"正-北 {f}", f"正-南 {f}"]].mean(axis=1).values
+        if len(x) < 3:
+            continue
+        diff = y - x
+        slope, intercept = np.polyfit(x, y, 1)
+        out[f] = (len(x), np.mean(diff), np.std(diff), slope, intercept, (np.corrcoef(x, y)[0, 1])**2)
+    return out
+
+
+def thickness_correlation(df_p2, factor_col, lcl, ucl):
+    """(coil_df, ooc_mask, slope, intercept, r, r2) of the Phase II per-coil analysis."""
+    coil_df = df_p2.groupby("Coil No.", as_index=False).agg({"Avergage Thickness": "mean", factor_col: "mean", "製造批號": "min"}).dropna()
+    ooc_mask = (coil_df[factor_col] < lcl) | (coil_df[factor_col] > ucl) if lcl is not None and ucl is not None else np.zeros(len(coil_df), dtype=bool)
+    x, y = coil_df["Avergage Thickness"].values, coil_df[factor_col].values
+    slope, intercept = np.polyfit(x, y, 1)
+    r2 = 1 - np.sum((y - (slope * x + intercept)) ** 2) / np.sum((y - np.mean(y)) ** 2) if np.sum((y - np.mean(y)) ** 2) != 0 else 0
+    return coil_df, np.asarray(ooc_mask), slope, intercept, coil_df["Avergage Thickness"].corr(coil_df[factor_col]), r2
+
+
+def color_filter(df_raw, color, selected_years, selected_months):
+    df_color = df_raw[df_raw["塗料編號"] == color].copy()
+    all_years = sorted(df_color["Time"].dt.year.dropna().astype(int).unique())
+    all_months = sorted(df_color["Time"].dt.month.dropna().astype(int).unique())
+    df = df_color.copy()
+    if len(selected_years) > 0: df = df[df["Time"].dt.year.isin(selected_years)]
+    if len(selected_months) > 0: df = df[df["Time"].dt.month.isin(selected_months)]
+    return df, all_years, all_months
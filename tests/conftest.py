@@ -0,0 +1,46 @@
+"""Shared fixtures: one synthetic inspection / limit sheet in the layout of
+"DATA 1.csv" (benchmarks.synthetic), with some readings left blank."""
+import numpy as np
+import pytest
+
+from benchmarks import synthetic
+from spc import ingest
+from spc.aggregate import BatchCube, BatchIndex
+from spc.limits import LimitTable
+
+N_ROWS, N_COLORS = 3000, 6
+
+
+@pytest.fixture(scope="session")
+def rows():
+    df = ingest.normalize_data(synthetic.inspection_frame(N_ROWS, N_COLORS, seed=1))
+    rng = np.random.default_rng(2)
+    for col in ("正-北 ΔL", "正-南 Δa", "入料檢測 Δb 正面", "Avergage Thickness"):
+        df.loc[rng.random(len(df)) < 0.03, col] = np.nan
+    return df
+
+
+@pytest.fixture(scope="session")
+def plain_rows(rows):
+    """rows with the identifier columns as plain strings, as the original app read them."""
+    return rows.astype({c: str for c in rows.select_dtypes("category").columns})
+
+
+@pytest.fixture(scope="session")
+def limits():
+    return LimitTable(ingest.normalize_limits(synthetic.limit_frame(N_COLORS)))
+
+
+@pytest.fixture(scope="session")
+def cube(rows):
+    return BatchCube.from_rows(rows)
+
+
+@pytest.fixture(scope="session")
+def index(rows):
+    return BatchIndex.from_rows(rows)
+
+
+@pytest.fixture(scope="session")
+def colors(cube):
+    return cube.colors
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+
+import baseline
+from spc.aggregate import BATCH_COL, COLOR_COL, FACTORS, ORDER_COL, BatchCube, BatchIndex
+
+
+def test_series_match_batch_averages(rows, plain_rows, cube, colors):
+    for c in colors:
+        ref = baseline.calculate_batch_averages(plain_rows[plain_rows[COLOR_COL] == c])
+        got = cube.series(c)
+        for f in FACTORS:
+            for src in ("lab", "line"):
+                want = ref[f][src].sort_values(BATCH_COL).reset_index(drop=True)
+                have = got[f][src].astype({BATCH_COL: str}).sort_values(BATCH_COL).reset_index(drop=True)
+                assert list(have[BATCH_COL]) == list(want[BATCH_COL])
+                np.testing.assert_allclose(have["value"], want["value"], rtol=1e-12)
+                assert (have["Time"].to_numpy() == want["Time"].to_numpy()).all()
+
+
+def test_control_batch_code_matches_original(plain_rows, cube, index, colors):
+    # synthetic batch codes grow with time, so code order and Batch_Order agree
+    for c in colors:
+        df_c = plain_rows[plain_rows[COLOR_COL] == c]
+        for cb in (None, 1, 3, len(cube.color(c)), len(cube.color(c)) + 1):
+            want = baseline.get_control_batch_code(df_c, cb)
+            assert cube.control_batch_code(c, cb) == want
+            assert index.control_batch_code(c, cb) == want
+
+
+def test_batch_order_is_time_rank(cube):
+    for c in cube.colors:
+        part = cube.color(c)
+        assert list(part[ORDER_COL]) == list(range(1, len(part) + 1))
+        assert part["First_Time"].is_monotonic_increasing
+
+
+def test_extend_equals_rebuild(rows):
+    full = BatchCube.from_rows(rows)
+    for cut in (len(rows) // 2, len(rows) - 7):
+        got = BatchCube.from_rows(rows.iloc[:cut]).extend(rows.iloc[cut:])
+        pdt.assert_frame_equal(got.frame, full.frame, check_categorical=False)
+        np.testing.assert_array_equal(got.counts, full.counts)
+        np.testing.assert_allclose(got.sums, full.sums)
+        assert got.n_rows == len(rows)
+
+
+def test_extend_renumbers_backdated_rows(rows):
+    # a tail row dated before every batch of its color moves that batch to the front
+    c = rows[COLOR_COL].iloc[0]
+    late = rows[rows[COLOR_COL] == c].iloc[[-1]].copy()
+    late["Time"] = rows["Time"].min() - pd.Timedelta(days=1)
+    head = rows.drop(late.index)
+    got = BatchCube.from_rows(head).extend(late)
+    want = BatchCube.from_rows(pd.concat([head, late]))
+    pdt.assert_frame_equal(got.frame, want.frame, check_categorical=False)
+    assert got.color(c)[BATCH_COL].iat[0] == late[BATCH_COL].iat[0]
+
+
+def test_index_extend_equals_rebuild(rows, index):
+    cut = len(rows) // 3
+    got = BatchIndex.from_rows(rows.iloc[:cut]).extend(rows.iloc[cut:])
+    for c in index.colors:
+        assert got.n_batches(c) == index.n_batches(c)
+        np.testing.assert_array_equal(np.sort(got.batch_rows(c)), np.sort(index.batch_rows(c)))
+
+
+def test_filtered_cube_keeps_full_history_order(rows, cube):
+    sub = rows[rows["Time"].dt.month == 3]
+    part = BatchCube.from_rows(sub, reference=cube)
+    ref = cube.frame.set_index([COLOR_COL, BATCH_COL])[ORDER_COL]
+    keys = pd.MultiIndex.from_frame(part.frame[[COLOR_COL, BATCH_COL]])
+    np.testing.assert_array_equal(part.frame[ORDER_COL].to_numpy(), ref.reindex(keys).to_numpy())
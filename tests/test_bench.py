@@ -0,0 +1,29 @@
+from benchmarks import bench, synthetic
+from spc import ingest
+from spc.aggregate import BATCH_COL, COLOR_COL
+
+
+def test_parse_case():
+    assert bench._parse_case("10k:50") == (10_000, 50)
+    assert bench._parse_case("1.5M:1000") == (1_500_000, 1000)
+    assert bench._parse_case("800:3") == (800, 3)
+
+
+def test_synthetic_layout():
+    df = ingest.normalize_data(synthetic.inspection_frame(2000, 5))
+    assert df[COLOR_COL].nunique() == 5
+    assert df["Time"].notna().all()
+    # one LAB reading and one inspection day per batch
+    per_batch = df.groupby([COLOR_COL, BATCH_COL], observed=True)
+    assert (per_batch["入料檢測 ΔL 正面"].nunique() == 1).all()
+    assert (per_batch["Time"].nunique() == 1).all()
+
+
+def test_run_case_and_compare(tmp_path):
+    res = bench.run_case(2000, 4, 1, str(tmp_path))
+    assert res["rows"] == 2000 and res["colors"] == 4
+    assert all(v["min"] >= 0 for v in res["steps"].values())
+    results = {"cases": [res]}
+    assert bench.compare(results, results, 1.25) == []
+    slow = {"cases": [{**res, "steps": {**res["steps"], "batch_cube": {"min": 10.0}}}]}
+    assert [s[:2] for s in bench.compare(slow, results, 1.25)] == [(res["case"], "batch_cube")]
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from spc import bootstrap
+from spc.aggregate import FACTORS
+from spc.bootstrap import fleet_intervals, intervals, paired_values, resample, results
+from spc.calculator import LimitCalculator, SeriesStats
+
+
+def paired_calc(n=40, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(0, 0.2, n)
+    order = rng.permutation(n) + 1
+    return LimitCalculator.from_stats({"ΔL": SeriesStats(x, order), "Δa": SeriesStats(2 * x + 1, order), "Δb": SeriesStats(-x, order)})
+
+
+def test_resamples_keep_factors_paired():
+    boot = resample(paired_calc(), 300, seed=1)
+    s = boot.stats
+    np.testing.assert_allclose(s["Δa"].mean, 2 * s["ΔL"].mean + 1)
+    np.testing.assert_allclose(s["Δa"].std, 2 * s["ΔL"].std)
+    np.testing.assert_allclose(s["Δb"].q1, -s["ΔL"].q3)
+
+
+def test_only_batches_of_every_factor():
+    calc = LimitCalculator.from_stats({
+        "ΔL": SeriesStats([1., 2, 3, 4], [4, 1, 2, 3]),
+        "Δa": SeriesStats([10., 30, 40], [1, 3, 4]),
+        "Δb": SeriesStats([7., 8, 9, 6], [1, 2, 3, 4]),
+    })
+    values = paired_values(calc)
+    # batches 1, 3, 4 in that order for every factor
+    assert {f: list(v) for f, v in values.items()} == {"ΔL": [2, 4, 1], "Δa": [10, 30, 40], "Δb": [7, 9, 6]}
+    assert all(s.n == 3 for s in resample(calc, 5, 0).stats.values())
+
+
+def test_resampled_statistics(monkeypatch):
+    calc = paired_calc(25)
+    x = paired_values(calc)["ΔL"]
+    idx = np.random.default_rng(3).integers(0, len(x), (200, len(x)))
+    want = pd.DataFrame(x[idx].T)
+    # chunked (a few resamples at a time) or not, the draws and results are the same
+    for cells in (bootstrap.MAX_CELLS, 7 * len(x)):
+        monkeypatch.setattr(bootstrap, "MAX_CELLS", cells)
+        s = resample(calc, 200, seed=3).stats["ΔL"]
+        np.testing.assert_allclose(s.mean, want.mean())
+        np.testing.assert_allclose(s.std, want.std())
+        np.testing.assert_allclose(s.median, want.median())
+        np.testing.assert_allclose(s.iqr, want.quantile(0.75) - want.quantile(0.25))
+
+
+def test_intervals_bracket_estimates(cube, colors):
+    calc = LimitCalculator.from_series(cube.series(colors[0]), "LINE")
+    boot = resample(calc, 1000, seed=0)
+    table = intervals(calc, boot, 3.0, 1.5, "LINE")
+    est = results(calc, 3.0, 1.5, "LINE")
+    assert list(table["Quantity"]) == list(est)
+    np.testing.assert_allclose(table["Estimate"], [float(v) for v in est.values()])
+    assert (table["Lower"] <= table["Upper"]).all()
+    inside = (table["Lower"] <= table["Estimate"]) & (table["Estimate"] <= table["Upper"])
+    assert inside.mean() > 0.8
+    # same seed, same draws
+    again = intervals(calc, resample(calc, 1000, seed=0), 3.0, 1.5, "LINE")
+    pd.testing.assert_frame_equal(table, again)
+
+
+def test_fleet_is_independent_of_workers(cube, colors):
+    one = fleet_intervals(cube, colors, n_resamples=200, seed=5)
+    pool = fleet_intervals(cube, colors, n_resamples=200, seed=5, workers=2)
+    pd.testing.assert_frame_equal(one, pool)
+    assert list(one["Color Code"].unique()) == colors
+    # each color's block equals a run of that color alone with its spawned seed
+    seed = np.random.SeedSequence(5).spawn(len(colors))[2]
+    calc = LimitCalculator.from_series(cube.series(colors[2]), "LINE")
+    alone = intervals(calc, resample(calc, 200, seed), 3.0, 1.5, "LINE")
+    np.testing.assert_allclose(one[one["Color Code"] == colors[2]][["Lower", "Upper"]], alone[["Lower", "Upper"]])
+
+
+def test_fleet_skips_short_series(cube, colors):
+    inputs = bootstrap.fleet_inputs(cube, colors, "LINE")
+    short = {c: {f: (v[:2], o[:2]) for f, (v, o) in inputs[c].items()} for c in colors}
+    task = (colors, np.random.SeedSequence(0).spawn(len(colors)), 3.0, 1.5, "LINE", 50, 0.95)
+    assert bootstrap.color_intervals(short, task) == []
+    assert set(FACTORS) == set(inputs[colors[0]])
+
+
+@pytest.mark.parametrize("level", [0.9, 0.99])
+def test_percentile_interval(level):
+    v = np.r_[np.arange(1000.0), np.nan]
+    lo, hi = bootstrap.percentile_interval(v, level)
+    assert lo == pytest.approx(np.quantile(np.arange(1000.0), (1 - level) / 2))
+    assert hi == pytest.approx(np.quantile(np.arange(1000.0), (1 + level) / 2))
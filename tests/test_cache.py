@@ -0,0 +1,96 @@
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from spc.cache import SharedCache, sizeof
+
+
+def wait_for(cond, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.001)
+
+
+def test_single_flight():
+    cache = SharedCache(name="test")
+    release, calls, got = threading.Event(), [], []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return np.arange(10)
+
+    threads = [threading.Thread(target=lambda: got.append(cache.get_or_compute("k", compute))) for _ in range(3)]
+    for t in threads:
+        t.start()
+    # every caller has missed, so all but the leader are waiting on its result
+    wait_for(lambda: cache.misses == 3)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and len(got) == 3 and all(g is got[0] for g in got)
+    assert cache.get_or_compute("k", compute) is got[0] and cache.hits == 1
+
+
+def test_leader_exception_reaches_waiters():
+    cache = SharedCache(name="test")
+    release, errors = threading.Event(), []
+
+    def compute():
+        release.wait(5)
+        raise KeyError("boom")
+
+    def call():
+        try:
+            cache.get_or_compute("k", compute)
+        except KeyError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(2)]
+    for t in threads:
+        t.start()
+    wait_for(lambda: cache.misses == 2)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(errors) == 2 and errors[0] is errors[1]
+    # nothing cached and nothing left in flight: the next call computes again
+    assert len(cache) == 0 and not cache._inflight
+    assert cache.get_or_compute("k", lambda: 1) == 1
+
+
+def test_eviction_stays_under_max_bytes():
+    cache = SharedCache(max_bytes=100, name="test", sizer=len)
+    for i in range(5):
+        cache.put(i, bytes(30))
+        assert cache.size <= 100
+    assert list(cache._items) == [2, 3, 4] and cache.size == 90
+    # a hit makes the entry most recent, so the next eviction skips it
+    cache.get(2)
+    cache.put(5, bytes(30))
+    assert list(cache._items) == [4, 2, 5]
+    cache.put(6, bytes(101))
+    assert cache.get(6) is None and cache.size == 90
+    cache.put(4, bytes(10))
+    assert cache.size == 70
+    cache.clear()
+    assert len(cache) == 0 and cache.size == 0
+
+
+def test_sizeof_counts_shared_objects_once():
+    a = np.zeros(1000)
+    assert sizeof({"x": a, "y": a}) == a.nbytes + sys.getsizeof({"x": a, "y": a})
+    s = pd.Series(pd.Categorical([f"color {i:05d}" for i in range(2000)]))
+    parts = [s[:500], s[500:]]
+    cats = sizeof(s.dtype.categories)
+    one = [sizeof(p) for p in parts]
+    assert all(n > cats for n in one)
+    # the slices share one categories index
+    assert sizeof(parts) == sum(one) - cats + sys.getsizeof(parts)
+    frame = pd.DataFrame({"c": s, "x": np.arange(2000.0)})
+    assert sizeof(frame) == pytest.approx(frame.index.memory_usage() + s.cat.codes.to_numpy().nbytes + cats + 16000)
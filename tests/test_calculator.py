@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline
+from spc.aggregate import FACTORS, ORDER_COL
+from spc.calculator import DE_TARGET, VISUAL_CAP, LimitCalculator, quantile, tolerance
+
+SETTINGS = [(3.0, 1.5), (2.0, 0.5), (4.5, 3.0)]
+
+
+def test_quantile_matches_pandas():
+    rng = np.random.default_rng(0)
+    for n in (1, 2, 3, 4, 7, 50):
+        v = np.sort(rng.normal(size=n))
+        for q in (0.25, 0.5, 0.75):
+            assert quantile(v, q) == pytest.approx(pd.Series(v).quantile(q))
+
+
+@pytest.mark.parametrize("source", ["LINE", "LAB"])
+def test_limits_and_de_match_original(cube, colors, source):
+    for c in colors:
+        series = cube.series(c)
+        calc = LimitCalculator.from_series(series, source)
+        for sig, k in SETTINGS:
+            ref = {f: baseline.calculator_limits(series[f][source.lower()]["value"], sig, k) for f in FACTORS}
+            for f in FACTORS:
+                s = calc.stats[f]
+                assert (s.mean, s.std, s.median) == pytest.approx((ref[f]["m"], ref[f]["s"], ref[f]["median"]))
+                assert s.limits(sig, k) == pytest.approx(tuple(ref[f][n] for n in ("std_lcl", "std_ucl", "iqr_lcl", "iqr_ucl")))
+            assert calc.derived_de(sig, k) == pytest.approx(baseline.derived_de(ref))
+
+
+@pytest.mark.parametrize("source", ["LINE", "LAB"])
+def test_tolerance_matches_original(source):
+    # capable, incapable and capped processes
+    for stds in ((0.05, 0.04, 0.06), (0.2, 0.1, 0.15), (0.4, 0.02, 0.03), (0.01, 0.3, 0.01)):
+        proc_de, ref = baseline.tolerance_recommendation(*stds, source)
+        tol = tolerance(dict(zip(FACTORS, stds)), DE_TARGET[source], VISUAL_CAP[source])
+        assert tol["process_de"] == pytest.approx(proc_de)
+        for f in FACTORS:
+            assert (float(tol["limit"][f]), bool(tol["capped"][f])) == pytest.approx(ref[f])
+        assert tol["de"] == pytest.approx(np.sqrt(sum(v**2 for v, _ in ref.values())))
+
+
+def test_tolerance_takes_arrays():
+    stds = {f: np.array([0.05, 0.2]) for f in FACTORS}
+    tol = tolerance(stds, DE_TARGET["LINE"], VISUAL_CAP["LINE"])
+    for i in range(2):
+        one = tolerance({f: s[i] for f, s in stds.items()}, DE_TARGET["LINE"], VISUAL_CAP["LINE"])
+        assert tol["limit"]["ΔL"][i] == pytest.approx(one["limit"]["ΔL"])
+        assert tol["capable"][i] == one["capable"]
+
+
+def test_sweep_counts_flagged_batches(cube, colors):
+    for c in colors:
+        series = cube.series(c)
+        calc = LimitCalculator.from_series(series, "LINE")
+        sigmas, iqr_ks = np.array([1.0, 1.5, 2.0, 3.0]), np.array([0.0, 0.5, 1.5])
+        table = calc.sweep(sigmas, iqr_ks)
+        parts = {f: series[f]["line"].set_index(ORDER_COL)["value"] for f in FACTORS}
+        batches = sorted(set().union(*(p.index for p in parts.values())))
+        want = []
+        for method, settings in (("std", sigmas), ("iqr", iqr_ks)):
+            for v in settings:
+                flagged = set()
+                for f, p in parts.items():
+                    lo, hi = calc.stats[f].limits(v, v)[slice(0, 2) if method == "std" else slice(2, 4)]
+                    flagged |= set(p.index[(p < lo) | (p > hi)])
+                want.append(len(flagged))
+        np.testing.assert_array_equal(table["Flagged batches"], want)
+        np.testing.assert_allclose(table["False-alarm rate"], np.array(want) / len(batches))
+        de = [calc.derived_de(v, 0.0)[0] for v in sigmas] + [calc.derived_de(0.0, v)[1] for v in iqr_ks]
+        np.testing.assert_allclose(table["ΔE UCL"], de)
@@ -0,0 +1,72 @@
+from statistics import NormalDist
+
+import numpy as np
+import pytest
+
+from benchmarks import synthetic
+from spc import ingest
+from spc.capability import D2, MIN_BATCHES, SERIES, catalog, level, series_capability
+from spc.limits import LimitTable
+
+
+def capability_loop(values, lsl, usl):
+    """Cp, Cpk, Pp, Ppk and ppm of one series from their definitions."""
+    v = values[~np.isnan(values)]
+    mean, overall = v.mean(), v.std(ddof=1)
+    within = np.abs(np.diff(v)).mean() / D2
+    out = {"Batches": len(v), "Mean": mean, "σ Within": within, "σ Overall": overall}
+    for p, s in (("C", within), ("P", overall)):
+        out[f"{p}p"] = (usl - lsl) / (6 * s) if lsl is not None and usl is not None else np.nan
+        sides = ([(usl - mean) / (3 * s)] if usl is not None else []) + ([(mean - lsl) / (3 * s)] if lsl is not None else [])
+        out[f"{p}pk"] = min(sides) if sides else np.nan
+    tails = [1 - NormalDist().cdf((usl - mean) / overall)] if usl is not None else []
+    tails += [NormalDist().cdf((lsl - mean) / overall)] if lsl is not None else []
+    out["Expected ppm"] = sum(tails) * 1e6 if tails else np.nan
+    return out
+
+
+@pytest.fixture(scope="module")
+def spec_limits():
+    frame = ingest.normalize_limits(synthetic.limit_frame(6))
+    frame["Thickness LSL"], frame["Thickness USL"] = 22.0, np.nan
+    frame.loc[0, "Thickness USL"] = 26.0
+    return LimitTable(frame)
+
+
+def test_catalog_matches_definitions(cube, colors, spec_limits):
+    table = catalog(cube, spec_limits, colors).set_index(["Color Code", "Source", "Factor"])
+    checked = 0
+    for c in colors:
+        part = cube.color(c)
+        part = part[part["First_Time"].notna()]
+        for source, factor, col, lim_src, lim_fac in SERIES:
+            lsl, usl = spec_limits.get(c, lim_src, lim_fac)
+            values = part[col].to_numpy(dtype=float)
+            if np.count_nonzero(~np.isnan(values)) < MIN_BATCHES:
+                assert (c, source, factor) not in table.index
+                continue
+            row = table.loc[(c, source, factor)]
+            for k, want in capability_loop(values, lsl, usl).items():
+                assert row[k] == pytest.approx(want, rel=1e-9, nan_ok=True), (c, source, factor, k)
+            assert row["Level"] == level(row["Cpk"])
+            checked += 1
+    assert checked == len(table)
+
+
+def test_series_capability_matches_catalog(cube, colors, spec_limits):
+    c = colors[0]
+    row = catalog(cube, spec_limits, [c]).query("Source == 'LINE' and Factor == 'ΔL'").iloc[0]
+    part = cube.color(c)
+    got = series_capability(part["LINE_ΔL"], *spec_limits.get(c, "LINE", "ΔL"))
+    assert got["n"] == row["Batches"]
+    for k in ("Mean", "σ Within", "σ Overall", "Cp", "Cpk", "Pp", "Ppk", "Expected ppm"):
+        assert got[k.lower() if k == "Mean" else k] == pytest.approx(row[k])
+
+
+def test_catalog_color_order(cube, colors, limits):
+    picked = [colors[3], colors[0]]
+    assert list(catalog(cube, limits, picked)["Color Code"].unique()) == picked
+
+
+def test_level():
+    assert [level(v) for v in (1.4, 1.33, 1.0, 0.99, np.nan)] == ["✅ Capable", "✅ Capable", "⚠️ Marginal", "❌ Not capable", ""]
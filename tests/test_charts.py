@@ -0,0 +1,28 @@
+import numpy as np
+
+from spc.charts import decimate
+
+
+def test_short_series_whole():
+    assert list(decimate(np.arange(5.0), 10)) == list(range(5))
+
+
+def test_keeps_bucket_extremes_and_flagged_points():
+    rng = np.random.default_rng(0)
+    v = rng.normal(size=10_007)
+    v[rng.random(len(v)) < 0.02] = np.nan
+    v[4000:4100] = np.nan  # an all-blank bucket
+    keep = np.zeros(len(v), dtype=bool)
+    keep[[17, 5003, 9999]] = True
+    pos = decimate(v, 100, keep)
+    assert np.all(np.diff(pos) > 0) and pos[0] == 0 and pos[-1] == len(v) - 1
+    assert {17, 5003, 9999} <= set(pos)
+    assert len(pos) <= 100 + 2 + 3
+    size = -(-len(v) // 50)
+    for a in range(0, len(v), size):
+        bucket = v[a:a + size]
+        if np.isnan(bucket).all():
+            continue
+        assert {a + np.nanargmin(bucket), a + np.nanargmax(bucket)} <= set(pos)
+    # the drawn line spans the full value range
+    assert np.nanmin(v[pos]) == np.nanmin(v) and np.nanmax(v[pos]) == np.nanmax(v)
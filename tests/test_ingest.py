@@ -0,0 +1,124 @@
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic
+from spc import ingest
+from spc.ingest import SnapshotStore, conform_concat, sync
+
+
+@pytest.fixture(scope="module")
+def sheet():
+    return synthetic.inspection_frame(400, 4, seed=3)
+
+
+def export(frame, header=True):
+    # the sheet export has no line break after the last row
+    return frame.to_csv(index=False, header=header, lineterminator="\r\n").rstrip("\r\n").encode()
+
+
+def put(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def full(tmp_path, source):
+    """A full ingest of source, as the next page load reads it back."""
+    store = SnapshotStore(str(tmp_path / "full"))
+    ingest.ingest(store, "data", source, ingest.normalize_data)
+    return store.read("data")[0]
+
+
+def test_appends_match_full_ingest(tmp_path, sheet):
+    store = SnapshotStore(str(tmp_path / "snap"))
+    source = put(tmp_path / "data.csv", export(sheet.iloc[:200]))
+    frame, meta, tail = sync(store, "data", source, ingest.normalize_data)
+    assert tail is None and len(frame) == 200
+    raw = export(sheet.iloc[:200])
+    for stop in (250, 251, 400):
+        raw += b"\r\n" + export(sheet.iloc[len(frame):stop], header=False)
+        put(tmp_path / "data.csv", raw)
+        parent = meta["version"]
+        frame, meta, tail = sync(store, "data", source, ingest.normalize_data)
+        assert tail is not None and len(tail) == stop - meta["parent_rows"]
+        assert (meta["parent"], meta["parent_rows"]) == (parent, stop - len(tail))
+        pd.testing.assert_frame_equal(frame, full(tmp_path, source))
+        pd.testing.assert_frame_equal(store.read("data")[0], frame)
+    # nothing new: no rows, same version
+    frame, again, tail = sync(store, "data", source, ingest.normalize_data)
+    assert len(tail) == 0 and again["version"] == meta["version"] and len(again["files"]) == 4
+
+
+@pytest.mark.parametrize("edit", [b"5", b"\r\n,,,,,,,,"])
+def test_edited_or_invalid_tail_reingests(tmp_path, sheet, edit):
+    store = SnapshotStore(str(tmp_path / "snap"))
+    raw = export(sheet.iloc[:100])
+    source = put(tmp_path / "data.csv", raw)
+    sync(store, "data", source, ingest.normalize_data)
+    # b"5" extends the last reading in place (…,0.11 -> …,0.115); the blank
+    # row has no Time and no batch number
+    put(tmp_path / "data.csv", raw + edit)
+    frame, meta, tail = sync(store, "data", source, ingest.normalize_data)
+    assert tail is None and "parent" not in meta and len(meta["files"]) == 1 and len(frame) == 100 + (edit != b"5")
+    pd.testing.assert_frame_equal(store.read("data")[0], full(tmp_path, source))
+
+
+def test_tail_keeps_new_categories(tmp_path, sheet):
+    store = SnapshotStore(str(tmp_path / "snap"))
+    raw = export(sheet.iloc[:100])
+    source = put(tmp_path / "data.csv", raw)
+    sync(store, "data", source, ingest.normalize_data)
+    new = sheet.iloc[100:110].assign(**{"塗料編號": "PS9999TP", "製造批號": "F99990001"})
+    put(tmp_path / "data.csv", raw + b"\r\n" + export(new, header=False))
+    frame, _, tail = sync(store, "data", source, ingest.normalize_data)
+    for col in ingest.CATEGORY_COLUMNS:
+        assert isinstance(frame[col].dtype, pd.CategoricalDtype)
+    assert (frame["塗料編號"].iloc[100:] == "PS9999TP").all()
+    assert "F99990001" in store.read("data")[0]["製造批號"].cat.categories
+
+
+def test_parts_compact(tmp_path, sheet, monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_PARTS", 3)
+    store = SnapshotStore(str(tmp_path / "snap"))
+    raw = export(sheet.iloc[:100])
+    source = put(tmp_path / "data.csv", raw)
+    sync(store, "data", source, ingest.normalize_data)
+    parts = []
+    for start in range(100, 150, 10):
+        raw += b"\r\n" + export(sheet.iloc[start:start + 10], header=False)
+        put(tmp_path / "data.csv", raw)
+        frame, meta, _ = sync(store, "data", source, ingest.normalize_data)
+        parts.append(len(meta["files"]))
+    # one part per tail until MAX_PARTS, then a single compacted file
+    assert parts == [2, 3, 1, 2, 3]
+    assert sorted(p.name for p in (tmp_path / "snap").iterdir() if ".meta" not in p.name) == sorted(meta["files"])
+    pd.testing.assert_frame_equal(store.read("data")[0], frame)
+    pd.testing.assert_frame_equal(frame, full(tmp_path, source))
+
+
+def test_load_table_syncs_stale_snapshot(tmp_path, sheet):
+    store = SnapshotStore(str(tmp_path / "snap"))
+    raw = export(sheet.iloc[:100])
+    source = put(tmp_path / "data.csv", raw)
+    frame, version = ingest.load_table(store, "data", source, ingest.normalize_data)
+    assert ingest.load_table(store, "data", source, ingest.normalize_data)[1] == version
+    put(tmp_path / "data.csv", raw + b"\r\n" + export(sheet.iloc[100:120], header=False))
+    frame, new = ingest.load_table(store, "data", source, ingest.normalize_data)
+    assert new != version and len(frame) == 120
+    assert store.read_meta("data")["parent"] == version
+
+
+def test_conform_concat():
+    base = pd.DataFrame({"c": pd.Categorical(["b", "a"]), "x": [1.0, 2.0]})
+    part = pd.DataFrame({"x": [3], "c": ["z"]})
+    out = conform_concat([base, part])
+    assert list(out.columns) == ["c", "x"] and out["x"].dtype == float
+    assert list(out["c"]) == ["b", "a", "z"] and list(out["c"].cat.categories) == ["a", "b", "z"]
+
+
+def test_identifier_columns(tmp_path, sheet):
+    source = put(tmp_path / "data.csv", export(sheet.iloc[:50].assign(**{"塗料編號": " PS0000TP "})))
+    frame = full(tmp_path, source)
+    assert list(frame["塗料編號"].cat.categories) == ["PS0000TP"]
+    assert isinstance(frame["製造批號"].dtype, pd.CategoricalDtype)
+    # Coil No. is nearly unique per row and stays text
+    assert not isinstance(frame["Coil No."].dtype, pd.CategoricalDtype)
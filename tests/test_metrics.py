@@ -0,0 +1,57 @@
+import json
+import logging
+
+from spc.metrics import REGISTRY, Registry, Trace, count, span, timed
+
+
+def test_trace_collects_spans_laps_and_counters():
+    @timed("test.step")
+    def step():
+        count("test_hits", table="data")
+        return 7
+
+    with Trace("test.run") as trace:
+        assert step() == 7
+        with span("test.inner"):
+            pass
+        trace.lap("section")
+        count("test_hits", 2, table="data")
+    assert [s for s, _ in trace.spans] == ["test.step", "test.inner"]
+    assert [s for s, _ in trace.laps] == ["section"]
+    assert trace.counters == {("test_hits", (("table", "data"),)): 3}
+    assert trace.total >= sum(d for _, d in trace.laps)
+    # outside a trace spans only feed the registry
+    step()
+    assert trace.counters[("test_hits", (("table", "data"),))] == 3
+    assert REGISTRY.timings[("span_seconds", (("span", "test.step"),))][0] >= 2
+
+
+def test_trace_log_is_one_json_line(caplog):
+    with Trace("test.log") as trace:
+        with span("test.logged"):
+            pass
+    with caplog.at_level(logging.INFO, logger="spc.metrics"):
+        trace.log()
+    rec = json.loads(caplog.records[-1].getMessage())
+    assert rec["run"] == "test.log" and rec["spans"][0]["span"] == "test.logged"
+
+
+def test_prometheus_text():
+    reg = Registry()
+    reg.inc("cache_calls", cache="views")
+    reg.inc("cache_calls", 2, cache="views")
+    reg.observe("span_seconds", 0.5, span="a")
+    reg.observe("span_seconds", 1.5, span="a")
+    text = reg.prometheus().splitlines()
+    assert "# TYPE spc_cache_calls_total counter" in text
+    assert 'spc_cache_calls_total{cache="views"} 3' in text
+    assert 'spc_span_seconds_count{span="a"} 2' in text
+    assert 'spc_span_seconds_sum{span="a"} 2.000000' in text
+    assert 'spc_span_seconds_max{span="a"} 1.500000' in text
+
+
+def test_memory_trace_reports_peak():
+    with Trace("test.memory", memory=True) as trace:
+        blob = bytearray(2**20)
+    del blob
+    assert trace.peak_bytes >= 2**20
@@ -0,0 +1,122 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic
+from spc import ingest, monitor
+from spc.aggregate import BATCH_COL, COLOR_COL, FACTORS, ORDER_COL, lab_col, line_cols
+from spc.limits import LimitTable
+from spc.monitor import OnlineMonitor, SeriesState, Welford
+from spc.pipeline import Dataset, results
+
+
+def reading(color, code, day, x):
+    row = {COLOR_COL: color, BATCH_COL: code, "Time": pd.Timestamp("2024-01-01") + pd.Timedelta(days=day)}
+    for f in FACTORS:
+        row[lab_col(f)] = x
+        row.update(dict.fromkeys(line_cols(f), x))
+    return row
+
+
+def one_color_limits(control_batch):
+    frame = synthetic.limit_frame(1).assign(Color_code="A", Control_batch=f"Batch {control_batch}")
+    return LimitTable(ingest.normalize_limits(frame))
+
+
+def test_warm_up_matches_pipeline(rows, limits):
+    m = OnlineMonitor(limits)
+    assert m.warm_up(rows) == []
+    got = {k for k, (rule_cl, mask) in m.reported.items() if rule_cl or mask}
+    res = results(Dataset(rows, limits))
+    res = res[res["Out_of_Control"]]
+    want = set(zip(res[COLOR_COL], res[BATCH_COL].astype(str), res["Source"].str.lower(), res["Factor"]))
+    assert want and {(str(c), str(b), s, f) for c, b, s, f in got} == want
+
+
+def test_feed_numbers_batches_like_the_cube(rows, limits, cube):
+    ordered = rows[rows[COLOR_COL].notna()].sort_values("Time", kind="stable")
+    half = len(ordered) * 3 // 4
+    m = OnlineMonitor(limits)
+    m.warm_up(ordered.iloc[:half])
+    m.feed(ordered.iloc[half:])
+    want = {(c, str(b)): o for c, b, o in zip(cube.frame[COLOR_COL], cube.frame[BATCH_COL], cube.frame[ORDER_COL])}
+    assert {(c, str(code)): b.index for (c, code), b in m.batches.items()} == want
+    full = OnlineMonitor(limits)
+    full.warm_up(rows)
+    for key, state in full.series.items():
+        assert m.series[key].stats.mean == pytest.approx(state.stats.mean)
+        assert m.series[key].stats.std == pytest.approx(state.stats.std, nan_ok=True)
+
+
+def test_backdated_row_renumbers():
+    m = OnlineMonitor(one_color_limits(2))
+    m.warm_up(pd.DataFrame([reading("A", "B1", 1, 0.1), reading("A", "B2", 3, 0.2), reading("A", "B3", 5, 0.3)]))
+    m.push(reading("A", "B0", 2, 0.4))
+    assert {code: b.index for (_, code), b in m.batches.items()} == {"B1": 1, "B0": 2, "B2": 3, "B3": 4}
+    # an earlier coil of B3 moves it to the front; Phase II now starts at B1
+    m.push(reading("A", "B3", 0, 0.5))
+    assert {code: b.index for (_, code), b in m.batches.items()} == {"B3": 1, "B1": 2, "B0": 3, "B2": 4}
+    state = m.series[("A", "line", "ΔL")]
+    assert state.codes == ["B1", "B0", "B2"] and state.orders == [2, 3, 4]
+    assert state.stats.mean == pytest.approx(np.mean([0.1, 0.4, 0.2]))
+
+
+def test_control_batch_change_rebuilds_phase2():
+    m = OnlineMonitor(one_color_limits(1))
+    m.warm_up(pd.DataFrame([reading("A", f"B{i}", i, 0.1 * i) for i in range(1, 6)]))
+    assert m.series[("A", "lab", "Δa")].codes == ["B1", "B2", "B3", "B4", "B5"]
+    m.limits = one_color_limits(4)
+    m.push(reading("A", "B6", 6, 0.6))
+    assert m.phase2["A"] == 4
+    state = m.series[("A", "lab", "Δa")]
+    assert state.codes == ["B4", "B5", "B6"]
+    assert (state.stats.mean, state.stats.std) == pytest.approx((0.5, 0.1))
+
+
+def test_welford_remove():
+    rng = np.random.default_rng(0)
+    x = rng.normal(3, 2, 50)
+    w = Welford()
+    for v in x:
+        w.push(v)
+    for v in x[:45]:
+        w.remove(v)
+    assert (w.n, w.mean, w.std) == pytest.approx((5, x[45:].mean(), x[45:].std(ddof=1)))
+    for v in x[45:]:
+        w.remove(v)
+    assert (w.n, w.mean, w.m2) == (0, 0.0, 0.0) and np.isnan(w.std)
+
+
+def test_revisions_do_not_drift(monkeypatch):
+    monkeypatch.setattr(monitor, "RESEED_EVERY", 100)
+    rng = np.random.default_rng(1)
+    state = SeriesState()
+    for i in range(20):
+        state.append(i + 1, i, 1e4 + rng.normal())
+    for _ in range(1050):
+        i = int(rng.integers(20))
+        state.update(i + 1, i, 1e4 + rng.normal())
+    v = np.array(list(state.values.values()))
+    assert state.revisions == 50
+    assert (state.stats.mean, state.stats.std) == pytest.approx((v.mean(), v.std(ddof=1)), rel=1e-12)
+
+
+def test_restart_judges_backlog(tmp_path, limits):
+    sheet = synthetic.inspection_frame(1200, 6, seed=1)
+    source, limit_source, out = tmp_path / "data.csv", tmp_path / "limit.csv", tmp_path / "alerts.jsonl"
+    synthetic.write(limit_source, synthetic.limit_frame(6))
+    source.write_bytes(sheet.iloc[:800].to_csv(index=False).rstrip("\n").encode())
+    monitor.run(str(source), str(limit_source), str(tmp_path / "snap"), out=str(out), once=True)
+    assert not out.exists()
+    # rows appended while the monitor was down are judged on the next start
+    source.write_bytes(source.read_bytes() + b"\n" + sheet.iloc[800:].to_csv(index=False, header=False).rstrip("\n").encode())
+    m = monitor.run(str(source), str(limit_source), str(tmp_path / "snap"), out=str(out), once=True)
+    rows = ingest.normalize_data(sheet.copy())
+    want = OnlineMonitor(limits)
+    want.warm_up(rows.iloc[:800])
+    alerts = want.feed(rows.iloc[800:])
+    assert alerts and [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()] == alerts
+    assert m.reported == want.reported
+    assert {"monitor.meta.json", "monitor_limit.meta.json"} <= {p.name for p in (tmp_path / "snap").iterdir()}
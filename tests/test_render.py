@@ -0,0 +1,59 @@
+import io
+
+import matplotlib.pyplot as plt
+from PIL import Image
+
+from spc.render import FigureCache
+
+
+def figure():
+    fig, ax = plt.subplots(figsize=(8, 3))
+    ax.plot([1, 3, 2])
+    return fig
+
+
+def width(png):
+    return Image.open(io.BytesIO(png)).width
+
+
+def test_chart_renders_once_and_closes_figures():
+    cache, built = FigureCache(), []
+
+    def build():
+        built.append(1)
+        return figure()
+
+    png = cache.chart("k", build, dpi=50)
+    assert png.startswith(b"\x89PNG") and not plt.get_fignums()
+    assert cache.chart("k", build, dpi=50) is png and len(built) == 1
+    # another format or dpi is another render
+    assert cache.chart("k", build, fmt="svg", dpi=50).lstrip().startswith(b"<?xml") and len(built) == 2
+
+
+def test_scaled_copy_derives_from_full_render():
+    cache, built = FigureCache(), []
+
+    def build():
+        built.append(1)
+        return figure()
+
+    full = cache.chart("k", build, dpi=50)
+    small = cache.chart("k", build, dpi=50, max_width=200)
+    assert width(small) == 200 < width(full) and len(built) == 1
+    assert cache.chart("k", build, dpi=50, max_width=10**4) is full
+
+
+def test_nothing_to_draw_is_cached():
+    cache, built = FigureCache(), []
+    for _ in range(2):
+        assert cache.chart("empty", lambda: built.append(1)) is None
+        assert cache.chart("empty", lambda: built.append(1), max_width=100) is None
+    assert len(built) == 1
+
+
+def test_capped_by_bytes():
+    png = FigureCache().chart("k", figure, dpi=50)
+    cache = FigureCache(max_bytes=int(len(png) * 2.5))
+    for k in range(4):
+        cache.chart(k, figure, dpi=50)
+    assert len(cache) == 2 and cache.size <= cache.max_bytes
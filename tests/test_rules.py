@@ -0,0 +1,107 @@
+import numpy as np
+
+import baseline
+from spc.aggregate import BATCH_COL, COLOR_COL, FACTORS, ORDER_COL
+from spc.rules import ALL_RULES, cube_rule_masks, describe, detect_out_of_control, flag_out_of_control, nelson_rules, run_lengths
+
+
+def nelson_loop(x, center, sigma):
+    """Rule r of point i fires when the pattern ending at i is complete (textbook loops)."""
+    z = (x - center) / sigma
+    d = np.r_[np.nan, np.diff(x)]
+    masks = np.zeros(len(x), dtype=np.uint8)
+    for i in range(len(x)):
+        w = lambda n: z[i - n + 1:i + 1] if i >= n - 1 else None
+        fired = {
+            1: abs(z[i]) > 3,
+            2: w(9) is not None and ((w(9) > 0).all() or (w(9) < 0).all()),
+            3: i >= 5 and ((d[i - 4:i + 1] > 0).all() or (d[i - 4:i + 1] < 0).all()),
+            4: i >= 13 and all(d[j] * d[j - 1] < 0 for j in range(i - 11, i + 1)),
+            5: w(3) is not None and ((z[i] > 2 and (w(3) > 2).sum() >= 2) or (z[i] < -2 and (w(3) < -2).sum() >= 2)),
+            6: w(5) is not None and ((z[i] > 1 and (w(5) > 1).sum() >= 4) or (z[i] < -1 and (w(5) < -1).sum() >= 4)),
+            7: w(15) is not None and (np.abs(w(15)) < 1).all(),
+            8: w(8) is not None and (np.abs(w(8)) > 1).all() and (w(8) > 1).any() and (w(8) < -1).any(),
+        }
+        for r, hit in fired.items():
+            if hit:
+                masks[i] |= 1 << (r - 1)
+    return masks
+
+
+def patterned_series(seed=0):
+    """Noise with every Nelson pattern planted in it."""
+    rng = np.random.default_rng(seed)
+    parts = [
+        rng.normal(0, 1, 30), [4.5],                     # 1
+        np.full(10, 0.4),                                # 2
+        np.linspace(-1, 1, 7),                           # 3
+        np.tile([-0.5, 0.5], 8),                         # 4
+        [2.5, 0.1, 2.6],                                 # 5
+        [1.5, 1.4, 0.2, 1.6, 1.3],                       # 6
+        rng.uniform(-0.3, 0.3, 16),                      # 7
+        np.tile([1.8, -1.8], 5),                         # 8
+        rng.normal(0, 1, 30),
+    ]
+    return np.concatenate([np.asarray(p, dtype=float) for p in parts])
+
+
+def test_nelson_matches_loops():
+    x = patterned_series()
+    got = nelson_rules(x, center=0.0, sigma=1.0)
+    np.testing.assert_array_equal(got, nelson_loop(x, 0.0, 1.0))
+    assert {r for r in ALL_RULES if (got & (1 << (r - 1))).any()} == set(ALL_RULES)
+
+
+def test_nelson_groups_do_not_bleed():
+    a, b = patterned_series(1), patterned_series(2)[:40]
+    groups = np.r_[np.zeros(len(a), int), np.ones(len(b), int)]
+    got = nelson_rules(np.r_[a, b], groups)
+    np.testing.assert_array_equal(got[:len(a)], nelson_loop(a, a.mean(), a.std(ddof=1)))
+    np.testing.assert_array_equal(got[len(a):], nelson_loop(b, b.mean(), b.std(ddof=1)))
+
+
+def test_run_lengths():
+    cond = np.array([1, 1, 0, 1, 1, 1, 1, 0], dtype=bool)
+    np.testing.assert_array_equal(run_lengths(cond), [1, 2, 0, 1, 2, 3, 4, 0])
+    np.testing.assert_array_equal(run_lengths(cond, [0, 0, 0, 0, 1, 1, 1, 1]), [1, 2, 0, 1, 1, 2, 3, 0])
+
+
+def test_describe():
+    assert describe(0) == ""
+    assert describe(0b10001) == "1, 5"
+
+
+def test_out_of_control_keeps_original_rules(cube, limits, colors):
+    for c in colors:
+        series = cube.series(c)
+        for f in FACTORS:
+            lcl, ucl = limits.get(c, "LINE", f)
+            part = series[f]["line"]
+            flagged = flag_out_of_control(part, lcl, ucl)
+            ref = baseline.detect_out_of_control(part, lcl, ucl)
+            original = flagged["Rule_CL"] | flagged["Rule_3Sigma"]
+            assert list(flagged.index[original]) == list(ref.index)
+            assert (flagged.loc[ref.index, ["Rule_CL", "Rule_3Sigma"]] == ref[["Rule_CL", "Rule_3Sigma"]]).all().all()
+            # the Nelson rules only add rows
+            extra = detect_out_of_control(part, lcl, ucl)
+            assert set(ref.index) <= set(extra.index)
+            assert (extra.loc[~extra.index.isin(ref.index), "Nelson"] > 0).all()
+
+
+def test_cube_masks_match_per_series(cube, colors):
+    long = cube_rule_masks(cube)
+    for (c, src, f), part in long.groupby([COLOR_COL, "Source", "Factor"], observed=True):
+        series = cube.series(c)[f][src.lower()]
+        assert list(part[ORDER_COL]) == list(series[ORDER_COL])
+        np.testing.assert_array_equal(part["Rules"].to_numpy(), nelson_rules(series["value"].to_numpy()))
+
+
+def test_cube_masks_keep_judges_phase2_only(cube, limits, colors):
+    control = {c: limits.control_batch(c) for c in colors}
+    keep = cube.phase2_mask(control)
+    long = cube_rule_masks(cube, keep=keep)
+    assert (long.loc[~long["Keep"], "Rules"] == 0).all()
+    for (c, src, f), part in long[long["Keep"]].groupby([COLOR_COL, "Source", "Factor"], observed=True):
+        series = cube.series(c, phase2_from=control[c])[f][src.lower()]
+        assert list(part[BATCH_COL].astype(str)) == list(series[BATCH_COL].astype(str))
+        np.testing.assert_array_equal(part["Rules"].to_numpy(), nelson_rules(series["value"].to_numpy()))
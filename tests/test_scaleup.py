@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import baseline
+from spc.aggregate import BATCH_COL, COLOR_COL, FACTORS, BatchCube
+from spc.scaleup import MIN_PAIRS, MIN_PI_DF, ScaleUpModels, t_quantile
+
+# two-sided 95 % / 99 % points of Student's t (printed tables)
+T_975 = {1: 12.706205, 2: 4.302653, 3: 3.182446, 4: 2.776445, 5: 2.570582, 8: 2.306004, 10: 2.228139, 30: 2.042272}
+T_995 = {1: 63.656741, 2: 9.924843, 3: 5.840909, 4: 4.604095, 5: 4.032143, 10: 3.169273, 30: 2.749996}
+
+
+@pytest.mark.parametrize("p, table", [(0.975, T_975), (0.995, T_995)])
+def test_t_quantile(p, table):
+    for df, want in table.items():
+        got = float(t_quantile(p, df))
+        # closed forms for df 1, 2 and 4; the series reads up to 0.8 % low at df = 3
+        tol = 1e-6 if df in (1, 2, 4) else 1e-2 if df == 3 else 1e-3
+        assert got == pytest.approx(want, rel=tol)
+        assert float(t_quantile(1 - p, df)) == pytest.approx(-got)
+    assert np.isnan(t_quantile(p, 0))
+
+
+@pytest.fixture(scope="module")
+def models(cube):
+    return ScaleUpModels.from_cube(cube)
+
+
+def test_models_match_original_view(plain_rows, models, colors):
+    for c in colors:
+        ref = baseline.scale_up(plain_rows[plain_rows[COLOR_COL] == c])
+        for f in FACTORS:
+            m = models.get(c, f)
+            n, bias, bias_sd, slope, intercept, r2 = ref[f]
+            assert m["n"] == n
+            np.testing.assert_allclose([m["bias"], m["bias_sd"], m["slope"], m["intercept"], m["r2"]], [bias, bias_sd, slope, intercept, r2], rtol=1e-9, atol=1e-12)
+
+
+def test_prediction_interval(models, colors):
+    c, f = colors[0], FACTORS[0]
+    x, y = models.color_points(c, f)
+    n = len(x)
+    slope, intercept = np.polyfit(x, y, 1)
+    s = np.sqrt(np.sum((y - slope * x - intercept) ** 2) / (n - 2))
+    lab = np.array([x.min(), x.mean(), x.max() + 0.2])
+    half = t_quantile(0.975, n - 2) * s * np.sqrt(1 + 1 / n + (lab - x.mean()) ** 2 / np.sum((x - x.mean()) ** 2))
+    pred, lo, hi = models.predict(c, f, lab)
+    np.testing.assert_allclose(pred, slope * lab + intercept, rtol=1e-9)
+    np.testing.assert_allclose([lo, hi], [pred - half, pred + half], rtol=1e-9)
+    assert models.get(c, f)["resid_sd"] == pytest.approx(s)
+
+
+def test_small_models(rows):
+    c = rows[COLOR_COL].iloc[0]
+    part = rows[rows[COLOR_COL] == c].dropna()
+    codes = part[BATCH_COL].unique()
+    for n_batches in (MIN_PAIRS - 1, MIN_PAIRS, MIN_PI_DF + 1, MIN_PI_DF + 2):
+        models = ScaleUpModels.from_cube(BatchCube.from_rows(part[part[BATCH_COL].isin(codes[:n_batches])]))
+        m = models.get(c, "ΔL")
+        if n_batches < MIN_PAIRS:
+            assert m is None and models.predict(c, "ΔL", 0.1) is None
+            continue
+        _, lo, hi = models.predict(c, "ΔL", 0.1)
+        pi = models.offsets()["PI ± (95%, at mean LAB)"].iat[0]
+        # no interval below MIN_PI_DF residual degrees of freedom
+        assert np.isnan(lo) == np.isnan(hi) == np.isnan(pi) == (n_batches - 2 < MIN_PI_DF)
+
+
+def test_offsets_table(models):
+    table = models.offsets()
+    assert len(table) == len(models.models)
+    np.testing.assert_allclose(table["Suggested LAB Offset"], -table["Bias (Line − Lab)"])
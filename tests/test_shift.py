@@ -0,0 +1,90 @@
+import numpy as np
+
+from spc.shift import CusumState, EwmaState, baseline, cusum, ewma
+
+
+def shifted(n=120, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(0, 1, n)
+    x[n // 2:] += 0.8  # the small sustained shift the charts are for
+    x[[5, 70]] = np.nan
+    return x
+
+
+def cusum_loop(x, target, sigma, k, h):
+    cp = cm = 0.0
+    out = []
+    for v in x:
+        if np.isnan(v):
+            out.append((np.nan, np.nan, False))
+            continue
+        z = (v - target) / sigma
+        cp, cm = max(0.0, cp + z - k), max(0.0, cm - z - k)
+        out.append((cp, cm, cp > h or cm > h))
+    return [np.array(c) for c in zip(*out)]
+
+
+def ewma_loop(x, target, sigma, lam, L):
+    z, n, out = target, 0, []
+    for v in x:
+        if np.isnan(v):
+            out.append((np.nan, np.nan, np.nan, False))
+            continue
+        z, n = lam * v + (1 - lam) * z, n + 1
+        w = L * sigma * np.sqrt(lam / (2 - lam) * (1 - (1 - lam) ** (2 * n)))
+        out.append((z, target - w, target + w, abs(z - target) > w))
+    return [np.array(c) for c in zip(*out)]
+
+
+def test_cusum_matches_recursion():
+    x = shifted()
+    for k, h in ((0.5, 5.0), (0.25, 4.0)):
+        *got, state = cusum(x, 0.1, 1.2, k, h)
+        for g, w in zip(got, cusum_loop(x, 0.1, 1.2, k, h)):
+            np.testing.assert_allclose(g, w, atol=1e-12)
+        assert got[2].any()
+        assert state.n == np.count_nonzero(~np.isnan(x))
+
+
+def test_ewma_matches_recursion():
+    x = shifted(300)  # longer than several blocks
+    for lam in (0.05, 0.2, 1.0):
+        *got, state = ewma(x, 0.1, 1.2, lam, 3.0)
+        for g, w in zip(got, ewma_loop(x, 0.1, 1.2, lam, 3.0)):
+            np.testing.assert_allclose(g, w, rtol=1e-9, atol=1e-12)
+        assert state.n == np.count_nonzero(~np.isnan(x))
+
+
+def test_continuation_equals_whole_series():
+    x = shifted()
+    c_whole, e_whole = cusum(x, 0, 1), ewma(x, 0, 1)
+    c_head, e_head = cusum(x[:50], 0, 1), ewma(x[:50], 0, 1)
+    c_tail, e_tail = cusum(x[50:], 0, 1, state=c_head[-1]), ewma(x[50:], 0, 1, state=e_head[-1])
+    for whole, head, tail in ((c_whole, c_head, c_tail), (e_whole, e_head, e_tail)):
+        for w, a, b in zip(whole[:-1], head[:-1], tail[:-1]):
+            np.testing.assert_allclose(w, np.r_[a, b], atol=1e-12)
+        assert whole[-1].n == tail[-1].n
+        np.testing.assert_allclose(list(vars(whole[-1]).values()), list(vars(tail[-1]).values()), atol=1e-12)
+
+
+def test_states_step_like_the_vector_forms():
+    x = shifted()[:40]
+    cs, es = CusumState(), EwmaState()
+    c_plus, _, c_sig, _ = cusum(x, 0, 1)
+    z, _, _, e_sig, _ = ewma(x, 0, 1)
+    for i, v in enumerate(x):
+        if np.isnan(v):
+            continue
+        assert cs.update(v, 0, 1) == c_sig[i]
+        assert np.isclose(cs.c_plus, c_plus[i])
+        ez, _, _, sig = es.update(v, 0, 1)
+        assert np.isclose(ez, z[i]) and sig == e_sig[i]
+
+
+def test_baseline_prefers_phase1():
+    x = np.r_[np.zeros(5), np.ones(5) * 4, np.nan]
+    p2 = np.r_[np.zeros(5, bool), np.ones(6, bool)]
+    assert baseline(x, p2) == (0.0, 0.0)
+    mean, std = baseline(x)
+    assert mean == 2.0 and np.isclose(std, np.nanstd(x, ddof=1))
+    assert baseline([1.0]) == (None, None)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import baseline
+from spc.aggregate import BATCH_COL, COLOR_COL
+from spc.thickness import COIL_COL, CoilCorrelation, factor_columns, level, phase2_positions
+
+
+@pytest.fixture(scope="module")
+def corr(rows, index, limits, colors):
+    return CoilCorrelation.from_rows(rows.iloc[phase2_positions(index, limits, colors)], limits)
+
+
+def test_fits_match_original_phase2_view(plain_rows, cube, limits, corr, colors):
+    checked = 0
+    for c in colors:
+        df_c = plain_rows[plain_rows[COLOR_COL] == c]
+        cb_code = baseline.get_control_batch_code(df_c, limits.control_batch(c))
+        if cb_code is None:
+            assert all(corr.get(c, f) is None for f in corr.factors)
+            continue
+        df_p2 = df_c[df_c[BATCH_COL] >= cb_code]
+        for f, col in factor_columns(plain_rows.columns).items():
+            coil_df, ooc, slope, intercept, r, r2 = baseline.thickness_correlation(df_p2, col, *limits.get(c, "LINE", f))
+            s = corr.get(c, f)
+            assert s["n"] == len(coil_df) and s["n_ooc"] == ooc.sum()
+            np.testing.assert_allclose([s["slope"], s["intercept"], s["r"], s["r2"]], [slope, intercept, r, r2], rtol=1e-7, atol=1e-12)
+            frame, mask = corr.coil_frame(c, f)
+            assert sorted(frame[COIL_COL].astype(str)) == sorted(coil_df[COIL_COL])
+            assert sorted(frame.loc[mask, COIL_COL].astype(str)) == sorted(coil_df.loc[ooc, COIL_COL])
+            checked += 1
+    assert checked
+
+
+def test_ooc_risk_zone(corr):
+    s = corr.stats.dropna(subset=["ooc_thickness"])
+    assert len(s)
+    high, low = s["ooc_thickness"] > s["normal_q3"], s["ooc_thickness"] < s["normal_q1"]
+    assert list(s["risk"]) == ["HIGH" if h else "LOW" if lo else None for h, lo in zip(high, low)]
+
+
+def test_ranking_takes_best_factor(corr):
+    table = corr.ranking()
+    stats = corr.stats.dropna(subset=["r2"])
+    best = stats.groupby(level=0, observed=True)["r2"].max()
+    assert len(table) == len(best)
+    assert list(table["R²"]) == sorted(best, reverse=True)
+
+
+def test_level():
+    assert [level(v) for v in (0.6, 0.59, 0.3, 0.29)] == ["Strong", "Moderate", "Moderate", "Weak"]
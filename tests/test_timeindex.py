@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline
+from spc.aggregate import COLOR_COL
+from spc.timeindex import TimeIndex
+
+
+@pytest.fixture(scope="module")
+def undated(rows):
+    """rows with some Times missing."""
+    df = rows.copy()
+    df.loc[np.random.default_rng(4).random(len(df)) < 0.05, "Time"] = pd.NaT
+    return df
+
+
+@pytest.fixture(scope="module")
+def tindex(undated):
+    return TimeIndex.from_rows(undated)
+
+
+def in_time_order(df, pos):
+    t = df["Time"].iloc[pos]
+    dated = t.notna().to_numpy()
+    return t[dated].is_monotonic_increasing and not (np.diff(dated.astype(int)) > 0).any()
+
+
+def test_select_matches_original_filter(undated, tindex, colors):
+    for c in colors:
+        years, months = tindex.years(c), tindex.months(c)
+        _, all_years, all_months = baseline.color_filter(undated, c, [], [])
+        assert (years, months) == (all_years, all_months)
+        for ys, ms in (([], []), (years[:1], []), ([], months[::3]), (years, months[1::2]), ([years[-1]], [months[0], months[-1]]), ([1999], [])):
+            want, _, _ = baseline.color_filter(undated, c, ys, ms)
+            pos = tindex.select(c, ys, ms)
+            assert sorted(pos) == list(want.index), (c, ys, ms)
+            assert in_time_order(undated, pos)
+
+
+def test_select_periods(undated, tindex, colors):
+    c = colors[1]
+    periods = tindex.periods(c)[::4]
+    t = undated["Time"]
+    want = undated.index[(undated[COLOR_COL] == c) & pd.Series(list(zip(t.dt.year, t.dt.month)), index=undated.index).isin(periods)]
+    assert sorted(tindex.select(c, periods=periods)) == list(want)
+    assert len(tindex.select("no such color")) == 0
+
+
+def test_between_and_latest(undated, tindex, colors):
+    for c in colors:
+        t = undated["Time"]
+        color = undated[COLOR_COL] == c
+        assert tindex.latest(c) == t[color].max()
+        start, end = pd.Timestamp("2024-06-01"), pd.Timestamp("2025-01-15")
+        for lo, hi in ((start, end), (None, end), (start, None), (end, start)):
+            pos = tindex.between(c, lo, hi)
+            keep = color & t.notna()
+            if lo is not None:
+                keep &= t >= lo
+            if hi is not None:
+                keep &= t < hi
+            assert sorted(pos) == list(undated.index[keep])
+            assert in_time_order(undated, pos)
+    assert pd.isna(TimeIndex.from_rows(undated.assign(Time=pd.NaT)).latest(colors[0]))